@@ -0,0 +1,526 @@
+"""
+লোড-টেস্ট/বেঞ্চমার্ক: আসল টেলিগ্রাম, জেমিনি বা Render-এর ডাটাবেস ছাড়াই পুরো পাইপলাইন চালায়।
+
+handle_text -> process_buffered_text -> পোস্টিং পর্যন্ত N জন সিমুলেটেড ইউজার একসাথে চালানো হয়:
+  * একটি লোকাল ফেক Bot API সার্ভার (কনফিগারযোগ্য লেটেন্সি এবং 429 RetryAfter)
+  * একটি ফেক জেমিনি মডেল (নির্দিষ্ট দেরিতে তৈরি JSON ফেরত দেয়, স্ট্রিমিং সহ)
+  * ডাটাবেস: BENCH_DATABASE_URL দিলে সেই (থ্রোঅ্যাওয়ে) Postgres, না দিলে মেমোরির ভেতরের স্ট্যান্ড-ইন
+
+উদাহরণ:
+    python bench.py --users 20 --questions 10 --model-delay 1.5 --api-latency 0.05 --rate-limit 0.02
+    python bench.py --users 50 --text local --json bench_output.txt
+
+ফলাফল: messages/sec, time-to-first-poll (p50/p95/p99) এবং ইভেন্ট লুপ স্টল টাইম।
+একই অপশনে আগের ও পরের রানের --json আউটপুট মিলিয়ে পারফরম্যান্স পরিবর্তন তুলনা করা যায়।
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+import telegram
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
+
+import poll_bot
+
+BENCH_TOKEN = "123456:BENCH"
+_message_ids = itertools.count(1)
+
+
+# --- ফেক Bot API সার্ভার ---
+class FakeBotAPI:
+    """poll_bot-এর BotHTTPServer-এর উপর টেলিগ্রামের দরকারি মেথডগুলোর নকল।"""
+
+    def __init__(self, latency: float, rate_limit: float, retry_after: int, seed: int):
+        self.latency = latency
+        self.rate_limit = rate_limit # চ্যানেলে পাঠানো প্রতিটি কলে 429 পাওয়ার সম্ভাবনা
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.server = poll_bot.BotHTTPServer()
+        self.calls: dict[str, int] = {}
+        self.rate_limited = 0
+        self.polls_by_chat: dict[str, int] = {}
+        self.first_poll_at: dict[str, float] = {}
+        self.last_poll_at: dict[str, float] = {}
+        self.user_messages: dict[int, list[str]] = {}
+        self._changed = asyncio.Condition()
+        for method in ("getMe", "sendMessage", "sendPoll", "editMessageText", "deleteWebhook"):
+            self.server.add_route("POST", f"/bot{BENCH_TOKEN}/{method}", self._make_handler(method))
+
+    async def start(self, port: int):
+        await self.server.start("127.0.0.1", port)
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def wait_for(self, predicate, timeout: float) -> bool:
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(predicate), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def _make_handler(self, method: str):
+        async def handler(request):
+            params = {}
+            for key, values in parse_qs(request.body.decode("utf-8"), keep_blank_values=True).items():
+                try:
+                    params[key] = json.loads(values[0])
+                except ValueError:
+                    params[key] = values[0]
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            # ডিসপ্যাচারের RetryAfter হ্যান্ডলিং মাপতে শুধু চ্যানেলে পাঠানো মেসেজে 429 দেওয়া হয়
+            if isinstance(params.get("chat_id"), str) and self.random.random() < self.rate_limit:
+                self.rate_limited += 1
+                return self._reply(429, {
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                })
+            result = await self._result(method, params)
+            return self._reply(200, {"ok": True, "result": result})
+        return handler
+
+    def _reply(self, status: int, payload: dict):
+        return status, "application/json", json.dumps(payload).encode("utf-8")
+
+    async def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "deleteWebhook":
+            return True
+        chat = params.get("chat_id")
+        async with self._changed:
+            if method == "sendPoll":
+                now = time.perf_counter()
+                key = str(chat)
+                self.polls_by_chat[key] = self.polls_by_chat.get(key, 0) + 1
+                self.first_poll_at.setdefault(key, now)
+                self.last_poll_at[key] = now
+            elif method == "sendMessage" and isinstance(chat, int):
+                self.user_messages.setdefault(chat, []).append(params.get("text", ""))
+            self._changed.notify_all()
+        chat_id = chat if isinstance(chat, int) else -1000000000000 - abs(hash(chat)) % 10**9
+        return {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if isinstance(chat, int) else "channel"},
+            "text": params.get("text", params.get("question", "")),
+        }
+
+
+# --- ফেক জেমিনি মডেল ---
+class _FakePart:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [text]
+
+class FakeModel:
+    """generate_content-এর নকল: দেরি করে তৈরি JSON দেয়; stream=True হলে কয়েকটি টুকরোয় ভাগ করে দেয়।"""
+
+    def __init__(self, delay: float, questions: int, stream_chunks: int = 5):
+        self.delay = delay
+        self.questions = questions
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _questions(self, marker) -> list[dict]:
+        return [
+            {
+                "question": f"বেঞ্চমার্ক প্রশ্ন {marker}-{i}?",
+                "options": ["ক", "খ", "গ", "ঘ"],
+                "correct_option_index": i % 4,
+                "explanation": "বেঞ্চমার্ক ব্যাখ্যা",
+                "suffix": None,
+            }
+            for i in range(self.questions)
+        ]
+
+    def _payload(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+        marker = abs(hash(prompt)) % 10**6
+        sections = re.findall(r"=== অংশ (\d+) শুরু ===", prompt)
+        if sections: # ব্যাচ প্রম্পট: প্রতিটি অংশের জন্য আলাদা লিস্ট
+            return json.dumps({n: self._questions(f"{marker}.{n}") for n in sections}, ensure_ascii=False)
+        return json.dumps(self._questions(marker), ensure_ascii=False)
+
+    def generate_content(self, prompt, stream: bool = False):
+        payload = self._payload(prompt)
+        if not stream:
+            time.sleep(self.delay)
+            return _FakePart(payload)
+        return self._stream(payload)
+
+    def _stream(self, payload: str):
+        size = max(1, len(payload) // self.stream_chunks + 1)
+        for start in range(0, len(payload), size):
+            time.sleep(self.delay / self.stream_chunks)
+            yield _FakePart(payload[start:start + size])
+
+
+# --- মেমোরির ভেতরের ডাটাবেস স্ট্যান্ড-ইন ---
+class InMemoryDB:
+    """poll_bot-এর *_db হেল্পারগুলোর জায়গায় বসে; প্রতিটি কলে latency সেকেন্ড দেরি করে (থ্রেডে)।"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.channels: dict[int, list[str]] = {}
+        self.jobs: dict[int, dict] = {}
+        self.ai_cache: dict[str, list] = {}
+        self.library_questions: dict[str, dict] = {}
+        self.library_quizzes: dict[int, dict] = {}
+        self._job_ids = itertools.count(1)
+        self._quiz_ids = itertools.count(1)
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def install(self):
+        helpers = {
+            "get_target_channels_from_db": self.get_target_channels,
+            "save_target_channels_to_db": self.save_target_channels,
+            "save_posting_job_to_db": self.save_posting_job,
+            "update_posting_job_item_in_db": self.update_item,
+            "update_posting_job_status_in_db": self.update_status,
+            "get_ai_cache_from_db": self.get_ai_cache,
+            "save_ai_cache_to_db": self.save_ai_cache,
+            "save_quiz_to_library_db": self.save_library_quiz,
+            "get_library_quizzes_from_db": self.get_library_quizzes,
+            "load_library_quiz_from_db": self.load_library_quiz,
+            "mark_library_quiz_posted_in_db": self.mark_library_quiz_posted,
+        }
+        for name, func in helpers.items():
+            setattr(poll_bot, name, poll_bot.timed_db(func))
+
+    def get_target_channels(self, user_id):
+        self._wait()
+        with self.lock:
+            return list(self.channels.get(user_id, []))
+
+    def save_target_channels(self, user_id, channels):
+        self._wait()
+        with self.lock:
+            self.channels[user_id] = list(channels)
+        return True
+
+    def save_posting_job(self, job):
+        self._wait()
+        with self.lock:
+            job_id = next(self._job_ids)
+            self.jobs[job_id] = {"status": job["status"], "items": {item["position"]: item["status"] for item in job["items"]}}
+        return job_id
+
+    def update_item(self, job_id, position, status, error=None):
+        self._wait()
+        with self.lock:
+            self.jobs[job_id]["items"][position] = status
+
+    def update_status(self, job_id, status):
+        self._wait()
+        with self.lock:
+            self.jobs[job_id]["status"] = status
+
+    def get_ai_cache(self, cache_key):
+        self._wait()
+        with self.lock:
+            return self.ai_cache.get(cache_key)
+
+    def save_ai_cache(self, cache_key, questions):
+        self._wait()
+        with self.lock:
+            self.ai_cache[cache_key] = questions
+
+    def save_library_quiz(self, user_id, intro_text, questions):
+        self._wait()
+        hashes = [poll_bot.question_content_hash(question) for question in questions]
+        with self.lock:
+            for question_hash, question in zip(hashes, questions):
+                self.library_questions.setdefault(question_hash, question)
+            for quiz_id, quiz in self.library_quizzes.items():
+                if quiz["user_id"] == user_id and quiz["question_hashes"] == hashes:
+                    quiz.update(intro_text=intro_text, post_count=quiz["post_count"] + 1, last_posted_at=datetime.datetime.now())
+                    return quiz_id
+            quiz_id = next(self._quiz_ids)
+            self.library_quizzes[quiz_id] = {
+                "user_id": user_id, "intro_text": intro_text, "question_hashes": hashes,
+                "post_count": 1, "last_posted_at": datetime.datetime.now(),
+            }
+            return quiz_id
+
+    def get_library_quizzes(self, user_id, query=None, limit=10):
+        self._wait()
+        with self.lock:
+            quizzes = [
+                {"quiz_id": quiz_id, "intro_text": quiz["intro_text"], "questions": len(quiz["question_hashes"]),
+                 "post_count": quiz["post_count"], "last_posted_at": quiz["last_posted_at"]}
+                for quiz_id, quiz in self.library_quizzes.items()
+                if quiz["user_id"] == user_id and (not query or query.casefold() in quiz["intro_text"].casefold() or any(
+                    query.casefold() in self.library_questions[question_hash]["question"].casefold()
+                    for question_hash in quiz["question_hashes"]
+                ))
+            ]
+        return sorted(quizzes, key=lambda quiz: quiz["last_posted_at"], reverse=True)[:limit]
+
+    def load_library_quiz(self, user_id, quiz_id):
+        self._wait()
+        with self.lock:
+            quiz = self.library_quizzes.get(quiz_id)
+            if quiz is None or quiz["user_id"] != user_id:
+                return None
+            return quiz["intro_text"], [self.library_questions[question_hash] for question_hash in quiz["question_hashes"]]
+
+    def mark_library_quiz_posted(self, quiz_id):
+        self._wait()
+        with self.lock:
+            quiz = self.library_quizzes[quiz_id]
+            quiz.update(post_count=quiz["post_count"] + 1, last_posted_at=datetime.datetime.now())
+
+
+# --- ইভেন্ট লুপ স্টল মনিটর ---
+class LoopStallMonitor:
+    """নির্দিষ্ট বিরতিতে জেগে উঠে দেখে কতটা দেরিতে জাগল; সেই দেরিই ইভেন্ট লুপ ব্লক থাকার সময়।"""
+
+    def __init__(self, interval: float = 0.01, threshold: float = 0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+
+    def report(self) -> dict:
+        stalls = [lag for lag in self.lags if lag > self.threshold]
+        return {
+            "stall_total_s": round(sum(stalls), 4),
+            "stall_max_ms": round(max(self.lags, default=0) * 1000, 2),
+            "lag_p99_ms": round(percentile(self.lags, 99) * 1000, 2),
+            "stall_count": len(stalls),
+        }
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+# --- সিমুলেটেড ইউজার ---
+def make_update(bot: telegram.Bot, user_id: int, text: str, update_id: int) -> telegram.Update:
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+    return telegram.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+            "entities": entities,
+        },
+    }, bot)
+
+def make_quiz_text(user_id: int, mode: str, questions: int) -> str:
+    if mode == "ai":
+        # লোকাল পার্সারে মেলে না এমন মুক্ত টেক্সট, তাই পুরোটা AI-তে যায়
+        return "\n".join(f"ইউজার {user_id} এর অনুচ্ছেদ {i}: বাংলাদেশের ইতিহাস সম্পর্কে কিছু তথ্য।" for i in range(questions))
+    blocks = []
+    for i in range(questions):
+        blocks.append(
+            f"{i + 1}. ইউজার {user_id} এর প্রশ্ন {i}?\n"
+            "(ক) এক\n(খ) দুই\n(গ) তিন\n(ঘ) চার\n"
+            f"সঠিক উত্তর: ({'কখগঘ'[i % 4]})\n"
+            "ব্যাখ্যা: বেঞ্চমার্ক"
+        )
+    return "\n\n".join(blocks)
+
+async def simulate_user(application: Application, api: FakeBotAPI, user_id: int, args, update_ids) -> dict:
+    channel = f"@bench_channel_{user_id}"
+    await application.process_update(make_update(application.bot, user_id, f"/setchannel {channel}", next(update_ids)))
+
+    # টেলিগ্রামের লম্বা মেসেজ ভাগ হওয়ার মতো, তবে লাইনের সীমানায় (বাফার এগুলো "\n" দিয়ে জোড়া লাগায়)
+    lines = make_quiz_text(user_id, args.text, args.questions).split("\n")
+    size = len(lines) // max(1, args.split) + 1
+    started = time.perf_counter()
+    for start in range(0, len(lines), size):
+        part = "\n".join(lines[start:start + size])
+        await application.process_update(make_update(application.bot, user_id, part, next(update_ids)))
+
+    def asked_for_intro():
+        return any("সূচনা বার্তা" in message for message in api.user_messages.get(user_id, []))
+    if not await api.wait_for(asked_for_intro, args.timeout):
+        return {"user_id": user_id, "ok": False, "error": "কুইজ তৈরি হয়নি (timeout)"}
+
+    await application.process_update(make_update(application.bot, user_id, f"বেঞ্চমার্ক কুইজ {user_id}", next(update_ids)))
+    if not await api.wait_for(lambda: api.polls_by_chat.get(channel, 0) >= args.questions, args.timeout):
+        return {"user_id": user_id, "ok": False, "error": f"{api.polls_by_chat.get(channel, 0)}/{args.questions} পোল পৌঁছেছে"}
+    return {
+        "user_id": user_id,
+        "ok": True,
+        "time_to_first_poll": api.first_poll_at[channel] - started,
+        "time_to_last_poll": api.last_poll_at[channel] - started,
+    }
+
+
+async def run_benchmark(args) -> dict:
+    poll_bot.TEXT_BUFFER_DELAY = args.buffer_delay
+    poll_bot.TEXT_BUFFER_MODE = args.buffer_mode
+    poll_bot.AI_STREAMING = not args.no_stream
+
+    db_url = os.environ.get("BENCH_DATABASE_URL")
+    if db_url:
+        os.environ["DATABASE_URL"] = db_url
+        poll_bot.init_db()
+        db_label = "postgres"
+    else:
+        InMemoryDB(args.db_latency).install()
+        db_label = "in-memory"
+
+    api = FakeBotAPI(args.api_latency, args.rate_limit, args.retry_after, args.seed)
+    await api.start(args.port)
+    application = (
+        Application.builder()
+        .token(BENCH_TOKEN)
+        .base_url(f"http://127.0.0.1:{args.port}/bot")
+        .updater(None)
+        .build()
+    )
+    model = FakeModel(args.model_delay, args.questions)
+    ai_pool = poll_bot.AIWorkerPool(args.ai_concurrency, max(poll_bot.AI_MAX_QUEUE, args.users * 2), poll_bot.AI_REQUEST_TIMEOUT)
+    application.bot_data['ai_model'] = model
+    application.bot_data['ai_pool'] = ai_pool
+    application.bot_data['ai_cache'] = poll_bot.AIResultCache(poll_bot.AI_CACHE_SIZE, poll_bot.AI_CACHE_TTL)
+    if args.batch_window > 0:
+        application.bot_data['ai_batcher'] = poll_bot.AIBatcher(args.batch_window, poll_bot.AI_BATCH_MAX_CHARS, poll_bot.AI_BATCH_MAX_ITEMS)
+    application.bot_data['poll_dispatcher'] = poll_bot.PollDispatcher(
+        args.chat_rate, poll_bot.DISPATCH_CHAT_BURST, args.global_rate, poll_bot.DISPATCH_GLOBAL_BURST, poll_bot.DISPATCH_MAX_RETRIES
+    )
+    application.add_handler(CommandHandler("setchannel", poll_bot.set_channel))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, poll_bot.handle_text))
+
+    monitor = LoopStallMonitor()
+    await application.initialize()
+    await application.start()
+    monitor.start()
+    update_ids = itertools.count(1)
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(
+            simulate_user(application, api, 10_000 + i, args, update_ids) for i in range(args.users)
+        ))
+    finally:
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+        await application.stop()
+        await application.shutdown()
+        await api.stop()
+        ai_pool.shutdown()
+
+    finished = [result for result in results if result["ok"]]
+    first_poll = [result["time_to_first_poll"] for result in finished]
+    outgoing = api.calls.get("sendMessage", 0) + api.calls.get("sendPoll", 0) + api.calls.get("editMessageText", 0)
+    return {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("json", "port")
+        } | {"db": db_label},
+        "elapsed_s": round(elapsed, 3),
+        "users_ok": len(finished),
+        "users_failed": len(results) - len(finished),
+        "errors": [result["error"] for result in results if not result["ok"]][:10],
+        "bot_api_calls": dict(api.calls),
+        "rate_limited": api.rate_limited,
+        "messages_per_s": round(outgoing / elapsed, 2) if elapsed else 0,
+        "polls_per_s": round(api.calls.get("sendPoll", 0) / elapsed, 2) if elapsed else 0,
+        "model_calls": model.calls,
+        "time_to_first_poll_s": {
+            "p50": round(percentile(first_poll, 50), 3),
+            "p95": round(percentile(first_poll, 95), 3),
+            "p99": round(percentile(first_poll, 99), 3),
+            "mean": round(statistics.fmean(first_poll), 3) if first_poll else 0,
+        },
+        "event_loop": monitor.report(),
+    }
+
+
+def print_report(report: dict):
+    print("\n--- বেঞ্চমার্ক ফলাফল ---")
+    print(f"ইউজার: {report['users_ok']} সফল, {report['users_failed']} ব্যর্থ | সময়: {report['elapsed_s']} সেকেন্ড | DB: {report['config']['db']}")
+    print(f"Bot API কল: {report['bot_api_calls']} (429: {report['rate_limited']}) | মডেল কল: {report['model_calls']}")
+    print(f"থ্রুপুট: {report['messages_per_s']} messages/sec, {report['polls_per_s']} polls/sec")
+    ttfp = report["time_to_first_poll_s"]
+    print(f"time-to-first-poll: p50 {ttfp['p50']}s | p95 {ttfp['p95']}s | p99 {ttfp['p99']}s | mean {ttfp['mean']}s")
+    loop = report["event_loop"]
+    print(f"ইভেন্ট লুপ স্টল: মোট {loop['stall_total_s']}s ({loop['stall_count']} বার) | সর্বোচ্চ {loop['stall_max_ms']}ms | p99 lag {loop['lag_p99_ms']}ms")
+    for error in report["errors"]:
+        print(f"⚠️ {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="poll_bot এর এন্ড-টু-এন্ড লোড টেস্ট (লোকাল ফেক সার্ভিস দিয়ে)")
+    parser.add_argument("--users", type=int, default=10, help="একসাথে কতজন সিমুলেটেড ইউজার")
+    parser.add_argument("--questions", type=int, default=10, help="প্রতি কুইজে প্রশ্ন সংখ্যা")
+    parser.add_argument("--text", choices=("ai", "local"), default="ai", help="ai: মুক্ত টেক্সট (AI পথ), local: MCQ ফরম্যাট (লোকাল পার্সার)")
+    parser.add_argument("--split", type=int, default=2, help="প্রতিটি টেক্সট কয়টি মেসেজে ভাগ করে পাঠানো হবে")
+    parser.add_argument("--buffer-mode", choices=("adaptive", "fixed"), default=poll_bot.TEXT_BUFFER_MODE, help="টেক্সট বাফারিং মোড")
+    parser.add_argument("--buffer-delay", type=float, default=poll_bot.TEXT_BUFFER_DELAY, help="টেক্সট বাফারের অপেক্ষা (সেকেন্ড)")
+    parser.add_argument("--model-delay", type=float, default=1.0, help="ফেক মডেলের রেসপন্স দেরি (সেকেন্ড)")
+    parser.add_argument("--no-stream", action="store_true", help="স্ট্রিমিং ছাড়া AI কল")
+    parser.add_argument("--ai-concurrency", type=int, default=poll_bot.AI_MAX_CONCURRENCY)
+    parser.add_argument("--batch-window", type=float, default=poll_bot.AI_BATCH_WINDOW, help="AI ব্যাচিং উইন্ডো (সেকেন্ড, ০ = বন্ধ)")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="ফেক Bot API এর প্রতিটি কলের লেটেন্সি (সেকেন্ড)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="চ্যানেলে পাঠানো প্রতিটি কলে 429 পাওয়ার সম্ভাবনা (০-১)")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 রেসপন্সে retry_after (সেকেন্ড)")
+    parser.add_argument("--chat-rate", type=float, default=poll_bot.DISPATCH_CHAT_RATE, help="প্রতি চ্যানেলে মেসেজ/সেকেন্ড")
+    parser.add_argument("--global-rate", type=float, default=poll_bot.DISPATCH_GLOBAL_RATE, help="সব চ্যানেল মিলিয়ে মেসেজ/সেকেন্ড")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="মেমোরি DB স্ট্যান্ড-ইনের প্রতিটি কলের দেরি (সেকেন্ড)")
+    parser.add_argument("--timeout", type=float, default=300, help="প্রতিটি ধাপে সর্বোচ্চ অপেক্ষা (সেকেন্ড)")
+    parser.add_argument("--port", type=int, default=8799, help="ফেক Bot API সার্ভারের পোর্ট")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="ফলাফল JSON হিসেবে এই ফাইলে লেখা হবে (রান-টু-রান তুলনার জন্য)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ ফলাফল '{args.json}' ফাইলে লেখা হয়েছে।")
+    return 0 if report["users_failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,186 +1,3146 @@
+import time
+STARTUP_T0 = time.perf_counter() # স্টার্টআপ টাইমিং রিপোর্টের শুরু (বাকি সব ইম্পোর্টের আগে)
 import telegram
+import telegram.error
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes,
+    BasePersistence,
+    BaseUpdateProcessor,
+    PersistenceInput,
+    TypeHandler,
 )
 from telegram.ext._jobqueue import Job
 from telegram.constants import ParseMode # <-- হেল্প/স্টার্ট ফরম্যাটিং এর জন্য
-import google.generativeai as genai
 import json
+import sys
+import csv
+import tempfile
+import itertools
+import hashlib
+import functools
+import collections
+import copy
+import importlib
+import unicodedata
+import re
 import asyncio
+import hmac
+import signal
+import concurrent.futures
+import contextlib
 import os
-import psycopg2
+import httpx
 from urllib.parse import urlparse
-from flask import Flask
 import threading
 import traceback # <-- নতুন ইম্পোর্ট (বিস্তারিত এরর দেখার জন্য)
 
+# --- নতুন: দ্রুত স্টার্টআপ (স্টার্টআপ টাইমিং ও লেজি ইম্পোর্ট) ---
+class StartupTimer:
+    """
+    প্রসেস শুরু (STARTUP_T0) থেকে প্রতিটি স্টার্টআপ ধাপ কখন শুরু ও শেষ হলো তা রাখে।
+    ব্যাকগ্রাউন্ড থ্রেড থেকেও ধাপ যোগ হয়; প্রথম আপডেট আসলে report() পুরো বিভাজন দেখায়।
+    """
+
+    def __init__(self, origin: float):
+        self.origin = origin
+        self.phases: list[tuple[str, float, float]] = [] # (নাম, শুরু, শেষ), origin থেকে সেকেন্ডে
+        self.marks: dict[str, float] = {}
+        self.first_update_at: float | None = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, started: float, finished: float):
+        with self._lock:
+            self.phases.append((name, started - self.origin, finished - self.origin))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter())
+
+    def mark(self, name: str) -> float:
+        """একটি মুহূর্ত (যেমন পোলিং শুরু) রেকর্ড করে; origin থেকে কত সেকেন্ড পরে তা দেয়।"""
+        now = time.perf_counter()
+        with self._lock:
+            self.marks[name] = now
+        return now - self.origin
+
+    def first_update(self) -> bool:
+        """প্রথম আপডেটের সময় রাখে; শুধু প্রথমবার True দেয়।"""
+        if self.first_update_at is not None:
+            return False
+        with self._lock:
+            if self.first_update_at is not None:
+                return False
+            self.first_update_at = time.perf_counter() - self.origin
+            return True
+
+    def report(self) -> str:
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+            marks = sorted((at - self.origin, name) for name, at in self.marks.items())
+        lines = [f"⏱️ স্টার্টআপ রিপোর্ট (প্রথম আপডেট {self.first_update_at:.2f}s-এ):"]
+        for name, started, finished in phases:
+            lines.append(f"   • {name}: {started:6.2f}s → {finished:6.2f}s ({finished - started:.2f}s)")
+        for at, name in marks:
+            lines.append(f"   • {name}: {at:6.2f}s")
+        return "\n".join(lines)
+
+STARTUP = StartupTimer(STARTUP_T0)
+
+class LazyModule:
+    """
+    ভারী মডিউল প্রথম অ্যাট্রিবিউট ব্যবহারের সময় ইম্পোর্ট করে, যাতে বট চালু হতে (বিশেষ করে Render-এর
+    ফ্রি প্ল্যানে ঘুম থেকে জাগার সময়) এর জন্য অপেক্ষা করতে না হয়। submodules: প্যাকেজের যে সাবমডিউলগুলো
+    অ্যাট্রিবিউট হিসেবে ব্যবহার হয় (যেমন psycopg2.pool), সেগুলোও একসাথে ইম্পোর্ট হয়।
+    """
+
+    def __init__(self, name: str, *submodules: str):
+        self._name = name
+        self._submodules = submodules
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name) # ইম্পোর্ট থ্রেড-সেফ; একসাথে দুই থ্রেড ডাকলে একটি অপেক্ষা করে
+            for submodule in self._submodules:
+                importlib.import_module(submodule)
+            if self._module is None:
+                STARTUP.record(f"import {self._name}", started, time.perf_counter())
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+# google.generativeai একাই প্রায় ১ সেকেন্ড নেয়; এগুলো AI ওয়ার্ম-আপ বা ডাটাবেস ইনিশিয়ালাইজের সময় (ব্যাকগ্রাউন্ডে) লোড হয়
+genai = LazyModule("google.generativeai")
+api_exceptions = LazyModule("google.api_core.exceptions")
+psycopg2 = LazyModule("psycopg2", "psycopg2.pool", "psycopg2.extras")
+
 # -----------------------------------------------------------------
 # --- টোকেন বা কী এখানে লোড করা হচ্ছে না ---
 # --- এগুলো এখন main() ফাংশনের ভেতরে লোড হবে ---
 # -----------------------------------------------------------------
 
+# বট চালানোর মোড: "polling" (ডিফল্ট) অথবা "webhook" (টেলিগ্রাম সরাসরি আমাদের HTTP সার্ভারে আপডেট পাঠায়)
+BOT_MODE = os.environ.get("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")  # যেমন: https://my-bot.onrender.com
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram-webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")  # X-Telegram-Bot-Api-Secret-Token হেডার চেকের জন্য
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40))
+# একসাথে কতগুলো আপডেট প্রসেস হবে (১ = আগের মতো একটির পর একটি)
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", 1))
+
+# মাল্টি-ওয়ার্কার মোড: সব ওয়ার্কারের বেস URL (ক্রমানুসারে, কমা দিয়ে আলাদা) এবং এই ওয়ার্কারের ইনডেক্স
+# সব ওয়ার্কার একই DATABASE_URL ব্যবহার করে; WORKER_URLS না দিলে আগের মতো এক-প্রসেস মোড
+WORKER_URLS = [url.strip().rstrip("/") for url in os.environ.get("WORKER_URLS", "").split(",") if url.strip()]
+WORKER_COUNT = max(1, len(WORKER_URLS))
+WORKER_INDEX = int(os.environ.get("WORKER_INDEX", 0))
+WORKER_SECRET = os.environ.get("WORKER_SECRET", "")  # ওয়ার্কারদের মধ্যে ফরোয়ার্ড করা আপডেট যাচাইয়ের জন্য
+WORKER_LEASE_TTL = float(os.environ.get("WORKER_LEASE_TTL", 60))  # সেকেন্ড (ওয়ার্কার বন্ধ হলে এর পরে লিজ মুক্ত হয়)
+MULTI_WORKER = WORKER_COUNT > 1
+WORKER_NAME = f"worker-{WORKER_INDEX}"
+INTERNAL_UPDATE_PATH = "/internal/update"
+
 # conversation-এর দুটি অবস্থা (state)
 STATE_IDLE, STATE_AWAITING_INTRO = range(2)
 TEXT_BUFFER_DELAY = 3  # সেকেন্ড
+PERSISTENCE_UPDATE_INTERVAL = float(os.environ.get("PERSISTENCE_UPDATE_INTERVAL", 10))  # সেকেন্ড (পরিবর্তিত ইউজার স্টেট কত পরপর সেভ হবে)
+# "adaptive": সম্পূর্ণ মনে হলে অল্প অপেক্ষায় (TEXT_BUFFER_MIN_DELAY) প্রসেস, টেলিগ্রাম ক্লায়েন্টের ভাগ করা অংশ মনে হলে TEXT_BUFFER_DELAY অপেক্ষা
+# "fixed": আগের মতো প্রতিটি অংশের পরে TEXT_BUFFER_DELAY অপেক্ষা
+TEXT_BUFFER_MODE = os.environ.get("TEXT_BUFFER_MODE", "adaptive").lower()
+# টেলিগ্রাম ক্লায়েন্ট ৪০৯৬ অক্ষরের বেশি টেক্সট ভাগ করে পাঠায়; এর চেয়ে লম্বা মেসেজকে সম্ভাব্য ভাগ করা অংশ ধরা হয়
+TEXT_SPLIT_MIN_CHARS = int(os.environ.get("TEXT_SPLIT_MIN_CHARS", 3500))
+TEXT_BUFFER_COMPLETE_DELAY = float(os.environ.get("TEXT_BUFFER_COMPLETE_DELAY", 1))  # লম্বা কিন্তু সম্পূর্ণ ব্লকে শেষ হওয়া মেসেজের অপেক্ষা
+# ছোট কিন্তু সম্পূর্ণ ব্লকে শেষ হওয়া মেসেজের পরেও এতটুকু অপেক্ষা, যাতে কয়েকটি মেসেজে পেস্ট করা কুইজ একসাথে যায়
+TEXT_BUFFER_MIN_DELAY = float(os.environ.get("TEXT_BUFFER_MIN_DELAY", 1))  # সেকেন্ড
 
-# --- Flask ওয়েব সার্ভার সেটআপ (বটকে জাগিয়ে রাখার জন্য) ---
-app = Flask(__name__)
-@app.route('/')
-def home():
-    """এটি UptimeRobot-কে দেখাবে যে বটটি সচল আছে।"""
-    return "I am alive and polling!"
+# ডাটাবেস কানেকশন পুলের আকার (Render-এর Environment থেকে পরিবর্তন করা যায়)
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))  # সেকেন্ড
+# দ্রুত স্টার্টআপে স্কিমা চেক শেষ হওয়ার জন্য অন্য কোয়েরি সর্বোচ্চ কতক্ষণ অপেক্ষা করবে
+DB_INIT_TIMEOUT = float(os.environ.get("DB_INIT_TIMEOUT", 30))  # সেকেন্ড
 
-def run_web_server():
-    """Flask সার্ভারটি চালু করে।"""
-    # Render স্বয়ংক্রিয়ভাবে PORT এনভায়রনমেন্ট ভেরিয়েবল সেট করে।
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+# AI (জেমিনি) কলের সমান্তরালতা, কিউয়ের আকার এবং প্রতিটি রিকোয়েস্টের টাইমআউট
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", 4))
+AI_MAX_QUEUE = int(os.environ.get("AI_MAX_QUEUE", 50))
+AI_REQUEST_TIMEOUT = float(os.environ.get("AI_REQUEST_TIMEOUT", 120))  # সেকেন্ড
+# বড় টেক্সট এই আকারের চাংকে ভাগ হয়ে সমান্তরালে AI-তে যায়; ব্যর্থ চাংক আলাদাভাবে আবার চেষ্টা করা হয়
+AI_CHUNK_MAX_CHARS = int(os.environ.get("AI_CHUNK_MAX_CHARS", 6000))
+AI_CHUNK_RETRIES = int(os.environ.get("AI_CHUNK_RETRIES", 2))
+AI_CHUNK_RETRY_DELAY = float(os.environ.get("AI_CHUNK_RETRY_DELAY", 2))  # সেকেন্ড
+# স্ট্রিমিং মোড: প্রশ্নগুলো আসার সাথে সাথে পার্স হয় এবং ইউজার লাইভ অগ্রগতি দেখেন
+AI_STREAMING = os.environ.get("AI_STREAMING", "1") == "1"
+AI_PROGRESS_INTERVAL = float(os.environ.get("AI_PROGRESS_INTERVAL", 2))  # সেকেন্ড (মেসেজ এডিটের সর্বনিম্ন বিরতি)
+# জেমিনি মডেলগুলো (কমা দিয়ে আলাদা, অগ্রাধিকার অনুযায়ী): প্রাইমারি ধীর হলে পরেরটিতে হেজ, বারবার ব্যর্থ হলে সার্কিট খোলে
+AI_MODELS = [name.strip() for name in os.environ.get("AI_MODELS", "gemini-flash-latest").split(",") if name.strip()]
+AI_HEDGE = os.environ.get("AI_HEDGE", "1") == "1"
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get("AI_HEDGE_MIN_SAMPLES", 20))  # p95 হিসাবের জন্য সর্বনিম্ন নমুনা
+AI_HEDGE_MIN_DELAY = float(os.environ.get("AI_HEDGE_MIN_DELAY", 1))  # সেকেন্ড (এর আগে কখনো হেজ নয়)
+AI_CIRCUIT_FAILURES = int(os.environ.get("AI_CIRCUIT_FAILURES", 5))  # পরপর কতবার ব্যর্থ হলে সার্কিট খোলে
+AI_CIRCUIT_COOLDOWN = float(os.environ.get("AI_CIRCUIT_COOLDOWN", 30))  # সেকেন্ড
+# ব্যাচিং মোড (০ = বন্ধ): এই সময়ের মধ্যে আসা বিভিন্ন ইউজারের ছোট চাংক একটি AI কলে যায়
+AI_BATCH_WINDOW = float(os.environ.get("AI_BATCH_WINDOW", 0))  # সেকেন্ড (প্রতিটি সাবমিশনের সর্বোচ্চ বাড়তি অপেক্ষা)
+AI_BATCH_MAX_CHARS = int(os.environ.get("AI_BATCH_MAX_CHARS", 12000))
+AI_BATCH_MAX_ITEMS = int(os.environ.get("AI_BATCH_MAX_ITEMS", 8))
+
+# পোল পাঠানোর রেট লিমিট (টেলিগ্রামের নিয়ম অনুযায়ী): প্রতি চ্যাটে এবং সব চ্যাট মিলিয়ে
+DISPATCH_CHAT_RATE = float(os.environ.get("DISPATCH_CHAT_RATE", 1))  # মেসেজ/সেকেন্ড
+DISPATCH_CHAT_BURST = float(os.environ.get("DISPATCH_CHAT_BURST", 3))
+DISPATCH_GLOBAL_RATE = float(os.environ.get("DISPATCH_GLOBAL_RATE", 30))  # মেসেজ/সেকেন্ড
+DISPATCH_GLOBAL_BURST = float(os.environ.get("DISPATCH_GLOBAL_BURST", 30))
+DISPATCH_MAX_RETRIES = int(os.environ.get("DISPATCH_MAX_RETRIES", 5))  # RetryAfter পেলে কতবার আবার চেষ্টা
+MAX_TARGET_CHANNELS = int(os.environ.get("MAX_TARGET_CHANNELS", 10))  # একজন ইউজার সর্বোচ্চ কতগুলো চ্যানেল রাখতে পারবে
+
+# প্রম্পটের টোকেন বাজেট: একটি চাংক এর বেশি হলে আরও ভাগ হয়, পুরো সাবমিশন সর্বোচ্চ সীমা ছাড়ালে ফেরত দেওয়া হয়
+AI_CHUNK_MAX_TOKENS = int(os.environ.get("AI_CHUNK_MAX_TOKENS", 3000))
+AI_MAX_INPUT_TOKENS = int(os.environ.get("AI_MAX_INPUT_TOKENS", 60000))
+# এতক্ষণ নিষ্ক্রিয় থাকলে ইউজারের সেশন (অসমাপ্ত কুইজ ও বাফার সহ) মুছে ফেলা হয়, এবং সুইপার কত পরপর চলে
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 24 * 3600))  # সেকেন্ড
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", 600))  # সেকেন্ড
+# দ্রুত স্টার্টআপ: ডাটাবেস স্কিমা চেক ও AI ক্লায়েন্ট ওয়ার্ম-আপ ব্যাকগ্রাউন্ডে চলে, এর মধ্যেই পোলিং শুরু হয়
+# (০ = আগের মতো সবকিছু শেষ করে তারপর পোলিং)
+FAST_STARTUP = os.environ.get("FAST_STARTUP", "1") == "1"
+AI_WARMUP_TIMEOUT = float(os.environ.get("AI_WARMUP_TIMEOUT", 10))  # সেকেন্ড (ওয়ার্ম-আপের count_tokens কলের সীমা)
+# ফাইল আপলোড: সর্বোচ্চ আকার (বট API ২০MB পর্যন্ত ডাউনলোড দেয়) এবং টেক্সট ফাইলের কতটুকু একবারে এক্সট্র্যাকশনে যাবে
+DOCUMENT_MAX_BYTES = int(os.environ.get("DOCUMENT_MAX_BYTES", 20 * 1024 * 1024))
+DOCUMENT_BLOCK_CHARS = int(os.environ.get("DOCUMENT_BLOCK_CHARS", AI_CHUNK_MAX_CHARS * AI_MAX_CONCURRENCY))
+# AI ফলাফল ক্যাশ: মেমোরিতে সর্বোচ্চ কতটি এন্ট্রি ও কতক্ষণ, ডাটাবেসে কতক্ষণ থাকবে
+AI_CACHE_SIZE = int(os.environ.get("AI_CACHE_SIZE", 256))
+AI_CACHE_TTL = float(os.environ.get("AI_CACHE_TTL", 6 * 3600))  # সেকেন্ড
+AI_CACHE_DB_TTL = float(os.environ.get("AI_CACHE_DB_TTL", 30 * 24 * 3600))  # সেকেন্ড
+
+# --- নতুন: Prometheus ফরম্যাটে মেট্রিক্স (HTTP সার্ভারের /metrics রুটে দেখা যায়) ---
+# DB হেল্পারগুলো আলাদা থ্রেডে চলে, তাই প্রতিটি মেট্রিকের আপডেট একটি লক দিয়ে সুরক্ষিত।
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: লেবেল {self.labelnames} দরকার, পাওয়া গেছে {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(_Metric):
+    """মান সরাসরি সেট করা যায়, অথবা প্রতিটি স্ক্র্যাপের সময় একটি ফাংশন থেকে পড়া হয়।"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._func = None
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, func):
+        self._func = func
+
+    def _samples(self) -> list[str]:
+        if self._func is not None:
+            try:
+                value = self._func()
+            except Exception as e:
+                print(f"⚠️ মেট্রিক {self.name} পড়তে সমস্যা: {e}")
+                return []
+        else:
+            with self._lock:
+                value = self._value
+        return [f"{self.name} {_format_value(value)}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._sums[key] += value
+
+    def time(self, **labels):
+        """with ব্লকের সময়কাল (সেকেন্ড) রেকর্ড করে।"""
+        return _HistogramTimer(self, labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class _HistogramTimer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"মেট্রিক {metric.name} আগেই রেজিস্টার করা হয়েছে")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+AI_REQUEST_SECONDS = METRICS.register(Histogram(
+    "pollbot_ai_request_seconds", "Gemini request latency.", ("mode", "outcome")))
+AI_TOKENS = METRICS.register(Counter(
+    "pollbot_ai_tokens_total", "Gemini tokens reported in usage metadata.", ("direction",)))
+AI_MODEL_SECONDS = METRICS.register(Histogram(
+    "pollbot_ai_model_seconds", "Per-model Gemini latency (time to first chunk for streams).", ("model", "outcome")))
+AI_HEDGES = METRICS.register(Counter(
+    "pollbot_ai_hedged_requests_total", "Hedged requests sent to a fallback model.", ("model",)))
+AI_CIRCUIT_OPENED = METRICS.register(Counter(
+    "pollbot_ai_circuit_opened_total", "Times a model's circuit breaker opened.", ("model",)))
+TIME_TO_FIRST_UPDATE = METRICS.register(Gauge(
+    "pollbot_time_to_first_update_seconds", "Seconds from process start until the first Telegram update was handled."))
+SESSIONS_EVICTED = METRICS.register(Counter(
+    "pollbot_sessions_evicted_total", "Idle user sessions removed by the sweeper.", ("kind",)))
+SESSION_BYTES_RECLAIMED = METRICS.register(Counter(
+    "pollbot_session_bytes_reclaimed_total", "Approximate memory freed by the session sweeper."))
+AI_BATCH_SIZE = METRICS.register(Histogram(
+    "pollbot_ai_batch_size", "Submissions combined into one batched Gemini request.", buckets=(1, 2, 3, 4, 6, 8, 12, 16)))
+DB_QUERY_SECONDS = METRICS.register(Histogram(
+    "pollbot_db_query_seconds", "Latency of *_db helper calls, including waiting for a pooled connection.", ("operation",)))
+TELEGRAM_SEND_SECONDS = METRICS.register(Histogram(
+    "pollbot_telegram_send_seconds", "Latency of a single send_poll/send_message call to a target channel.", ("kind", "outcome")))
+BUFFER_WAIT_SECONDS = METRICS.register(Histogram(
+    "pollbot_text_buffer_wait_seconds", "Time from the first buffered message to the start of processing.",
+    buckets=(1, 2, 3, 4, 5, 7.5, 10, 15, 30, 60)))
+QUESTIONS_EXTRACTED = METRICS.register(Counter(
+    "pollbot_questions_extracted_total", "Questions extracted from user text.", ("source",)))
+POLLS_SENT = METRICS.register(Counter(
+    "pollbot_polls_sent_total", "Polls posted to target channels."))
+POLLS_FAILED = METRICS.register(Counter(
+    "pollbot_polls_failed_total", "Polls that could not be posted, by error class.", ("error",)))
+PREFLIGHT_RESULTS = METRICS.register(Counter(
+    "pollbot_preflight_questions_total", "Pre-flight validation outcome per extracted question.", ("result",)))
+ACTIVE_BUFFERS = METRICS.register(Gauge(
+    "pollbot_active_text_buffers", "Users whose text is currently being buffered."))
+PENDING_QUIZZES = METRICS.register(Gauge(
+    "pollbot_pending_quizzes", "Extracted quizzes waiting for an intro text."))
+
+def timed_db(func):
+    """*_db হেল্পারের সময়কাল DB_QUERY_SECONDS-এ রেকর্ড করার ডেকোরেটর।"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.time(operation=func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+# --- নতুন ফাংশন: ডাটাবেস কানেকশন পুল ---
+# প্রতিটি কলে নতুন psycopg2.connect() না করে একটি সীমিত (bounded) পুল থেকে কানেকশন নেওয়া হয়।
+_db_pool: "psycopg2.pool.ThreadedConnectionPool | None" = None
+_db_pool_lock = threading.Lock()
+# পুল খালি থাকলে PoolError না দিয়ে অপেক্ষা করানোর জন্য সেমাফোর
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+def get_db_pool() -> "psycopg2.pool.ThreadedConnectionPool | None":
+    """প্রথম ব্যবহারের সময় Render-এর DATABASE_URL থেকে কানেকশন পুল তৈরি করে।"""
+    global _db_pool
+    if _db_pool is not None:
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None: # ডাবল চেক (অন্য থ্রেড হয়তো তৈরি করে ফেলেছে)
+            return _db_pool
+        try:
+            # ভেরিয়েবলটি এখানে সরাসরি পড়া হচ্ছে
+            db_url = os.environ.get("DATABASE_URL")
+            if not db_url:
+                print("❌ ডাটাবেস কানেকশনে সমস্যা: DATABASE_URL খুঁজে পাওয়া যায়নি।")
+                return None
+            _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, db_url)
+            print(f"✅ ডাটাবেস কানেকশন পুল তৈরি হয়েছে (min={DB_POOL_MIN}, max={DB_POOL_MAX})।")
+            return _db_pool
+        except Exception as e:
+            print(f"❌ ডাটাবেস কানেকশন পুল তৈরিতে সমস্যা: {e}")
+            return None
+
+# দ্রুত স্টার্টআপে init_db() ব্যাকগ্রাউন্ডে চলে; স্কিমা তৈরি শেষ না হওয়া পর্যন্ত অন্য কোয়েরি অপেক্ষা করে
+_db_schema_ready = threading.Event()
+_db_schema_ready.set()
 
-# --- নতুন ফাংশন: ডাটাবেস কানেকশন ---
 def get_db_connection():
-    """Render-এর DATABASE_URL থেকে কানেকশন তৈরি করে।"""
+    """পুল থেকে একটি কানেকশন ধার নেয়। কাজ শেষে অবশ্যই release_db_connection() ডাকতে হবে।"""
+    if not _db_schema_ready.is_set() and not _db_schema_ready.wait(DB_INIT_TIMEOUT):
+        print(f"❌ ডাটাবেস কানেকশনে সমস্যা: {DB_INIT_TIMEOUT} সেকেন্ডেও ডাটাবেস ইনিশিয়ালাইজ শেষ হয়নি।")
+        return None
+    return _acquire_db_connection()
+
+def _acquire_db_connection():
+    pool = get_db_pool()
+    if pool is None:
+        return None
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        print(f"❌ ডাটাবেস কানেকশনে সমস্যা: {DB_POOL_TIMEOUT} সেকেন্ডেও পুল থেকে কানেকশন পাওয়া যায়নি।")
+        return None
     try:
-        # ভেরিয়েবলটি এখানে সরাসরি পড়া হচ্ছে
-        db_url = os.environ.get("DATABASE_URL")
-        if not db_url:
-            print("❌ ডাটাবেস কানেকশনে সমস্যা: DATABASE_URL খুঁজে পাওয়া যায়নি।")
-            return None
-        conn = psycopg2.connect(db_url)
-        return conn
+        return pool.getconn()
     except Exception as e:
+        _db_pool_slots.release()
         print(f"❌ ডাটাবেস কানেকশনে সমস্যা: {e}")
         return None
 
+def release_db_connection(conn):
+    """কানেকশনটি পুলে ফেরত দেয়। ভাঙা কানেকশন হলে সেটি বন্ধ করে দেওয়া হয়।"""
+    if conn is None or _db_pool is None:
+        return
+    try:
+        if not conn.closed:
+            conn.rollback() # অসমাপ্ত ট্রানজ্যাকশন থাকলে পরিষ্কার করা
+        _db_pool.putconn(conn, close=bool(conn.closed))
+    except Exception as e:
+        print(f"⚠️ কানেকশন পুলে ফেরত দিতে সমস্যা: {e}")
+        try:
+            _db_pool.putconn(conn, close=True)
+        except Exception:
+            pass
+    finally:
+        _db_pool_slots.release()
+
+def close_db_pool():
+    """বট বন্ধ হওয়ার সময় পুলের সব কানেকশন বন্ধ করে।"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
 # --- নতুন ফাংশন: ডাটাবেস টেবিল তৈরি ---
+# বট চালু হওয়ার সময় এই স্টেটমেন্টগুলো ক্রমানুসারে চলে (সবগুলোই IF NOT EXISTS)।
+DB_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id BIGINT PRIMARY KEY,
+        target_channel TEXT
+    );
+    """,
+    # একজন ইউজারের একাধিক টার্গেট চ্যানেল (একই কুইজ সবগুলোতে পোস্ট হয়)
+    """
+    CREATE TABLE IF NOT EXISTS user_channels (
+        user_id BIGINT NOT NULL,
+        channel TEXT NOT NULL,
+        added_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (user_id, channel)
+    );
+    """,
+    # পুরানো এক-চ্যানেলের সেটিং নতুন টেবিলে নিয়ে আসা (যাদের এখনো কোনো চ্যানেল নেই শুধু তাদের)
+    """
+    INSERT INTO user_channels (user_id, channel)
+    SELECT s.user_id, s.target_channel FROM user_settings s
+    WHERE s.target_channel IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM user_channels c WHERE c.user_id = s.user_id)
+    ON CONFLICT DO NOTHING;
+    """,
+    # AI এক্সট্র্যাকশনের ফলাফলের স্থায়ী ক্যাশ (কী = প্রম্পট ভার্সন + স্বাভাবিক টেক্সটের sha256)
+    """
+    CREATE TABLE IF NOT EXISTS ai_cache (
+        cache_key TEXT PRIMARY KEY,
+        prompt_version TEXT NOT NULL,
+        questions JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    # কুইজ পোস্টিং জব এবং এর প্রতিটি মেসেজের (সূচনা/পোল) স্ট্যাটাস, রিস্টার্টের পরে আবার শুরু করার জন্য
+    """
+    CREATE TABLE IF NOT EXISTS posting_jobs (
+        job_id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        chat_id BIGINT NOT NULL,
+        target_channel TEXT NOT NULL,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    # ইউজারের কথোপকথনের অবস্থা ও অপেক্ষমাণ কুইজ (PostgresPersistence), প্রতি ইউজারে একটি সারি
+    """
+    CREATE TABLE IF NOT EXISTS user_state (
+        user_id BIGINT PRIMARY KEY,
+        data JSONB NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    # ইউজারের সর্বশেষ সক্রিয়তা (স্টেট না বদলালেও); পুরানো স্টেট মোছার সময় এটিই দেখা হয়
+    "ALTER TABLE user_state ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+    # মাল্টি-ওয়ার্কার মোডে ইউজারের সাবমিশন ('user:<id>') বা পোস্টিং জবের ('job:<id>') মালিকানা
+    """
+    CREATE TABLE IF NOT EXISTS worker_leases (
+        lease_key TEXT PRIMARY KEY,
+        worker TEXT NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL
+    );
+    """,
+    # কুইজ লাইব্রেরি: অনন্য প্রশ্ন (কনটেন্ট হ্যাশে ডিডুপ্লিকেট) এবং প্রতিটি কুইজের প্রশ্নের হ্যাশ-তালিকা
+    """
+    CREATE TABLE IF NOT EXISTS library_questions (
+        question_hash TEXT PRIMARY KEY,
+        data JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS library_quizzes (
+        quiz_id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        intro_text TEXT NOT NULL,
+        question_hashes TEXT[] NOT NULL,
+        content_hash TEXT NOT NULL,
+        post_count INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        last_posted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        UNIQUE (user_id, content_hash)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS library_quizzes_user_idx ON library_quizzes (user_id, last_posted_at DESC);",
+    "CREATE INDEX IF NOT EXISTS posting_jobs_status_idx ON posting_jobs (status);",
+    "CREATE INDEX IF NOT EXISTS posting_jobs_user_idx ON posting_jobs (user_id, job_id);",
+    """
+    CREATE TABLE IF NOT EXISTS posting_job_items (
+        job_id BIGINT NOT NULL REFERENCES posting_jobs (job_id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (job_id, position)
+    );
+    """,
+]
+
 def init_db():
-    """বট চালু হওয়ার সময় এই ফাংশন ডাটাবেস টেবিল তৈরি করবে।"""
+    """বট চালু হওয়ার সময় এই ফাংশন ডাটাবেস টেবিল তৈরি করবে (শেষ হলে, সফল বা ব্যর্থ, অপেক্ষমাণ কোয়েরিগুলো ছাড়া পায়)।"""
+    try:
+        with STARTUP.phase("db_init"):
+            conn = _acquire_db_connection()
+            if conn is None:
+                print("❌ ডাটাবেস ইনিশিয়ালাইজ করা যাচ্ছে না।")
+                return
+
+            try:
+                with conn.cursor() as cur:
+                    for statement in DB_SCHEMA:
+                        cur.execute(statement)
+                    conn.commit()
+                print("✅ ডাটাবেস টেবিলগুলো সফলভাবে চেক/তৈরি করা হয়েছে।")
+            except Exception as e:
+                print(f"❌ টেবিল তৈরিতে সমস্যা: {e}")
+            finally:
+                release_db_connection(conn)
+    finally:
+        _db_schema_ready.set()
+
+# --- নতুন ফাংশন: ডাটাবেস থেকে ইউজারের সব টার্গেট চ্যানেল পড়া ---
+# user_settings.target_channel এখনো "প্রধান" (প্রথম) চ্যানেল হিসেবে সিঙ্কে রাখা হয়।
+@timed_db
+def get_target_channels_from_db(user_id: int) -> list[str] | None:
+    """ইউজারের চ্যানেলগুলো যোগ করার ক্রমে দেয়; ডাটাবেস সমস্যায় None দেয়।"""
     conn = get_db_connection()
-    if conn is None:
-        print("❌ ডাটাবেস ইনিশিয়ালাইজ করা যাচ্ছে না।")
-        return
+    if conn is None: return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT channel FROM user_channels WHERE user_id = %s ORDER BY added_at, channel", (user_id,))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"❌ চ্যানেল আইডি পড়াতে সমস্যা: {e}")
+        return None
+    finally:
+        release_db_connection(conn)
+
+def _sync_primary_channel(cur, user_id: int):
+    """user_settings.target_channel কে ইউজারের প্রথম চ্যানেলের সাথে মিলিয়ে রাখে।"""
+    cur.execute("""
+        INSERT INTO user_settings (user_id, target_channel)
+        VALUES (%s, (SELECT channel FROM user_channels WHERE user_id = %s ORDER BY added_at, channel LIMIT 1))
+        ON CONFLICT (user_id) DO UPDATE SET target_channel = EXCLUDED.target_channel;
+    """, (user_id, user_id))
+
+# --- নতুন ফাংশন: ডাটাবেসে চ্যানেল আইডি সেভ করা (আগের সব চ্যানেল মুছে) ---
+@timed_db
+def save_target_channels_to_db(user_id: int, channels: list[str]) -> bool:
+    conn = get_db_connection()
+    if conn is None: return False
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM user_channels WHERE user_id = %s", (user_id,))
+            for offset, channel in enumerate(channels):
+                # added_at আলাদা রাখা হচ্ছে, যাতে দেওয়া ক্রমটি বজায় থাকে
+                cur.execute("""
+                    INSERT INTO user_channels (user_id, channel, added_at)
+                    VALUES (%s, %s, NOW() + make_interval(secs => %s))
+                    ON CONFLICT (user_id, channel) DO NOTHING;
+                """, (user_id, channel, offset / 1000))
+            _sync_primary_channel(cur, user_id)
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"❌ চ্যানেল আইডি সেভ করতে সমস্যা: {e}")
+        return False
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def add_target_channel_to_db(user_id: int, channel: str) -> bool:
+    conn = get_db_connection()
+    if conn is None: return False
 
     try:
         with conn.cursor() as cur:
             cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_settings (
-                    user_id BIGINT PRIMARY KEY,
-                    target_channel TEXT
-                );
-            """)
+                INSERT INTO user_channels (user_id, channel) VALUES (%s, %s)
+                ON CONFLICT (user_id, channel) DO NOTHING;
+            """, (user_id, channel))
+            _sync_primary_channel(cur, user_id)
             conn.commit()
-        print("✅ ডাটাবেস টেবিল (user_settings) সফলভাবে চেক/তৈরি করা হয়েছে।")
+        return True
     except Exception as e:
-        print(f"❌ টেবিল তৈরিতে সমস্যা: {e}")
+        print(f"❌ চ্যানেল যোগ করতে সমস্যা: {e}")
+        return False
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
-# --- নতুন ফাংশন: ডাটাবেস থেকে চ্যানেল আইডি পড়া ---
-def get_target_channel_from_db(user_id: int) -> str | None:
+@timed_db
+def remove_target_channel_from_db(user_id: int, channel: str) -> bool | None:
+    """চ্যানেলটি মুছে ফেলে; চ্যানেলটি না থাকলে False, ডাটাবেস সমস্যায় None দেয়।"""
     conn = get_db_connection()
     if conn is None: return None
 
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT target_channel FROM user_settings WHERE user_id = %s", (user_id,))
-            result = cur.fetchone()
-            if result:
-                return result[0] # target_channel
-            return None
+            cur.execute("DELETE FROM user_channels WHERE user_id = %s AND channel = %s", (user_id, channel))
+            removed = cur.rowcount > 0
+            _sync_primary_channel(cur, user_id)
+            conn.commit()
+        return removed
     except Exception as e:
-        print(f"❌ চ্যানেল আইডি পড়াতে সমস্যা: {e}")
+        print(f"❌ চ্যানেল মুছতে সমস্যা: {e}")
+        return None
+    finally:
+        release_db_connection(conn)
+
+# --- নতুন: চ্যানেল আইডির ইন-প্রসেস ক্যাশ (read-through) ---
+# user_id -> চ্যানেলের লিস্ট। handle_text-এর হট পাথে বারবার ডাটাবেসে যেতে হয় না।
+# চ্যানেল সেট/যোগ/মুছে ফেলার কমান্ড কল হলে ক্যাশ ইনভ্যালিডেট/আপডেট হয়।
+_channel_cache: dict[int, list[str]] = {}
+
+async def get_target_channels(user_id: int) -> list[str]:
+    """ক্যাশ থেকে চ্যানেলগুলো দেয়; না থাকলে থ্রেডে ডাটাবেস থেকে পড়ে ক্যাশে রাখে।"""
+    channels = _channel_cache.get(user_id)
+    if channels is not None:
+        return list(channels)
+    # সিনক্রোনাস psycopg2 কল ইভেন্ট লুপ ব্লক না করে থ্রেডে চালানো হচ্ছে
+    channels = await asyncio.to_thread(get_target_channels_from_db, user_id)
+    if channels is None: # ডাটাবেস এরর ক্যাশ করা হয় না
+        return []
+    _channel_cache[user_id] = channels
+    return list(channels)
+
+async def _update_channels(user_id: int, func, *args):
+    """চ্যানেল পরিবর্তনের আগে ক্যাশ ইনভ্যালিডেট করে, যাতে পরের রিড ডাটাবেস থেকে আসে।"""
+    _channel_cache.pop(user_id, None)
+    try:
+        return await asyncio.to_thread(func, user_id, *args)
+    finally:
+        _channel_cache.pop(user_id, None)
+
+async def save_target_channels(user_id: int, channels: list[str]) -> bool:
+    return await _update_channels(user_id, save_target_channels_to_db, channels)
+
+async def add_target_channel(user_id: int, channel: str) -> bool:
+    return await _update_channels(user_id, add_target_channel_to_db, channel)
+
+async def remove_target_channel(user_id: int, channel: str) -> bool | None:
+    return await _update_channels(user_id, remove_target_channel_from_db, channel)
+
+# --- নতুন: পোস্টিং জব ডাটাবেসে সংরক্ষণ (রিস্টার্টের পরে আবার শুরু করার জন্য) ---
+# প্রতিটি কুইজ পোস্টিং একটি জব; প্রতিটি মেসেজ (সূচনা বা পোল) একটি আইটেম, যার আলাদা স্ট্যাটাস থাকে।
+JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED = "pending", "running", "done", "failed"
+ITEM_PENDING, ITEM_SENT, ITEM_FAILED = "pending", "sent", "failed"
+
+def new_posting_job(user_id: int, chat_id: int, target_channel: str, intro_text: str, questions_data: list) -> dict:
+    """মেমোরিতে একটি পোস্টিং জব তৈরি করে (ডাটাবেসে সেভ হলে job_id সেট হয়)।"""
+    items = [{"position": 0, "kind": "intro", "payload": {"text": intro_text}, "status": ITEM_PENDING, "error": None}]
+    for position, poll_data in enumerate(questions_data, start=1):
+        items.append({"position": position, "kind": "poll", "payload": poll_data, "status": ITEM_PENDING, "error": None})
+    return {
+        "job_id": None,
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "target_channel": target_channel,
+        "status": JOB_PENDING,
+        "items": items,
+    }
+
+@timed_db
+def save_posting_job_to_db(job: dict) -> int | None:
+    """জব এবং এর সব আইটেম একটি ট্রানজ্যাকশনে সেভ করে job_id ফেরত দেয়।"""
+    conn = get_db_connection()
+    if conn is None: return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO posting_jobs (user_id, chat_id, target_channel, status, total)
+                VALUES (%s, %s, %s, %s, %s) RETURNING job_id;
+            """, (job["user_id"], job["chat_id"], job["target_channel"], job["status"], len(job["items"])))
+            job_id = cur.fetchone()[0]
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO posting_job_items (job_id, position, kind, payload, status) VALUES %s
+            """, [
+                (job_id, item["position"], item["kind"], json.dumps(item["payload"], ensure_ascii=False), item["status"])
+                for item in job["items"]
+            ])
+            conn.commit()
+        return job_id
+    except Exception as e:
+        print(f"❌ পোস্টিং জব সেভ করতে সমস্যা: {e}")
+        return None
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def load_posting_job_from_db(job_id: int) -> dict | None:
+    conn = get_db_connection()
+    if conn is None: return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT user_id, chat_id, target_channel, status FROM posting_jobs WHERE job_id = %s", (job_id,))
+            row = cur.fetchone()
+            if not row:
+                return None
+            cur.execute("""
+                SELECT position, kind, payload, status, error FROM posting_job_items
+                WHERE job_id = %s ORDER BY position
+            """, (job_id,))
+            items = [
+                {"position": position, "kind": kind, "payload": payload, "status": status, "error": error}
+                for position, kind, payload, status, error in cur.fetchall()
+            ]
+        return {"job_id": job_id, "user_id": row[0], "chat_id": row[1], "target_channel": row[2], "status": row[3], "items": items}
+    except Exception as e:
+        print(f"❌ পোস্টিং জব (#{job_id}) পড়তে সমস্যা: {e}")
+        return None
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def get_unfinished_posting_job_ids_from_db() -> list[int]:
+    """যে জবগুলো শেষ হয়নি (রিস্টার্টের আগে চলছিল বা অপেক্ষায় ছিল) সেগুলোর আইডি।"""
+    conn = get_db_connection()
+    if conn is None: return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT job_id FROM posting_jobs WHERE status IN (%s, %s) ORDER BY job_id", (JOB_PENDING, JOB_RUNNING))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"❌ অসমাপ্ত পোস্টিং জব খুঁজতে সমস্যা: {e}")
+        return []
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def update_posting_job_item_in_db(job_id: int, position: int, status: str, error: str | None = None):
+    conn = get_db_connection()
+    if conn is None: return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE posting_job_items SET status = %s, error = %s, updated_at = NOW()
+                WHERE job_id = %s AND position = %s;
+            """, (status, error, job_id, position))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ পোস্টিং জব (#{job_id}) আইটেম {position} আপডেট করতে সমস্যা: {e}")
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def update_posting_job_status_in_db(job_id: int, status: str):
+    conn = get_db_connection()
+    if conn is None: return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE posting_jobs SET status = %s, updated_at = NOW() WHERE job_id = %s", (status, job_id))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ পোস্টিং জব (#{job_id}) স্ট্যাটাস আপডেট করতে সমস্যা: {e}")
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def get_user_posting_jobs_from_db(user_id: int, limit: int = 5) -> list[dict]:
+    """/status কমান্ডের জন্য ইউজারের সাম্প্রতিক জবগুলোর অগ্রগতি।"""
+    conn = get_db_connection()
+    if conn is None: return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT j.job_id, j.target_channel, j.status, j.total,
+                       COUNT(*) FILTER (WHERE i.status = %s) AS sent,
+                       COUNT(*) FILTER (WHERE i.status = %s) AS failed,
+                       j.created_at
+                FROM posting_jobs j JOIN posting_job_items i ON i.job_id = j.job_id
+                WHERE j.user_id = %s
+                GROUP BY j.job_id
+                ORDER BY j.job_id DESC
+                LIMIT %s
+            """, (ITEM_SENT, ITEM_FAILED, user_id, limit))
+            return [
+                {"job_id": job_id, "target_channel": target_channel, "status": status, "total": total,
+                 "sent": sent, "failed": failed, "created_at": created_at}
+                for job_id, target_channel, status, total, sent, failed, created_at in cur.fetchall()
+            ]
+    except Exception as e:
+        print(f"❌ ইউজারের পোস্টিং জব পড়তে সমস্যা: {e}")
+        return []
+    finally:
+        release_db_connection(conn)
+
+# --- নতুন: কুইজ লাইব্রেরি (পোস্ট করা কুইজ স্থায়ীভাবে রাখা, AI ছাড়াই আবার পোস্ট করার জন্য) ---
+# প্রতিটি অনন্য প্রশ্ন library_questions-এ একবারই থাকে (কী = কনটেন্টের sha256); একটি কুইজ শুধু প্রশ্নের হ্যাশের
+# ক্রমানুসারে তালিকা রাখে। একই ইউজার একই প্রশ্নগুলো আবার পোস্ট করলে নতুন সারি না হয়ে পোস্টের সংখ্যা বাড়ে।
+def question_content_hash(question: dict) -> str:
+    fields = {key: question.get(key) for key in ("question", "options", "correct_option_index", "explanation", "suffix")}
+    payload = unicodedata.normalize("NFC", json.dumps(fields, ensure_ascii=False, sort_keys=True))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@timed_db
+def save_quiz_to_library_db(user_id: int, intro_text: str, questions: list[dict]) -> int | None:
+    """কুইজটি লাইব্রেরিতে সেভ করে (বা আগে থেকে থাকলে পোস্টের সংখ্যা বাড়ায়) এবং quiz_id ফেরত দেয়।"""
+    conn = get_db_connection()
+    if conn is None: return None
+
+    try:
+        hashes = [question_content_hash(question) for question in questions]
+        unique = {question_hash: question for question_hash, question in zip(hashes, questions)}
+        content_hash = hashlib.sha256("\n".join(hashes).encode("ascii")).hexdigest()
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO library_questions (question_hash, data) VALUES %s
+                ON CONFLICT (question_hash) DO NOTHING;
+            """, [(question_hash, json.dumps(question, ensure_ascii=False)) for question_hash, question in unique.items()],
+                template="(%s, %s::jsonb)")
+            cur.execute("""
+                INSERT INTO library_quizzes (user_id, intro_text, question_hashes, content_hash)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (user_id, content_hash) DO UPDATE
+                SET intro_text = EXCLUDED.intro_text, post_count = library_quizzes.post_count + 1, last_posted_at = NOW()
+                RETURNING quiz_id;
+            """, (user_id, intro_text, hashes, content_hash))
+            quiz_id = cur.fetchone()[0]
+            conn.commit()
+            return quiz_id
+    except Exception as e:
+        print(f"❌ কুইজ লাইব্রেরিতে সেভ করতে সমস্যা: {e}")
+        conn.rollback()
+        return None
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def get_library_quizzes_from_db(user_id: int, query: str | None = None, limit: int = 10) -> list[dict]:
+    """ইউজারের লাইব্রেরির কুইজগুলো (সর্বশেষ পোস্ট আগে); query দিলে সূচনা বা প্রশ্নের টেক্সটে খোঁজে।"""
+    conn = get_db_connection()
+    if conn is None: return []
+
+    try:
+        with conn.cursor() as cur:
+            condition, params = "", [user_id]
+            if query:
+                pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                condition = """
+                    AND (q.intro_text ILIKE %s OR EXISTS (
+                        SELECT 1 FROM library_questions lq
+                        WHERE lq.question_hash = ANY(q.question_hashes) AND lq.data->>'question' ILIKE %s
+                    ))
+                """
+                params += [pattern, pattern]
+            cur.execute(f"""
+                SELECT q.quiz_id, q.intro_text, cardinality(q.question_hashes), q.post_count, q.last_posted_at
+                FROM library_quizzes q
+                WHERE q.user_id = %s {condition}
+                ORDER BY q.last_posted_at DESC
+                LIMIT %s
+            """, params + [limit])
+            return [
+                {"quiz_id": quiz_id, "intro_text": intro_text, "questions": count, "post_count": post_count,
+                 "last_posted_at": last_posted_at}
+                for quiz_id, intro_text, count, post_count, last_posted_at in cur.fetchall()
+            ]
+    except Exception as e:
+        print(f"❌ কুইজ লাইব্রেরি পড়তে সমস্যা: {e}")
+        return []
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def load_library_quiz_from_db(user_id: int, quiz_id: int) -> tuple[str, list[dict]] | None:
+    """(সূচনা বার্তা, মূল ক্রমে প্রশ্নগুলো); কুইজটি এই ইউজারের না হলে বা না পাওয়া গেলে None।"""
+    conn = get_db_connection()
+    if conn is None: return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT intro_text, question_hashes FROM library_quizzes WHERE quiz_id = %s AND user_id = %s",
+                        (quiz_id, user_id))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            intro_text, hashes = row
+            cur.execute("SELECT question_hash, data FROM library_questions WHERE question_hash = ANY(%s)", (hashes,))
+            by_hash = dict(cur.fetchall())
+            return intro_text, [by_hash[question_hash] for question_hash in hashes if question_hash in by_hash]
+    except Exception as e:
+        print(f"❌ লাইব্রেরি থেকে কুইজ #{quiz_id} পড়তে সমস্যা: {e}")
         return None
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
+
+@timed_db
+def mark_library_quiz_posted_in_db(quiz_id: int):
+    conn = get_db_connection()
+    if conn is None: return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE library_quizzes SET post_count = post_count + 1, last_posted_at = NOW() WHERE quiz_id = %s",
+                        (quiz_id,))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ লাইব্রেরির কুইজ #{quiz_id} আপডেট করতে সমস্যা: {e}")
+    finally:
+        release_db_connection(conn)
+
+# --- নতুন: পেন্ডিং কুইজের কমপ্যাক্ট রূপ এবং নিষ্ক্রিয় সেশন পরিষ্কার ---
+# সূচনা বার্তার অপেক্ষায় থাকা প্রশ্নগুলো dict-এর বদলে __slots__ অবজেক্টে থাকে (প্রতি প্রশ্নে আলাদা dict নেই,
+# অপশন tuple-এ, বারবার আসা ট্যাগ ও ছোট অপশন interned)। কেউ সূচনা বা /cancel না পাঠিয়ে চলে গেলে
+# SESSION_TTL পরে সুইপার তার পেন্ডিং কুইজ/বাফার এবং পুরো সেশন মেমোরি ও ডাটাবেস থেকে সরিয়ে দেয়।
+class QuizQuestion:
+    """একটি প্রশ্ন (AI আউটপুটের dict-এর মতো একই ফিল্ড)। to_dict()/from_dict() দিয়ে JSON-এ যায়/আসে।"""
+    __slots__ = ("question", "options", "correct_option_index", "explanation", "suffix")
+    INTERN_MAX_CHARS = 40 # এর চেয়ে ছোট অপশন (যেমন "উপরের সবগুলো") বিভিন্ন প্রশ্নে একই অবজেক্ট শেয়ার করে
+
+    def __init__(self, question: str, options, correct_option_index: int, explanation: str | None = None, suffix: str | None = None):
+        self.question = question
+        self.options = tuple(sys.intern(option) if len(option) <= self.INTERN_MAX_CHARS else option for option in options)
+        self.correct_option_index = correct_option_index
+        self.explanation = explanation
+        self.suffix = sys.intern(suffix) if suffix else None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuizQuestion":
+        return cls(data["question"], data["options"], data["correct_option_index"], data.get("explanation"), data.get("suffix"))
+
+    def to_dict(self) -> dict:
+        return {
+            "question": self.question,
+            "options": list(self.options),
+            "correct_option_index": self.correct_option_index,
+            "explanation": self.explanation,
+            "suffix": self.suffix,
+        }
+
+def approx_size(obj, seen: set | None = None) -> int:
+    """অবজেক্টটি (ভেতরের dict/list/tuple/str সহ) মোটামুটি কত বাইট মেমোরি নিচ্ছে; শেয়ার করা অবজেক্ট একবার গোনা হয়।"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(key, seen) + approx_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(approx_size(item, seen) for item in obj)
+    elif isinstance(obj, QuizQuestion):
+        size += sum(approx_size(getattr(obj, slot), seen) for slot in QuizQuestion.__slots__)
+    return size
+
+def _json_default(obj):
+    if isinstance(obj, QuizQuestion):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} JSON-এ রূপান্তর করা যায় না")
+
+@timed_db
+def purge_stale_user_states_from_db(ttl: float, last_seen: dict[int, float]) -> int:
+    """
+    last_seen: মেমোরিতে থাকা ইউজারদের সর্বশেষ সক্রিয়তা (epoch সেকেন্ড) — প্রথমে ডাটাবেসে last_seen_at হিসেবে লেখা হয়।
+    এরপর এই ওয়ার্কারের ভাগের (user_id % WORKER_COUNT) যেসব স্টেট ttl সেকেন্ডের বেশি নিষ্ক্রিয় সেগুলো মুছে ফেলে
+    (মেমোরিতে থাকা ইউজার বাদে); কতটি মুছল তা দেয়। অন্য ওয়ার্কারের ইউজারদের সারি ছোঁয়া হয় না।
+    """
+    conn = get_db_connection()
+    if conn is None: return 0
+
+    try:
+        with conn.cursor() as cur:
+            if last_seen:
+                psycopg2.extras.execute_values(cur, """
+                    UPDATE user_state AS s SET last_seen_at = to_timestamp(v.seen)
+                    FROM (VALUES %s) AS v (user_id, seen)
+                    WHERE s.user_id = v.user_id AND s.last_seen_at < to_timestamp(v.seen);
+                """, list(last_seen.items()), template="(%s::bigint, %s::float8)")
+            cur.execute("""
+                DELETE FROM user_state
+                WHERE last_seen_at < NOW() - make_interval(secs => %s)
+                  AND user_id %% %s = %s AND NOT (user_id = ANY(%s));
+            """, (ttl, WORKER_COUNT, WORKER_INDEX, list(last_seen)))
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+    except Exception as e:
+        print(f"❌ পুরানো ইউজার স্টেট মুছতে সমস্যা: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        release_db_connection(conn)
+
+async def track_user_activity(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """প্রতিটি আপডেটে ইউজারের সর্বশেষ সক্রিয়তার সময় রাখে (সুইপারের জন্য; সুইপের সময় last_seen_at হিসেবে ডাটাবেসে যায়); প্রথম আপডেটে স্টার্টআপ রিপোর্ট দেখায়।"""
+    if update.effective_user is not None:
+        context.user_data['last_seen'] = time.time()
+    if STARTUP.first_update():
+        TIME_TO_FIRST_UPDATE.set(STARTUP.first_update_at)
+        print(STARTUP.report())
+
+async def sweep_idle_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """
+    SESSION_TTL ধরে নিষ্ক্রিয় ইউজারদের সেশন মুছে ফেলে: অসমাপ্ত কুইজ/বাফার থাকলে ইউজারকে জানানো হয়।
+    চলমান বাফার টাইমার, টেক্সট এক্সট্র্যাকশন বা ফাইল প্রসেসিং থাকা ইউজার বাদ যায়। কতটুকু মেমোরি মুক্ত হলো তা লগ করে।
+    """
+    application = context.application
+    now = time.time()
+    evicted_pending = evicted_idle = reclaimed = 0
+    for user_id, user_data in list(application.user_data.items()):
+        if user_id in _buffer_jobs or 'document_upload' in user_data or 'extracting' in user_data:
+            continue
+        last_seen = user_data.setdefault('last_seen', now) # রিস্টার্টের পরে লোড হওয়া সেশনের ঘড়ি এখন থেকে শুরু
+        if now - last_seen < SESSION_TTL:
+            continue
+        reclaimed += approx_size(user_data)
+        if 'pending_quiz_data' in user_data or 'text_buffer' in user_data:
+            evicted_pending += 1
+            hours = f"{SESSION_TTL / 3600:.0f}"
+            if 'pending_quiz_data' in user_data:
+                notice = f"⌛ আপনার অসমাপ্ত কুইজটি {hours} ঘণ্টা ধরে সূচনা বার্তার অপেক্ষায় ছিল, তাই বাতিল করা হয়েছে। প্রয়োজনে প্রশ্নগুলো আবার পাঠান।"
+            else: # শুধু বাফারে জমা টেক্সট, কোনো কুইজ তৈরি হয়নি
+                notice = f"⌛ আপনার পাঠানো টেক্সট {hours} ঘণ্টা ধরে প্রসেস না হয়ে জমা ছিল, তাই মুছে ফেলা হয়েছে। প্রয়োজনে টেক্সটটি আবার পাঠান।"
+            with contextlib.suppress(Exception): # ইউজার বট ব্লক করলে বা প্রাইভেট চ্যাট না থাকলে উপেক্ষা
+                await context.bot.send_message(chat_id=user_id, text=notice)
+        else:
+            evicted_idle += 1
+        application.drop_user_data(user_id) # পরের আপডেটে পারসিস্টেন্স থেকে আবার (খালি অবস্থায়) লোড হবে
+    last_seen = {user_id: user_data.get('last_seen', now) for user_id, user_data in application.user_data.items()}
+    purged = await asyncio.to_thread(purge_stale_user_states_from_db, SESSION_TTL, last_seen)
+    if evicted_pending:
+        SESSIONS_EVICTED.inc(evicted_pending, kind="pending")
+    if evicted_idle:
+        SESSIONS_EVICTED.inc(evicted_idle, kind="idle")
+    SESSION_BYTES_RECLAIMED.inc(reclaimed)
+    if evicted_pending or evicted_idle or purged:
+        print(
+            f"🧹 সেশন সুইপ: {evicted_pending} টি অসমাপ্ত কুইজ/বাফার ও {evicted_idle} টি নিষ্ক্রিয় সেশন মুছে "
+            f"প্রায় {reclaimed / 1024:.1f} KB মেমোরি মুক্ত; ডাটাবেস থেকে {purged} টি পুরানো স্টেট মোছা হয়েছে "
+            f"(এখন মেমোরিতে {len(application.user_data)} টি সেশন)।"
+        )
+
+# --- নতুন: Postgres-ভিত্তিক ইউজার স্টেট পারসিস্টেন্স (পুরো pickle ফাইলের বদলে) ---
+# শুধু যে ইউজারের স্টেট বদলেছে তার একটি সারি লেখা হয়, একাধিক পরিবর্তন একসাথে এক ট্রানজ্যাকশনে যায়।
+# স্টার্টআপে কিছুই লোড হয় না; একজন ইউজারের প্রথম আপডেট আসলে তখন তার স্টেট ডাটাবেস থেকে আনা হয়।
+# টাইমার বা বাফারের মতো ক্ষণস্থায়ী জিনিস রিস্টার্টের পরে অর্থহীন, তাই শুধু এই কী-গুলো সেভ হয়:
+# (মাল্টি-ওয়ার্কার মোডে টেক্সট বাফারও, যাতে মালিক ওয়ার্কার রিস্টার্ট/রিডিপ্লয় হয়ে ফিরে এলে বাকি টেক্সট পায়;
+# অন্য কোনো ওয়ার্কার এটি নেয় না, মালিক বন্ধ থাকলে আপডেট বাদ যায় এবং ইউজারকে আবার পাঠাতে বলা হয়)
+PERSISTED_USER_KEYS = ('CONV_STATE', 'pending_quiz_data') + (('text_buffer',) if MULTI_WORKER else ())
+
+@timed_db
+def load_user_state_from_db(user_id: int) -> dict | None:
+    conn = get_db_connection()
+    if conn is None: raise RuntimeError("ডাটাবেস কানেকশন পাওয়া যায়নি")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT data FROM user_state WHERE user_id = %s", (user_id,))
+            result = cur.fetchone()
+            return result[0] if result else None
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def save_user_states_to_db(states: dict[int, str | None]) -> bool:
+    """states: user_id -> JSON টেক্সট (None হলে সারিটি মুছে ফেলা হয়)। সব পরিবর্তন এক ট্রানজ্যাকশনে।"""
+    conn = get_db_connection()
+    if conn is None: return False
+
+    try:
+        with conn.cursor() as cur:
+            upserts = [(user_id, data) for user_id, data in states.items() if data is not None]
+            deletes = [user_id for user_id, data in states.items() if data is None]
+            if upserts:
+                psycopg2.extras.execute_values(cur, """
+                    INSERT INTO user_state (user_id, data, updated_at, last_seen_at) VALUES %s
+                    ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW(), last_seen_at = NOW();
+                """, upserts, template="(%s, %s::jsonb, NOW(), NOW())")
+            if deletes:
+                cur.execute("DELETE FROM user_state WHERE user_id = ANY(%s)", (deletes,))
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"❌ ইউজার স্টেট সেভ করতে সমস্যা: {e}")
+        conn.rollback()
+        return False
+    finally:
+        release_db_connection(conn)
+
+class PostgresPersistence(BasePersistence):
+    """
+    শুধু user_data সংরক্ষণ করে (bot_data/chat_data এই বটে পারসিস্ট করার দরকার নেই)।
+    get_user_data() খালি ফেরত দেয়; refresh_user_data() প্রথমবার কল হলে ইউজারের স্টেট ডাটাবেস থেকে আনে।
+    update_user_data() শুধু পরিবর্তিত স্টেট জমা রাখে, এবং একই রাউন্ডের সবগুলো একসাথে লেখা হয়।
+    """
+
+    def __init__(self, update_interval: float):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._loads: dict[int, asyncio.Task] = {} # user_id -> লোড টাস্ক (একই ইউজার দুবার লোড হয় না)
+        self._saved: dict[int, str] = {} # সর্বশেষ ডাটাবেসে থাকা স্টেট (অপরিবর্তিত স্টেট আবার লেখা হয় না)
+        self._dirty: dict[int, str | None] = {}
+        self._write_task: asyncio.Task | None = None
+        # স্টেট লোড ব্যর্থ হওয়া ইউজার: মেমোরির (খালি বা আংশিক) স্টেট দিয়ে ডাটাবেসের সারি মুছে/বদলে না দেওয়ার জন্য
+        # সফল লোড না হওয়া পর্যন্ত এদের কোনো কিছু লেখা হয় না
+        self._load_failed: set[int] = set()
+
+    @staticmethod
+    def _serialize(user_data: dict) -> str:
+        state = {key: user_data[key] for key in PERSISTED_USER_KEYS if key in user_data}
+        return json.dumps(state, ensure_ascii=False, sort_keys=True, default=_json_default)
+
+    async def get_user_data(self) -> dict:
+        return {} # লেজি লোড, refresh_user_data দেখুন
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        task = self._loads.get(user_id)
+        if task is None:
+            task = self._loads[user_id] = asyncio.create_task(self._load(user_id, user_data))
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            self._loads.pop(user_id, None) # পরের আপডেটে আবার চেষ্টা
+            self._load_failed.add(user_id)
+            print(f"⚠️ user_id {user_id} এর সংরক্ষিত স্টেট লোড করা যায়নি (লোড না হওয়া পর্যন্ত সেভ বন্ধ): {e}")
+
+    async def _load(self, user_id: int, user_data: dict):
+        stored = await asyncio.to_thread(load_user_state_from_db, user_id)
+        self._load_failed.discard(user_id)
+        if not stored:
+            return
+        self._saved[user_id] = json.dumps(stored, ensure_ascii=False, sort_keys=True)
+        if 'pending_quiz_data' in stored:
+            stored['pending_quiz_data'] = [QuizQuestion.from_dict(question) for question in stored['pending_quiz_data']]
+        for key, value in stored.items():
+            user_data.setdefault(key, value) # লোডের আগেই মেমোরিতে বদলানো মান বহাল থাকে
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        if user_id in self._load_failed:
+            return # ডাটাবেসের স্টেট এখনো পড়া যায়নি; লিখলে সেটি হারিয়ে যেত
+        snapshot = self._serialize(data)
+        if user_id not in self._dirty and self._saved.get(user_id) == snapshot:
+            return # কিছু বদলায়নি
+        self._dirty[user_id] = snapshot
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loads.pop(user_id, None)
+        if user_id in self._load_failed:
+            return # ডাটাবেসের স্টেট কখনো লোড হয়নি, তাই সেটি মোছা হয় না
+        self._dirty[user_id] = None
+        self._schedule_write()
+
+    def _schedule_write(self):
+        # একই পারসিস্টেন্স রাউন্ডের সব update_user_data কল শেষ হওয়ার পরে একবারে লেখা হয়
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write())
+
+    async def _write(self):
+        await asyncio.sleep(0)
+        batch, self._dirty = self._dirty, {}
+        if not batch:
+            return
+        if await asyncio.to_thread(save_user_states_to_db, batch):
+            for user_id, data in batch.items():
+                if data is None:
+                    self._saved.pop(user_id, None)
+                else:
+                    self._saved[user_id] = data
+        else:
+            for user_id, data in batch.items():
+                self._dirty.setdefault(user_id, data) # পরের রাউন্ডে আবার চেষ্টা (নতুন পরিবর্তন থাকলে সেটিই)
+
+    async def flush(self) -> None:
+        if self._write_task is not None:
+            await self._write_task
+        if self._dirty:
+            await self._write()
+
+    # --- এই বট chat_data, bot_data, callback_data বা ConversationHandler ব্যবহার করে না ---
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+# --- নতুন: মাল্টি-ওয়ার্কার মোড (user_id অনুযায়ী শার্ডিং এবং ওয়ার্কার লিজ) ---
+# প্রতিটি ইউজারের আপডেট সবসময় একই ওয়ার্কারে যায় (user_id % WORKER_COUNT), তাই তার বাফার ও টাইমার সেখানেই থাকে।
+# অন্য ওয়ার্কারে আসা আপডেট HTTP দিয়ে মালিক ওয়ার্কারে ফরোয়ার্ড হয়; মালিক সাড়া না দিলে আপডেটটি বাদ যায় এবং
+# ইউজারকে কিছুক্ষণ পরে আবার পাঠাতে বলা হয় (অন্য শার্ডের আপডেট কখনো এখানে প্রসেস হয় না)।
+# ডাটাবেসের লিজ নিশ্চিত করে যে একজন ইউজারের সাবমিশন বা একটি পোস্টিং জব একসাথে একটিমাত্র ওয়ার্কার চালায়।
+@timed_db
+def acquire_lease_in_db(lease_key: str, worker: str, ttl: float) -> bool | None:
+    """লিজ খালি, মেয়াদোত্তীর্ণ বা আগে থেকেই এই ওয়ার্কারের হলে নেয়/নবায়ন করে। ডাটাবেস এররে None।"""
+    conn = get_db_connection()
+    if conn is None: return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO worker_leases (lease_key, worker, expires_at)
+                VALUES (%s, %s, NOW() + make_interval(secs => %s))
+                ON CONFLICT (lease_key) DO UPDATE SET worker = EXCLUDED.worker, expires_at = EXCLUDED.expires_at
+                WHERE worker_leases.expires_at < NOW() OR worker_leases.worker = EXCLUDED.worker
+                RETURNING worker;
+            """, (lease_key, worker, ttl))
+            acquired = cur.fetchone() is not None
+            conn.commit()
+            return acquired
+    except Exception as e:
+        print(f"❌ লিজ '{lease_key}' নিতে সমস্যা: {e}")
+        conn.rollback()
+        return None
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def release_lease_in_db(lease_key: str, worker: str):
+    conn = get_db_connection()
+    if conn is None: return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM worker_leases WHERE lease_key = %s AND worker = %s", (lease_key, worker))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ লিজ '{lease_key}' ছাড়তে সমস্যা: {e}")
+    finally:
+        release_db_connection(conn)
+
+@contextlib.asynccontextmanager
+async def worker_lease(lease_key: str):
+    """
+    লিজ পাওয়া গেলে True দিয়ে ব্লকটি চালায় এবং চলাকালীন নিয়মিত নবায়ন করে; অন্য ওয়ার্কারের হাতে থাকলে False।
+    এক-প্রসেস মোডে কোনো ডাটাবেস কল হয় না। ডাটাবেস এররে কাজ আটকে না রেখে এগিয়ে যাওয়া হয়
+    (রাউটিং আগেই ইউজারকে একটি ওয়ার্কারে রাখে, লিজ শুধু অতিরিক্ত নিরাপত্তা)।
+    """
+    if not MULTI_WORKER:
+        yield True
+        return
+    acquired = await asyncio.to_thread(acquire_lease_in_db, lease_key, WORKER_NAME, WORKER_LEASE_TTL)
+    if acquired is False:
+        yield False
+        return
+    if acquired is None:
+        print(f"⚠️ লিজ '{lease_key}' যাচাই করা যায়নি, লিজ ছাড়াই চালানো হচ্ছে।")
+
+    async def renew():
+        while True:
+            await asyncio.sleep(WORKER_LEASE_TTL / 3)
+            if await asyncio.to_thread(acquire_lease_in_db, lease_key, WORKER_NAME, WORKER_LEASE_TTL) is False:
+                print(f"⚠️ লিজ '{lease_key}' অন্য ওয়ার্কারের হাতে চলে গেছে।")
+
+    renew_task = asyncio.create_task(renew())
+    try:
+        yield True
+    finally:
+        renew_task.cancel()
+        await asyncio.to_thread(release_lease_in_db, lease_key, WORKER_NAME)
+
+def owner_worker(user_id: int | None) -> int:
+    """এই ইউজারের আপডেট কোন ওয়ার্কার প্রসেস করবে (ইউজার ছাড়া আপডেট যে পেয়েছে সে-ই)।"""
+    if user_id is None or not MULTI_WORKER:
+        return WORKER_INDEX
+    return user_id % WORKER_COUNT
+
+class UpdateRouter:
+    """অন্য ওয়ার্কারের ইউজারের আপডেট তার /internal/update রুটে পাঠায়।"""
+
+    def __init__(self, worker_urls: list[str], secret: str, timeout: float = 10):
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+
+    async def forward(self, update: telegram.Update, worker: int) -> bool:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        try:
+            response = await self._client.post(
+                f"{self.worker_urls[worker]}{INTERNAL_UPDATE_PATH}",
+                content=update.to_json().encode("utf-8"),
+                headers={"Content-Type": "application/json", "X-Worker-Secret": self.secret},
+            )
+            if response.status_code == 200:
+                return True
+            print(f"⚠️ ওয়ার্কার {worker} আপডেট নেয়নি (HTTP {response.status_code})।")
+        except httpx.HTTPError as e:
+            print(f"⚠️ ওয়ার্কার {worker}-এ আপডেট ফরোয়ার্ড করা যায়নি: {e}")
+        return False
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class ShardedUpdateProcessor(BaseUpdateProcessor):
+    """নিজের শার্ডের আপডেট প্রসেস করে, অন্যগুলো মালিক ওয়ার্কারে ফরোয়ার্ড করে।"""
+
+    def __init__(self, max_concurrent_updates: int, router: UpdateRouter):
+        super().__init__(max_concurrent_updates)
+        self.router = router
+
+    async def do_process_update(self, update, coroutine) -> None:
+        user = update.effective_user if isinstance(update, telegram.Update) else None
+        worker = owner_worker(user.id if user else None)
+        if worker != WORKER_INDEX:
+            forwarded = await self.router.forward(update, worker)
+            coroutine.close() # মালিক ওয়ার্কার প্রসেস করবে, অথবা আপডেটটি বাদ যাবে
+            if not forwarded:
+                # এখানে প্রসেস করা যায় না: চ্যানেল ও ইউজার স্টেটের ক্যাশ প্রতিটি প্রসেসে আলাদা, তাই অন্য শার্ডে
+                # হওয়া পরিবর্তন মালিক ওয়ার্কার ফিরে এলে তার পুরানো ক্যাশে দেখা যেত না। ইউজারকে আবার পাঠাতে বলা হয়।
+                print(f"⚠️ ওয়ার্কার {worker} পাওয়া যায়নি, user_id {user.id} এর আপডেট বাদ দেওয়া হলো।")
+                if update.effective_chat is not None:
+                    with contextlib.suppress(Exception):
+                        await update.get_bot().send_message(
+                            chat_id=update.effective_chat.id,
+                            text="⚠️ বট এই মুহূর্তে আপনার অনুরোধ নিতে পারছে না। কয়েক সেকেন্ড পরে মেসেজটি আবার পাঠান।",
+                        )
+            return
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        await self.router.close()
+
+# --- নতুন: AI এক্সট্র্যাকশনের ফলাফলের ক্যাশ (content-addressed) ---
+# একই টেক্সট আবার পাঠালে (যেমন /cancel এর পরে) জেমিনি আবার কল না করে আগের ফলাফল দেওয়া হয়।
+# দুটি স্তর: মেমোরিতে LRU (TTL সহ) এবং ডাটাবেসের ai_cache টেবিল (রিস্টার্টের পরেও থাকে)।
+def normalize_ai_input(text: str) -> str:
+    """ক্যাশ কী-এর জন্য টেক্সট স্বাভাবিক করে: ইউনিকোড NFC, প্রতিটি লাইনের বাড়তি স্পেস ও ফাঁকা লাইন বাদ।"""
+    text = unicodedata.normalize("NFC", text)
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def ai_cache_key(text: str) -> str:
+    payload = f"{PROMPT_VERSION}\n{normalize_ai_input(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@timed_db
+def get_ai_cache_from_db(cache_key: str) -> list | None:
+    conn = get_db_connection()
+    if conn is None: return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT questions FROM ai_cache WHERE cache_key = %s AND created_at > NOW() - make_interval(secs => %s)",
+                (cache_key, AI_CACHE_DB_TTL),
+            )
+            result = cur.fetchone()
+            if result:
+                return result[0] # JSONB কলাম psycopg2 সরাসরি list হিসেবে দেয়
+            return None
+    except Exception as e:
+        print(f"❌ AI ক্যাশ পড়াতে সমস্যা: {e}")
+        return None
+    finally:
+        release_db_connection(conn)
+
+@timed_db
+def save_ai_cache_to_db(cache_key: str, questions: list):
+    conn = get_db_connection()
+    if conn is None: return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ai_cache (cache_key, prompt_version, questions, created_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (cache_key) DO UPDATE SET questions = EXCLUDED.questions, created_at = NOW();
+            """, (cache_key, PROMPT_VERSION, json.dumps(questions, ensure_ascii=False)))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ AI ক্যাশ সেভ করতে সমস্যা: {e}")
+    finally:
+        release_db_connection(conn)
+
+class AIResultCache:
+    """মেমোরি (LRU + TTL) এবং ডাটাবেস — দুই স্তরের ক্যাশ, হিট/মিস কাউন্টার সহ।"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[str, tuple[float, list]] = collections.OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _get_from_memory(self, cache_key: str) -> list | None:
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        expires_at, questions = entry
+        if expires_at < time.monotonic():
+            del self._entries[cache_key]
+            return None
+        self._entries.move_to_end(cache_key) # সম্প্রতি ব্যবহৃত
+        return questions
+
+    def _put_in_memory(self, cache_key: str, questions: list):
+        self._entries[cache_key] = (time.monotonic() + self.ttl, questions)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # সবচেয়ে পুরানোটি বাদ
+
+    async def get(self, text: str) -> list | None:
+        cache_key = ai_cache_key(text)
+        questions = self._get_from_memory(cache_key)
+        if questions is not None:
+            self.memory_hits += 1
+            return copy.deepcopy(questions)
+        questions = await asyncio.to_thread(get_ai_cache_from_db, cache_key)
+        if isinstance(questions, list):
+            self.db_hits += 1
+            self._put_in_memory(cache_key, questions)
+            return copy.deepcopy(questions)
+        self.misses += 1
+        return None
+
+    async def put(self, text: str, questions: list):
+        if not questions: # খালি ফলাফল ক্যাশ করা হয় না (AI হয়তো সাময়িক ভুল করেছে)
+            return
+        cache_key = ai_cache_key(text)
+        self._put_in_memory(cache_key, copy.deepcopy(questions))
+        await asyncio.to_thread(save_ai_cache_to_db, cache_key, questions)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+# --- নতুন: একাধিক জেমিনি মডেলের রাউটার (হেজড রিকোয়েস্ট + সার্কিট ব্রেকার) ---
+# প্রাইমারি মডেল তার সাম্প্রতিক p95 সময়ের মধ্যে উত্তর না দিলে পরের মডেলেও একই রিকোয়েস্ট যায় (hedge),
+# যেটি আগে সফল হয় সেটির ফলাফল নেওয়া হয়। পরপর কয়েকবার ব্যর্থ হওয়া মডেলের সার্কিট কিছুক্ষণের জন্য খোলা থাকে,
+# তখন রিকোয়েস্ট অপেক্ষা না করেই পরের মডেলে যায়।
+class AIModelUnavailableError(Exception):
+    """সব মডেলের সার্কিট খোলা থাকলে এই এক্সেপশন দেওয়া হয়।"""
+
+class ModelHealth:
+    """একটি মডেলের সাম্প্রতিক লেটেন্সি, এরর রেট এবং সার্কিট ব্রেকারের অবস্থা (থ্রেড-সেফ)।"""
+
+    def __init__(self, name: str, window: int = 100):
+        self.name = name
+        self._latencies = {False: collections.deque(maxlen=window), True: collections.deque(maxlen=window)} # stream কিনা
+        self._outcomes: collections.deque = collections.deque(maxlen=window) # সাম্প্রতিক রিকোয়েস্ট সফল কিনা
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._trial_in_flight = False # half-open অবস্থায় ট্রায়াল রিকোয়েস্ট চলছে কিনা
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """রিকোয়েস্ট নেওয়া যাবে কিনা (শুধু দেখে; রিকোয়েস্ট পাঠানোর আগে acquire() ডাকতে হয়)।"""
+        with self._lock:
+            return time.monotonic() >= self._open_until and not self._trial_in_flight
+
+    def acquire(self) -> bool:
+        """
+        রিকোয়েস্ট পাঠানোর অনুমতি নেয়। কুলডাউন শেষ হলে সার্কিট "half-open": শুধু একটি ট্রায়াল রিকোয়েস্ট যায়,
+        record_success/record_failure না হওয়া পর্যন্ত বাকিরা False পায়; ট্রায়াল ব্যর্থ হলে সার্কিট আবার খুলে যায়।
+        """
+        with self._lock:
+            if time.monotonic() < self._open_until or self._trial_in_flight:
+                return False
+            if self._open_until:
+                self._trial_in_flight = True
+            return True
+
+    def p95(self, stream: bool = False) -> float | None:
+        with self._lock:
+            samples = sorted(self._latencies[stream])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def hedge_delay(self, stream: bool) -> float | None:
+        """হেজ পাঠানোর আগে কতক্ষণ অপেক্ষা (সাম্প্রতিক p95); যথেষ্ট নমুনা না থাকলে None (হেজ হবে না)।"""
+        with self._lock:
+            samples = len(self._latencies[stream])
+        if samples < AI_HEDGE_MIN_SAMPLES:
+            return None
+        return max(AI_HEDGE_MIN_DELAY, self.p95(stream))
+
+    def record_success(self, latency: float, stream: bool):
+        with self._lock:
+            self._latencies[stream].append(latency)
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            self._open_until = 0.0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._consecutive_failures < AI_CIRCUIT_FAILURES:
+                return
+            self._open_until = time.monotonic() + AI_CIRCUIT_COOLDOWN
+        AI_CIRCUIT_OPENED.inc(model=self.name)
+        print(f"🔌 মডেল '{self.name}' পরপর {self._consecutive_failures} বার ব্যর্থ; {AI_CIRCUIT_COOLDOWN:.0f} সেকেন্ড সার্কিট খোলা।")
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        return {
+            "requests": len(outcomes),
+            "error_rate": outcomes.count(False) / len(outcomes) if outcomes else 0.0,
+            "p95_s": self.p95(AI_STREAMING),
+            "circuit_open": not self.available(),
+        }
+
+class _StreamHandle:
+    """হেজ করা স্ট্রিম: আগে পাওয়া প্রথম টুকরোসহ বাকি স্ট্রিম দেয়; অন্য অ্যাট্রিবিউট (usage_metadata ইত্যাদি) মূল রেসপন্সের।"""
+
+    def __init__(self, response, iterator, first):
+        self._response = response
+        self._iterator = iterator
+        self._first = first
+
+    def __iter__(self):
+        yield self._first
+        yield from self._iterator
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+class ModelRouter:
+    """
+    কনফিগার করা মডেলগুলোর মধ্যে রিকোয়েস্ট রাউট করে। call(fn) AIWorkerPool-এর থ্রেড থেকে ডাকা হয়;
+    fn(model) একটি মডেলে generate_content চালায়। স্ট্রিমে হেজিং প্রথম টুকরো আসার সময় ধরে হয়।
+    """
+
+    def __init__(self, models: list[tuple[str, object]], hedge: bool = True):
+        self.models = models # (নাম, মডেল), অগ্রাধিকার অনুযায়ী
+        self.health = {name: ModelHealth(name) for name, _ in models}
+        self.hedge = hedge
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(4, AI_MAX_CONCURRENCY * 2 * len(models)), thread_name_prefix="ai-model"
+        )
+
+    def _attempt(self, name: str, model, fn, stream: bool):
+        started = time.perf_counter()
+        try:
+            response = fn(model)
+            if stream: # প্রথম টুকরো পর্যন্ত অপেক্ষা, যাতে ধীর/ভাঙা স্ট্রিম এখানেই ধরা পড়ে
+                iterator = iter(response)
+                first = next(iterator, None)
+                if first is not None:
+                    response = _StreamHandle(response, iterator, first)
+        except Exception:
+            self.health[name].record_failure()
+            AI_MODEL_SECONDS.observe(time.perf_counter() - started, model=name, outcome="error")
+            raise
+        elapsed = time.perf_counter() - started
+        self.health[name].record_success(elapsed, stream)
+        AI_MODEL_SECONDS.observe(elapsed, model=name, outcome="ok")
+        return response
+
+    def call(self, fn, stream: bool = False):
+        candidates = [(name, model) for name, model in self.models if self.health[name].available()]
+        if not candidates:
+            raise AIModelUnavailableError("সব AI মডেলের সার্কিট এখন খোলা")
+        pending: dict[concurrent.futures.Future, str] = {}
+        next_index = 0
+        last_error: Exception | None = None
+
+        def launch() -> str | None:
+            # পরের যে মডেল অনুমতি দেয় তাতে পাঠায় (half-open মডেলের ট্রায়াল অন্য কেউ নিয়ে থাকলে সেটি বাদ)
+            nonlocal next_index
+            while next_index < len(candidates):
+                name, model = candidates[next_index]
+                next_index += 1
+                if self.health[name].acquire():
+                    pending[self._executor.submit(self._attempt, name, model, fn, stream)] = name
+                    return name
+            return None
+
+        if launch() is None:
+            raise AIModelUnavailableError("সব AI মডেলের সার্কিট এখন খোলা")
+        while pending:
+            # এখনও পরের মডেল বাকি থাকলে প্রাইমারির p95 পর্যন্ত অপেক্ষা, তারপর হেজ
+            delay = None
+            if self.hedge and next_index < len(candidates):
+                delay = self.health[candidates[next_index - 1][0]].hedge_delay(stream)
+            done, _ = concurrent.futures.wait(pending, timeout=delay, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                slow = candidates[next_index - 1][0]
+                hedged = launch()
+                if hedged is not None:
+                    print(f"⏱️ মডেল '{slow}' {delay:.1f} সেকেন্ডে উত্তর দেয়নি, '{hedged}'-এ হেজ রিকোয়েস্ট।")
+                    AI_HEDGES.inc(model=hedged)
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    print(f"⚠️ মডেল '{name}' ব্যর্থ: {e}")
+                    continue
+                for loser in pending: # হেরে যাওয়া স্ট্রিম শেষ হলে বন্ধ করা (নন-স্ট্রিম কল এমনিই শেষ হয়)
+                    loser.add_done_callback(self._discard)
+                return result
+            if not pending and next_index < len(candidates):
+                launch() # ব্যর্থ হলে অপেক্ষা না করে পরের মডেলে
+        raise last_error or AIModelUnavailableError("সব AI মডেলের সার্কিট এখন খোলা")
+
+    @staticmethod
+    def _discard(future: concurrent.futures.Future):
+        with contextlib.suppress(Exception):
+            result = future.result()
+            close = getattr(getattr(result, "_iterator", None), "close", None)
+            if close is not None:
+                close()
+
+    def stats(self) -> dict[str, dict]:
+        return {name: self.health[name].stats() for name, _ in self.models}
+
+# --- AI দিয়ে প্রশ্ন জেনারেট করার ফাংশন (ডাইনামিক সাফিক্স সহ) ---
+# প্রতিটি প্রশ্ন অবজেক্টের কী-গুলোর বর্ণনা (একক ও ব্যাচ প্রম্পটে একই)
+AI_QUESTION_FIELDS = """\
+    1. "question": (স্ট্রিং) মূল প্রশ্নটি। (প্রশ্ন থেকে [SOT] বা [MAT 23-24] এর মতো ট্যাগ বাদ দিয়ে শুধু প্রশ্নটি বের করবে)।
+    2. "options": (লিস্ট) অপশনগুলোর লিস্ট (সর্বোচ্চ ১০টি)।
+    3. "correct_option_index": (সংখ্যা) সঠিক অপশনের ইনডেক্স (0 থেকে শুরু)।
+    4. "explanation": (স্ট্রিং) সঠিক উত্তরের একটি সংক্ষিপ্ত ব্যাখ্যা। যদি ব্যাখ্যা খুঁজে না পাও, তবে এর মান `null` দাও।
+    5. "suffix": (স্ট্রিং) প্রশ্নের লাইনের শেষে যদি [ব্র্যাকেটের মধ্যে] কোনো ট্যাগ (যেমন [MAT 23-24] বা [PHY-22]) থাকে, তবে সেটি এখানে হুবহু যুক্ত করো। যদি এমন কোনো ট্যাগ না থাকে, তবে এর মান `null` দাও।"""
+
+# প্রম্পটের স্থির অংশ (নির্দেশনা ও উদাহরণ) আগে, ইউজারের টেক্সট একদম শেষে; ফলে সব কলের শুরুটা হুবহু এক থাকে
+# (জেমিনির নিজস্ব প্রিফিক্স ক্যাশিং শুধু বড় প্রম্পটে কাজ করে; এই প্রিফিক্স তার সর্বনিম্ন আকারের চেয়ে অনেক ছোট)
+AI_PROMPT_PREFIX = f"""
+    তুমি একজন দক্ষ টেলিগ্রাম বট। তোমার কাজ হলো শেষে দেওয়া টেক্সট থেকে শুধুমাত্র মাল্টিপল চয়েস প্রশ্ন (MCQ) বের করা।
+    তোমার উত্তর অবশ্যই একটি JSON লিস্ট ফরম্যাটে হতে হবে। প্রতিটি অবজেক্টে ৫টি কী থাকবে:
+{AI_QUESTION_FIELDS}
+
+    JSON আউটপুট উদাহরণ:
+    [
+      {{
+        "question": "বাংলাদেশের রাজধানীর নাম কি?",
+        "options": ["ঢাকা", "চট্টগ্রাম", "খুলনা", "রাজাহী"],
+        "correct_option_index": 0,
+        "explanation": "ঢাকা বাংলাদেশের রাজধানী ও বৃহত্তম শহর।",
+        "suffix": "[MAT 23-24]"
+      }},
+      {{
+        "question": "সূর্য কোন দিকে ওঠে?",
+        "options": ["উত্তর", "দক্ষিণ", "পূর্ব", "পশ্চিম"],
+        "correct_option_index": 2,
+        "explanation": null,
+        "suffix": null
+      }}
+    ]
+"""
+
+AI_BATCH_PROMPT_PREFIX = f"""
+    তুমি একজন দক্ষ টেলিগ্রাম বট। শেষে কয়েকটি আলাদা টেক্সট অংশ আছে, প্রতিটি "=== অংশ N শুরু ===" এবং "=== অংশ N শেষ ===" দিয়ে চিহ্নিত।
+    প্রতিটি অংশ থেকে আলাদাভাবে শুধুমাত্র মাল্টিপল চয়েস প্রশ্ন (MCQ) বের করো; এক অংশের প্রশ্ন অন্য অংশে দেবে না।
+    তোমার উত্তর অবশ্যই একটি JSON অবজেক্ট হতে হবে, যার কী হলো অংশের নম্বর (স্ট্রিং হিসেবে, যেমন "1") এবং মান হলো
+    সেই অংশের প্রশ্নগুলোর JSON লিস্ট (কোনো প্রশ্ন না পেলে খালি লিস্ট)। প্রতিটি প্রশ্ন অবজেক্টে ৫টি কী থাকবে:
+{AI_QUESTION_FIELDS}
+
+    JSON আউটপুট উদাহরণ:
+    {{
+      "1": [
+        {{
+          "question": "বাংলাদেশের রাজধানীর নাম কি?",
+          "options": ["ঢাকা", "চট্টগ্রাম", "খুলনা", "রাজাহী"],
+          "correct_option_index": 0,
+          "explanation": "ঢাকা বাংলাদেশের রাজধানী ও বৃহত্তম শহর।",
+          "suffix": "[MAT 23-24]"
+        }}
+      ],
+      "2": []
+    }}
+"""
+
+class PromptCompiler:
+    """
+    AI প্রম্পটের স্থির অংশ একবার তৈরি করে রাখে; প্রতি কলে শুধু ইউজারের টেক্সট অংশটি যোগ হয়।
+    স্থির অংশের হ্যাশই প্রম্পটের ভার্সন, তাই প্রম্পট বদলালে AI ক্যাশ স্বয়ংক্রিয়ভাবে নতুন হয়ে যায়।
+    টোকেন সংখ্যা লোকালি অনুমান করা হয় (নেটওয়ার্ক কল ছাড়া) এবং জেমিনির usage_metadata দেখে অনুমানটি ঠিক করা হয়।
+    """
+    ASCII_CHARS_PER_TOKEN = 4
+    OTHER_CHARS_PER_TOKEN = 2 # বাংলা ইত্যাদি
+
+    def __init__(self, prefix: str, batch_prefix: str):
+        self.prefix = prefix
+        self.batch_prefix = batch_prefix
+        self.version = hashlib.sha256(f"{prefix}\0{batch_prefix}".encode("utf-8")).hexdigest()[:12]
+        self._token_ratio = 1.0 # আসল / অনুমিত টোকেন (usage_metadata থেকে ধীরে ধীরে ঠিক হয়)
+        self._lock = threading.Lock()
+        self.prefix_tokens = self.estimate_tokens(prefix)
+        self.batch_prefix_tokens = self.estimate_tokens(batch_prefix)
+
+    def _raw_estimate(self, text: str) -> float:
+        ascii_chars = len(text.encode("ascii", "ignore"))
+        return ascii_chars / self.ASCII_CHARS_PER_TOKEN + (len(text) - ascii_chars) / self.OTHER_CHARS_PER_TOKEN
+
+    def estimate_tokens(self, text: str) -> int:
+        return int(self._raw_estimate(text) * self._token_ratio) + 1
+
+    @staticmethod
+    def user_part(text: str) -> str:
+        return f"""
+    টেক্সট:
+    ---
+    {text}
+    ---
+    """
+
+    def build(self, text: str) -> str:
+        return self.prefix + self.user_part(text)
+
+    def build_batch(self, texts: list[str]) -> str:
+        sections = "\n\n".join(
+            f"=== অংশ {number} শুরু ===\n{text}\n=== অংশ {number} শেষ ===" for number, text in enumerate(texts, start=1)
+        )
+        return f"{self.batch_prefix}\n    টেক্সট অংশগুলো ({len(texts)} টি):\n{sections}\n"
+
+    def generate(self, ai_model, text: str, stream: bool = False):
+        """একক টেক্সটের জন্য generate_content কল; (রেসপন্স, অনুমিত ইনপুট টোকেন) ফেরত দেয়।"""
+        estimated = self.prefix_tokens + self.estimate_tokens(text)
+        prompt = self.build(text)
+        return _call_model(ai_model, lambda model: model.generate_content(prompt, stream=stream), stream), estimated
+
+    def generate_batch(self, ai_model, texts: list[str]):
+        estimated = self.batch_prefix_tokens + sum(self.estimate_tokens(text) for text in texts)
+        prompt = self.build_batch(texts)
+        return _call_model(ai_model, lambda model: model.generate_content(prompt), False), estimated
+
+    def record_usage(self, response, mode: str, estimated: int):
+        """রেসপন্সের usage_metadata থেকে ইনপুট/আউটপুট টোকেন লগ করে এবং টোকেন অনুমান ঠিক করে।"""
+        try:
+            usage = response.usage_metadata
+            prompt_tokens = usage.prompt_token_count
+            output_tokens = usage.candidates_token_count
+            cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+        except Exception:
+            return # ফেক/পুরানো রেসপন্সে usage_metadata থাকে না
+        if not prompt_tokens:
+            return
+        AI_TOKENS.inc(prompt_tokens, direction="in")
+        AI_TOKENS.inc(output_tokens or 0, direction="out")
+        AI_TOKENS.inc(cached_tokens, direction="cached")
+        print(f"🔢 AI টোকেন ({mode}): ইনপুট {prompt_tokens} (ক্যাশড {cached_tokens}, অনুমান {estimated}), আউটপুট {output_tokens}")
+        with self._lock: # ধীরে ধীরে আসল অনুপাতের দিকে সরানো, একটি অস্বাভাবিক রেসপন্সে বেশি না বদলায়
+            ratio = self._token_ratio * prompt_tokens / max(estimated, 1)
+            self._token_ratio = min(4.0, max(0.25, 0.8 * self._token_ratio + 0.2 * ratio))
+
+def _call_model(ai_model, fn, stream: bool):
+    """ai_model রাউটার হলে রাউটারের মাধ্যমে (হেজিং/সার্কিট ব্রেকার সহ), না হলে সরাসরি fn(ai_model)।"""
+    if isinstance(ai_model, ModelRouter):
+        return ai_model.call(fn, stream)
+    return fn(ai_model)
+
+PROMPTS = PromptCompiler(AI_PROMPT_PREFIX, AI_BATCH_PROMPT_PREFIX)
+PROMPT_VERSION = PROMPTS.version # AI ক্যাশ কী-এর অংশ
+
+# --- নতুন: AI ক্লায়েন্ট তৈরি ও ওয়ার্ম-আপ ---
+def build_ai_model(api_key: str) -> ModelRouter:
+    """জেমিনি কনফিগার করে AI_MODELS থেকে রাউটার বানায় (এখানেই প্রথমবার google.generativeai ইম্পোর্ট হয়)।"""
+    genai.configure(api_key=api_key)
+    generation_config = genai.GenerationConfig(response_mime_type="application/json")
+    models = [(name, genai.GenerativeModel(name, generation_config=generation_config)) for name in AI_MODELS]
+    ai_model = ModelRouter(models, hedge=AI_HEDGE)
+    print(f"✅ Gemini AI সফলভাবে কনফিগার করা হয়েছে (JSON মোডে, মডেল: {', '.join(AI_MODELS)})।")
+    return ai_model
+
+def warm_up_ai(bot_data: dict, api_key: str):
+    """
+    ব্যাকগ্রাউন্ড থ্রেডে AI রাউটার বানিয়ে bot_data-তে রাখে। তারপর আলাদা থ্রেডে প্রাইমারি মডেলে একটি count_tokens
+    কল করে জেমিনি ক্লায়েন্ট ও কানেকশন আগেই তৈরি করে রাখে, যাতে প্রথম AI কলে এই খরচ না পড়ে।
+    """
+    with STARTUP.phase("ai_warmup"):
+        try:
+            bot_data['ai_model'] = ai_model = build_ai_model(api_key)
+        except Exception as e:
+            print(f"❌ Gemini AI কনফিগারেশনে সমস্যা: {e}")
+            stop_bot("Gemini AI কনফিগার করা যায়নি")
+            raise
+    threading.Thread(target=_ping_ai_model, args=(ai_model,), name="ai-warmup-ping", daemon=True).start()
+
+def _ping_ai_model(ai_model: ModelRouter):
+    name, model = ai_model.models[0]
+    try:
+        with STARTUP.phase("ai_connect"):
+            # retry=None: লাইব্রেরির ডিফল্ট রিট্রাই ৬০ সেকেন্ড পর্যন্ত চলে, ওয়ার্ম-আপে একবার চেষ্টাই যথেষ্ট
+            model.count_tokens("ping", request_options={"timeout": AI_WARMUP_TIMEOUT, "retry": None})
+    except Exception as e:
+        if is_ai_auth_error(e):
+            print(f"❌ {name} মডেল API কী গ্রহণ করেনি: {e}")
+            stop_bot("GEMINI_API_KEY সঠিক নয়")
+            return
+        print(f"⚠️ {name} মডেলে ওয়ার্ম-আপ কল ব্যর্থ (প্রথম AI কলে কানেকশন তৈরি হবে): {e}")
+
+def is_ai_auth_error(error: Exception) -> bool:
+    """ভুল/বাতিল API কী (জেমিনি এটিকে InvalidArgument "API key not valid" হিসেবেও দেয়)।"""
+    if isinstance(error, (api_exceptions.PermissionDenied, api_exceptions.Unauthenticated)):
+        return True
+    return isinstance(error, api_exceptions.InvalidArgument) and "API key" in str(error)
+
+def stop_bot(reason: str):
+    """
+    ব্যাকগ্রাউন্ড ওয়ার্ম-আপ থেকে বট বন্ধ করে, আগের সিকোয়েনশিয়াল স্টার্টআপে main() থেকে ফিরে যাওয়ার মতোই।
+    run_polling ও run_webhook দুটোই SIGTERM পেলে স্বাভাবিকভাবে (শাটডাউন হুক সহ) বন্ধ হয়, তাই যেকোনো থ্রেড থেকে ডাকা যায়।
+    """
+    print(f"---❌ ERROR: {reason}, বট বন্ধ করা হচ্ছে !!!---")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+async def get_ai_model(bot_data: dict):
+    """AI রাউটার দেয়; ব্যাকগ্রাউন্ড ওয়ার্ম-আপ তখনও চললে শেষ হওয়া পর্যন্ত অপেক্ষা করে (ব্যর্থ হলে None)।"""
+    ai_model = bot_data.get('ai_model')
+    warmup: concurrent.futures.Future | None = bot_data.get('ai_warmup')
+    if ai_model is None and warmup is not None:
+        with contextlib.suppress(Exception):
+            await asyncio.shield(asyncio.wrap_future(warmup))
+        ai_model = bot_data.get('ai_model')
+    return ai_model
+
+def get_questions_from_ai(text, ai_model):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response, estimated = PROMPTS.generate(ai_model, text)
+        PROMPTS.record_usage(response, "single", estimated)
+        if not response.parts:
+            print(f"⚠️ AI রেসপন্স ব্লকড। কারণ: {response.prompt_feedback}")
+            outcome = "blocked"
+            return None
+        json_data = json.loads(response.text)
+        outcome = "ok"
+        return json_data
+    except AIModelUnavailableError as e:
+        print(f"⚠️ {e}")
+        outcome = "unavailable"
+        return None
+    except Exception as e:
+        print(f"❌ AI বা JSON পার্সিং-এ অজানা সমস্যা: {e}")
+        # --- বিস্তারিত এরর দেখানোর জন্য ---
+        traceback.print_exc()
+        # -------------------------------
+        return None
+    finally:
+        AI_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="single", outcome=outcome)
+
+# --- নতুন: স্ট্রিমিং AI রেসপন্সের জন্য ইনক্রিমেন্টাল JSON অ্যারে পার্সার ---
+class IncrementalJSONArrayParser:
+    """
+    টুকরো টুকরো আসা টেক্সট থেকে একটি JSON অ্যারের প্রতিটি অবজেক্ট সম্পূর্ণ হওয়ামাত্র বের করে।
+    শুধু বর্তমান অবজেক্টের টেক্সট মেমোরিতে রাখা হয়।
+    """
+
+    def __init__(self):
+        self._in_array = False
+        self._depth = 0 # অ্যারের ভেতরে অবজেক্টের গভীরতা
+        self._in_string = False
+        self._escape = False
+        self._current: list[str] = []
+        self.invalid_objects = 0 # JSON হিসেবে পার্স করা যায়নি এমন অবজেক্ট
+
+    def feed(self, text: str) -> list:
+        """নতুন টেক্সট যোগ করে; এই টুকরোতে সম্পূর্ণ হওয়া অবজেক্টগুলো ফেরত দেয়।"""
+        completed = []
+        start = 0 if self._depth else None # বর্তমান অবজেক্ট এই টুকরোর কোথা থেকে শুরু
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if not self._in_array:
+                if char == "[":
+                    self._in_array = True
+                continue
+            if char == '"' and self._depth:
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    start = i
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._current.append(text[start:i + 1])
+                    raw_object = "".join(self._current)
+                    self._current = []
+                    start = None
+                    try:
+                        completed.append(json.loads(raw_object))
+                    except ValueError:
+                        self.invalid_objects += 1
+        if self._depth and start is not None:
+            self._current.append(text[start:]) # অসম্পূর্ণ অবজেক্ট পরের টুকরোর জন্য রাখা
+        return completed
+
+def is_valid_question_record(record) -> bool:
+    """AI থেকে আসা একটি প্রশ্ন অবজেক্টের গঠন ঠিক আছে কিনা (প্রশ্ন, ২-১০টি অপশন, বৈধ ইনডেক্স)।"""
+    if not isinstance(record, dict):
+        return False
+    question = record.get("question")
+    options = record.get("options")
+    index = record.get("correct_option_index")
+    return (
+        isinstance(question, str) and bool(question.strip())
+        and isinstance(options, list) and 2 <= len(options) <= 10
+        and isinstance(index, int) and not isinstance(index, bool) and 0 <= index < len(options)
+    )
+
+def stream_questions_from_ai(text, ai_model, collected: list, on_question=None, stop_event: threading.Event | None = None) -> bool:
+    """
+    জেমিনির স্ট্রিমিং রেসপন্স থেকে প্রশ্নগুলো একটি একটি করে বের করে collected লিস্টে যোগ করে।
+    স্ট্রিম মাঝপথে ভেঙে গেলেও ততক্ষণে পাওয়া প্রশ্নগুলো collected-এ থেকে যায়।
+    সম্পূর্ণ রেসপন্স পাওয়া গেলে True, না হলে False ফেরত দেয়।
+    """
+    parser = IncrementalJSONArrayParser()
+    skipped = 0
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response, estimated = PROMPTS.generate(ai_model, text, stream=True)
+        for chunk in response:
+            if stop_event is not None and stop_event.is_set():
+                outcome = "cancelled"
+                return False # বাতিল বা টাইমআউট
+            if not chunk.parts:
+                print(f"⚠️ AI রেসপন্স ব্লকড। কারণ: {getattr(response, 'prompt_feedback', None)}")
+                outcome = "blocked"
+                return False
+            for record in parser.feed(chunk.text):
+                if not is_valid_question_record(record):
+                    skipped += 1
+                    continue
+                collected.append(record)
+                if on_question is not None:
+                    on_question(record)
+        PROMPTS.record_usage(response, "stream", estimated)
+        if parser.invalid_objects or skipped:
+            print(f"⚠️ স্ট্রিমিং AI রেসপন্সে {parser.invalid_objects + skipped} টি অবৈধ প্রশ্ন বাদ দেওয়া হয়েছে।")
+        outcome = "ok"
+        return True
+    except AIModelUnavailableError as e:
+        print(f"⚠️ {e}")
+        outcome = "unavailable"
+        return False
+    except Exception as e:
+        print(f"❌ AI স্ট্রিম মাঝপথে ভেঙে গেছে ({len(collected)} টি প্রশ্ন পাওয়া গেছে): {e}")
+        traceback.print_exc()
+        return False
+    finally:
+        AI_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="stream", outcome=outcome)
+
+# --- নতুন: AI এক্সিকিউশন লেয়ার (ইভেন্ট লুপ ব্লক না করে জেমিনি কল করার জন্য) ---
+class AIQueueFullError(Exception):
+    """AI কিউ পূর্ণ থাকলে এই এক্সেপশন দেওয়া হয়।"""
+
+class AIInputTooLargeError(Exception):
+    """সাবমিশনের অনুমিত টোকেন AI_MAX_INPUT_TOKENS ছাড়ালে এই এক্সেপশন দেওয়া হয়।"""
+
+class AIRequestCancelled(Exception):
+    """ব্যবহারকারী /cancel দিলে চলমান/অপেক্ষমাণ AI রিকোয়েস্ট এই এক্সেপশন দেয়।"""
+
+class AIWorkerPool:
+    """
+    সিনক্রোনাস generate_content() কলগুলো একটি নির্দিষ্ট থ্রেড পুলে চালায়।
+    একসাথে সর্বোচ্চ max_concurrency টি কল চলে, বাকিগুলো কিউতে অপেক্ষা করে (সর্বোচ্চ max_queue টি)।
+    প্রতিটি রিকোয়েস্টের টাইমআউট আছে এবং ইউজার /cancel দিলে তার রিকোয়েস্ট বাতিল হয়।
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="ai-worker"
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0 # কিউতে অপেক্ষমাণ রিকোয়েস্টের সংখ্যা
+        self._user_tasks: dict[int, set[asyncio.Task]] = {}
+        self._cancelled_tasks: set[asyncio.Task] = set()
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    async def run(self, user_id: int, func, *args):
+        """func(*args) থ্রেড পুলে চালায় এবং ফলাফল ফেরত দেয়।"""
+        if self._waiting >= self.max_queue:
+            raise AIQueueFullError(f"AI কিউ পূর্ণ ({self._waiting} টি রিকোয়েস্ট অপেক্ষমাণ)")
+        self._waiting += 1
+        dequeued = False
+
+        def leave_queue():
+            nonlocal dequeued
+            if not dequeued:
+                dequeued = True
+                self._waiting -= 1
+
+        try:
+            return await self._track(user_id, self._run_in_slot(leave_queue, func, *args))
+        finally:
+            leave_queue() # টাস্ক শুরু হওয়ার আগেই বাতিল হলে তার ভেতরের finally চলে না
+
+    async def wait_for_user(self, user_id: int, future: asyncio.Future):
+        """অন্য কোথাও চলা (যেমন ব্যাচ) কাজের ফলাফলের জন্য অপেক্ষা করে; ইউজার /cancel দিলে AIRequestCancelled দেয়।"""
+        try:
+            return await self._track(user_id, asyncio.shield(future))
+        except AIRequestCancelled:
+            future.cancel() # ব্যাচ শেষ হলে এই অংশের ফলাফল আর সেট করা হবে না
+            raise
+
+    async def _track(self, user_id: int, awaitable):
+        # আলাদা টাস্কে চালানো হচ্ছে, যাতে /cancel শুধু এই রিকোয়েস্টটি বাতিল করে
+        task = asyncio.ensure_future(awaitable)
+        self._user_tasks.setdefault(user_id, set()).add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._cancelled_tasks:
+                raise AIRequestCancelled(f"user_id {user_id} এর AI রিকোয়েস্ট বাতিল করা হয়েছে")
+            raise
+        finally:
+            self._cancelled_tasks.discard(task)
+            tasks = self._user_tasks.get(user_id)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del self._user_tasks[user_id]
+
+    async def _run_in_slot(self, leave_queue, func, *args):
+        try:
+            await self._slots.acquire()
+        finally:
+            leave_queue()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # টাইমআউট/বাতিল হলেও থ্রেডটি নিজে শেষ না হওয়া পর্যন্ত স্লটটি দখলে থাকে,
+        # তাই একসাথে কখনো max_concurrency টির বেশি জেমিনি কল চলে না।
+        future.add_done_callback(lambda _: self._slots.release())
+        # টাইমআউট হলে থ্রেডের ফলাফল আর ব্যবহার করা হবে না
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+    def cancel_user(self, user_id: int) -> int:
+        """ইউজারের সব চলমান/অপেক্ষমাণ AI রিকোয়েস্ট বাতিল করে। বাতিল হওয়া রিকোয়েস্টের সংখ্যা ফেরত দেয়।"""
+        tasks = self._user_tasks.get(user_id, set())
+        count = 0
+        for task in tasks:
+            if not task.done():
+                self._cancelled_tasks.add(task)
+                task.cancel()
+                count += 1
+        return count
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+async def get_questions_from_ai_async(text, ai_model, ai_pool: AIWorkerPool, user_id: int):
+    """
+    get_questions_from_ai() কে AI পুলে চালায়।
+    টাইমআউট হলে None দেয়; কিউ পূর্ণ হলে AIQueueFullError, /cancel হলে AIRequestCancelled দেয়।
+    """
+    try:
+        return await ai_pool.run(user_id, get_questions_from_ai, text, ai_model)
+    except asyncio.TimeoutError:
+        print(f"❌ AI রিকোয়েস্ট টাইমআউট ({ai_pool.timeout} সেকেন্ড), user_id {user_id}")
+        return None
+
+async def stream_questions_from_ai_async(text, ai_model, ai_pool: AIWorkerPool, user_id: int,
+                                         on_progress=None) -> tuple[list, bool]:
+    """
+    stream_questions_from_ai() কে AI পুলে চালায়। প্রতিটি নতুন প্রশ্নে on_progress(1) ইভেন্ট লুপে ডাকা হয়।
+    (প্রশ্নের লিস্ট, সম্পূর্ণ কিনা) ফেরত দেয়; টাইমআউট বা স্ট্রিম ভাঙলেও পাওয়া প্রশ্নগুলো থাকে।
+    """
+    loop = asyncio.get_running_loop()
+    collected: list = []
+    stop_event = threading.Event()
+
+    def on_question(_record):
+        if on_progress is not None:
+            loop.call_soon_threadsafe(on_progress, 1)
+
+    try:
+        complete = await ai_pool.run(user_id, stream_questions_from_ai, text, ai_model, collected, on_question, stop_event)
+        return list(collected), complete
+    except asyncio.TimeoutError:
+        print(f"❌ AI স্ট্রিমিং টাইমআউট ({ai_pool.timeout} সেকেন্ড), user_id {user_id}; {len(collected)} টি প্রশ্ন রাখা হচ্ছে।")
+        return list(collected), False
+    finally:
+        stop_event.set() # থ্রেডটি যেন আর স্ট্রিম না পড়ে
+
+# --- নতুন: একাধিক ইউজারের ছোট সাবমিশন একটি AI কলে (ঐচ্ছিক ব্যাচিং মোড) ---
+# পরীক্ষার মৌসুমে অনেকে কয়েক সেকেন্ডের ব্যবধানে ৩-১০টি প্রশ্ন পাঠান; প্রতিটির জন্য পুরো প্রম্পট আলাদাভাবে না পাঠিয়ে
+# AI_BATCH_WINDOW সেকেন্ডের মধ্যে আসা অংশগুলো আলাদা চিহ্নিত সেকশনে একটি রিকোয়েস্টে যায় এবং ফলাফল ভাগ করে ফেরত দেওয়া হয়।
+def get_batched_questions_from_ai(texts: list[str], ai_model) -> list[list | None]:
+    """
+    একটি AI কলে সব অংশ প্রসেস করে, প্রতিটি অংশের প্রশ্নের লিস্ট (বা পাওয়া না গেলে None) ক্রমানুসারে ফেরত দেয়।
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response, estimated = PROMPTS.generate_batch(ai_model, texts)
+        PROMPTS.record_usage(response, "batched", estimated)
+        if not response.parts:
+            print(f"⚠️ ব্যাচ AI রেসপন্স ব্লকড। কারণ: {response.prompt_feedback}")
+            outcome = "blocked"
+            return [None] * len(texts)
+        data = json.loads(response.text)
+        if not isinstance(data, dict):
+            print("⚠️ ব্যাচ AI রেসপন্স JSON অবজেক্ট নয়।")
+            return [None] * len(texts)
+        results = []
+        for number in range(1, len(texts) + 1):
+            section = data.get(str(number))
+            results.append(section if isinstance(section, list) else None)
+        outcome = "ok"
+        return results
+    except AIModelUnavailableError as e:
+        print(f"⚠️ {e}")
+        outcome = "unavailable"
+        return [None] * len(texts)
+    except Exception as e:
+        print(f"❌ ব্যাচ AI বা JSON পার্সিং-এ সমস্যা: {e}")
+        traceback.print_exc()
+        return [None] * len(texts)
+    finally:
+        AI_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="batched", outcome=outcome)
+
+class AIBatcher:
+    """
+    window সেকেন্ডের মধ্যে আসা অংশগুলো জমিয়ে একটি AI কলে পাঠায়।
+    মোট অক্ষর max_chars বা অংশের সংখ্যা max_items ছাড়ালে অপেক্ষা না করেই পাঠানো হয়।
+    কোনো অংশের ফলাফল না পাওয়া গেলে None ফেরত যায়, এবং কলার সেটি আলাদাভাবে আবার চেষ্টা করে।
+    """
+    BATCH_OWNER = 0 # ব্যাচ কলটি কোনো একক ইউজারের নয়, তাই একজনের /cancel পুরো ব্যাচ বাতিল করে না
+
+    def __init__(self, window: float, max_chars: int, max_items: int):
+        self.window = window
+        self.max_chars = max_chars
+        self.max_items = max_items
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._pending_chars = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._target: tuple | None = None # (ai_model, ai_pool)
+        self._tasks: set[asyncio.Task] = set()
+
+    def accepts(self, text: str) -> bool:
+        return len(text) <= self.max_chars // 2 # বড় চাংক একাই যায়, ব্যাচে অন্যদের জায়গা থাকে না
+
+    async def submit(self, text: str, ai_model, ai_pool: AIWorkerPool, user_id: int) -> list | None:
+        if self._pending and self._pending_chars + len(text) > self.max_chars:
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self._target = (ai_model, ai_pool)
+        self._pending.append((text, future))
+        self._pending_chars += len(text)
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await ai_pool.wait_for_user(user_id, future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch, *self._target))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, asyncio.Future]], ai_model, ai_pool: AIWorkerPool):
+        batch = [(text, future) for text, future in batch if not future.done()] # /cancel হওয়াগুলো বাদ
+        if not batch:
+            return
+        AI_BATCH_SIZE.observe(len(batch))
+        texts = [text for text, _ in batch]
+        try:
+            if len(texts) == 1:
+                results = [await ai_pool.run(self.BATCH_OWNER, get_questions_from_ai, texts[0], ai_model)]
+            else:
+                print(f"📦 {len(texts)} টি অংশ একটি AI কলে পাঠানো হচ্ছে ({sum(map(len, texts))} অক্ষর)।")
+                results = await ai_pool.run(self.BATCH_OWNER, get_batched_questions_from_ai, texts, ai_model)
+        except asyncio.TimeoutError:
+            print(f"❌ ব্যাচ AI রিকোয়েস্ট টাইমআউট ({ai_pool.timeout} সেকেন্ড)।")
+            results = [None] * len(texts)
+        except Exception as e: # যেমন AIQueueFullError: প্রতিটি কলারের কাছে পৌঁছে দেওয়া হয়
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result if isinstance(result, list) else None)
+
+class ExtractionProgress:
+    """প্রসেসিং চলাকালীন ইউজারের স্ট্যাটাস মেসেজটি এডিট করে লাইভ অগ্রগতি দেখায় (খুব ঘন ঘন নয়)।"""
+
+    def __init__(self, message: telegram.Message | None, interval: float):
+        self.message = message
+        self.base_text = message.text if message is not None else ""
+        self.interval = interval
+        self.count = 0
+        self._last_edit = time.monotonic()
+        self._edit_task: asyncio.Task | None = None
+
+    def add(self, n: int = 1):
+        self.count += n
+        if self.message is None or (self._edit_task is not None and not self._edit_task.done()):
+            return
+        if time.monotonic() - self._last_edit >= self.interval:
+            self._last_edit = time.monotonic()
+            self._edit_task = asyncio.create_task(self._edit())
+
+    async def _edit(self):
+        try:
+            await self.message.edit_text(f"{self.base_text}\n⏳ এখন পর্যন্ত {self.count} টি প্রশ্ন পার্স হয়েছে…")
+        except Exception as e: # "message is not modified" ইত্যাদি এরর উপেক্ষা করা হয়
+            print(f"⚠️ অগ্রগতি মেসেজ এডিট করতে সমস্যা: {e}")
+
+# --- নতুন: লোকাল MCQ পার্সার (AI কল করার আগের ফাস্ট পাথ) ---
+# /start-এ দেখানো ফরম্যাটের প্রশ্নগুলো এখানেই পার্স হয়ে যায়; যেগুলো পার্স করা যায় না শুধু সেগুলো AI-তে যায়।
+OPTION_LETTERS = "কখগঘঙচছজঝঞ" # সর্বোচ্চ ১০টি অপশন (টেলিগ্রামের সীমা)
+_OPTION_RE = re.compile(rf"^\(([{OPTION_LETTERS}])\)\s*(.*)$")
+_ANSWER_RE = re.compile(rf"^সঠিক\s*উত্তর\s*[:ঃ]\s*\(?([{OPTION_LETTERS}])\)?")
+_EXPLANATION_RE = re.compile(r"^ব্যাখ্যা\s*[:ঃ]\s*(.*)$")
+_LEADING_NUMBER_RE = re.compile(r"^(?:প্রশ্ন\s*)?[0-9০-৯]+\s*[.।)]\s*")
+_LEADING_TAG_RE = re.compile(r"^(?:\[[^\[\]]*\]\s*)+")
+_TRAILING_TAG_RE = re.compile(r"\s*(\[[^\[\]]+\])\s*$")
+
+class _MCQBlock:
+    """পার্সারের ভেতরে একটি প্রশ্নের অবস্থা রাখার জন্য।"""
+    __slots__ = ("lines", "question_lines", "options", "answer", "explanation_lines", "in_explanation", "valid")
+
+    def __init__(self):
+        self.lines = [] # মূল লাইনগুলো (পার্স না হলে AI-তে পাঠানোর জন্য)
+        self.question_lines = []
+        self.options = []
+        self.answer = None
+        self.explanation_lines = []
+        self.in_explanation = False
+        self.valid = True
+
+    def to_question(self) -> dict | None:
+        """ব্লকটি বৈধ হলে AI-এর আউটপুটের মতো একই ফরম্যাটের dict দেয়, না হলে None।"""
+        if not self.valid or not self.question_lines or self.answer is None:
+            return None
+        if len(self.options) < 2 or self.answer >= len(self.options):
+            return None
+        question = " ".join(self.question_lines)
+        suffix = None
+        match = _TRAILING_TAG_RE.search(question)
+        if match:
+            suffix = match.group(1)
+            question = question[:match.start()]
+        question = _LEADING_TAG_RE.sub("", _LEADING_NUMBER_RE.sub("", question)).strip()
+        if not question or not all(self.options):
+            return None
+        explanation = "\n".join(self.explanation_lines).strip() or None
+        return {
+            "question": question,
+            "options": list(self.options),
+            "correct_option_index": self.answer,
+            "explanation": explanation,
+            "suffix": suffix,
+        }
+
+def split_mcq_blocks(text: str) -> list[_MCQBlock]:
+    """টেক্সটকে প্রশ্নের সীমানা অনুযায়ী ব্লকে ভাগ করে (পার্স হোক বা না হোক)।"""
+    blocks: list[_MCQBlock] = []
+    current: _MCQBlock | None = None
+    after_gap = False # আগের লাইনটি ফাঁকা ছিল কিনা
+    raw_lines = text.splitlines()
+
+    # প্রতিটি লাইনের পরের অ-ফাঁকা লাইনটি (ক) অপশন কিনা — ফাঁকা লাইন ছাড়াই
+    # ব্যাখ্যার পরে নতুন প্রশ্ন শুরু হলে সেটি চেনার জন্য
+    followed_by_first_option = [False] * len(raw_lines)
+    next_is_first_option = False
+    for i in range(len(raw_lines) - 1, -1, -1):
+        followed_by_first_option[i] = next_is_first_option
+        line = raw_lines[i].strip()
+        if line:
+            option = _OPTION_RE.match(line)
+            next_is_first_option = bool(option) and option.group(1) == OPTION_LETTERS[0]
+
+    for i, raw_line in enumerate(raw_lines):
+        line = raw_line.strip()
+        if not line:
+            after_gap = True
+            if current is not None:
+                current.lines.append(raw_line)
+            continue
+
+        option = _OPTION_RE.match(line)
+        answer = _ANSWER_RE.match(line)
+        explanation = _EXPLANATION_RE.match(line)
+
+        # নতুন প্রশ্ন শুরু হচ্ছে কিনা: আগের প্রশ্নের উত্তর পাওয়া গেছে এবং এটি কোনো চিহ্নিত লাইন নয়
+        starts_question = not (option or answer or explanation) and (
+            current is None
+            or (current.answer is not None and (after_gap or not current.in_explanation or followed_by_first_option[i]))
+            or (after_gap and not current.options) # প্রশ্নের আগে শিরোনাম বা বাড়তি লাইন
+        )
+        if starts_question or (current is None):
+            current = _MCQBlock()
+            blocks.append(current)
+        after_gap = False
+        current.lines.append(raw_line)
+
+        if option:
+            letter, option_text = option.groups()
+            # অপশনগুলো অবশ্যই (ক), (খ), (গ)... ক্রমে থাকতে হবে এবং উত্তরের আগে আসতে হবে
+            if current.answer is not None or not current.question_lines or OPTION_LETTERS.index(letter) != len(current.options):
+                current.valid = False
+            current.options.append(option_text.strip())
+        elif answer:
+            if current.answer is not None:
+                current.valid = False
+            current.answer = OPTION_LETTERS.index(answer.group(1))
+        elif explanation:
+            if current.answer is None or current.explanation_lines:
+                current.valid = False
+            current.in_explanation = True
+            current.explanation_lines.append(explanation.group(1).strip())
+        elif current.in_explanation:
+            current.explanation_lines.append(line) # একাধিক লাইনের ব্যাখ্যা
+        elif not current.options:
+            current.question_lines.append(line) # একাধিক লাইনের প্রশ্ন
+        else:
+            current.valid = False # অপশনের পরে অচেনা লাইন
+
+    return blocks
+
+def parse_mcq_locally(text: str) -> list[dict | str]:
+    """
+    টেক্সটকে মূল ক্রম বজায় রেখে ভাগ করে: সফলভাবে পার্স হওয়া প্রশ্ন (dict) অথবা
+    যে অংশগুলো পার্স করা যায়নি সেগুলোর মূল টেক্সট (str, AI-তে পাঠানোর জন্য)।
+    """
+    segments: list[dict | str] = []
+    for block in split_mcq_blocks(text):
+        question = block.to_question()
+        if question is not None:
+            segments.append(question)
+            continue
+        raw_text = "\n".join(block.lines).strip()
+        # শুধু একটি লাইনের অংশ (যেমন শিরোনাম) AI-তে পাঠানোর দরকার নেই
+        if raw_text and (block.options or block.answer is not None or len(raw_text.splitlines()) > 1):
+            segments.append(raw_text)
+    return segments
+
+def _split_oversized_segment(segment: str, max_chars: int) -> list[str]:
+    """একটি বড় অংশকে প্রথমে ফাঁকা লাইনে, তারপর দরকার হলে লাইনে ভাগ করে max_chars এর মধ্যে রাখে।"""
+    if len(segment) <= max_chars:
+        return [segment]
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", segment):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(paragraph.splitlines())
+    # খুব লম্বা একটি লাইনকে আর ভাগ করা হয় না, সেটি একাই একটি চাংক হবে
+    return [p for p in pieces if p.strip()]
+
+def chunk_segments(segments: list[str], max_chars: int) -> list[str]:
+    """পরপর থাকা অপার্সড অংশগুলোকে প্রশ্নের সীমানা না ভেঙে max_chars আকারের চাংকে সাজায়।"""
+    chunks: list[str] = []
+    current: list[str] = []
+    current_len = 0
+    for segment in segments:
+        for piece in _split_oversized_segment(segment, max_chars):
+            if current and current_len + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+async def _extract_chunk_with_retry(chunk: str, ai_model, ai_pool: AIWorkerPool, user_id: int,
+                                    ai_cache: AIResultCache | None = None, on_progress=None,
+                                    ai_batcher: AIBatcher | None = None) -> tuple[list | None, bool]:
+    """
+    একটি চাংক AI দিয়ে প্রসেস করে (ক্যাশে থাকলে সেখান থেকে); ব্যর্থ হলে শুধু এই চাংকটিই আবার চেষ্টা করা হয়।
+    ব্যাচিং চালু থাকলে ছোট চাংকের প্রথম চেষ্টা অন্য ইউজারদের চাংকের সাথে একটি AI কলে যায়, রিট্রাই আলাদাভাবে।
+    (প্রশ্নের লিস্ট বা None, সম্পূর্ণ কিনা) ফেরত দেয়। স্ট্রিমিং মোডে সব চেষ্টা ব্যর্থ হলে
+    সবচেয়ে বেশি প্রশ্ন পাওয়া আংশিক ফলাফলটি রাখা হয়।
+    """
+    reported = 0 # এই চাংক থেকে ইতিমধ্যে কতটি প্রশ্ন অগ্রগতিতে দেখানো হয়েছে (রিট্রাইতে দ্বিগুণ গোনা এড়াতে)
+
+    def report(count: int):
+        nonlocal reported
+        if on_progress is not None and count > reported:
+            on_progress(count - reported)
+            reported = count
+
+    if ai_cache is not None:
+        cached = await ai_cache.get(chunk)
+        if cached is not None:
+            report(len(cached))
+            return cached, True
+
+    best_partial: list = []
+    for attempt in range(AI_CHUNK_RETRIES + 1):
+        if attempt > 0:
+            print(f"🔁 user_id {user_id}: চাংক ({len(chunk)} অক্ষর) আবার চেষ্টা করা হচ্ছে ({attempt}/{AI_CHUNK_RETRIES})...")
+            await asyncio.sleep(AI_CHUNK_RETRY_DELAY * attempt)
+        try:
+            if attempt == 0 and ai_batcher is not None and ai_batcher.accepts(chunk):
+                result = await ai_batcher.submit(chunk, ai_model, ai_pool, user_id)
+            elif AI_STREAMING:
+                attempt_count = 0
+                def on_streamed(n):
+                    nonlocal attempt_count
+                    attempt_count += n
+                    report(attempt_count)
+                result, complete = await stream_questions_from_ai_async(chunk, ai_model, ai_pool, user_id, on_streamed)
+                if not complete:
+                    if len(result) > len(best_partial):
+                        best_partial = result
+                    continue
+            else:
+                result = await get_questions_from_ai_async(chunk, ai_model, ai_pool, user_id)
+        except AIQueueFullError:
+            if attempt == AI_CHUNK_RETRIES:
+                raise
+            continue
+        if isinstance(result, list):
+            report(len(result))
+            if ai_cache is not None:
+                await ai_cache.put(chunk, result)
+            return result, True
+    if best_partial:
+        print(f"⚠️ user_id {user_id}: চাংকটির স্ট্রিম সম্পূর্ণ হয়নি, আংশিক {len(best_partial)} টি প্রশ্ন রাখা হচ্ছে।")
+        return best_partial, False # আংশিক ফলাফল ক্যাশ করা হয় না
+    return None, False
+
+async def extract_questions(text, ai_model, ai_pool: AIWorkerPool, user_id: int,
+                            ai_cache: AIResultCache | None = None, on_progress=None,
+                            ai_batcher: AIBatcher | None = None) -> tuple[list | None, dict]:
+    """
+    প্রথমে লোকাল পার্সার দিয়ে প্রশ্ন বের করে, শুধু বাকি অংশগুলো AI দিয়ে প্রসেস করে।
+    অপার্সড অংশগুলো প্রশ্নের সীমানায় চাংকে ভাগ হয়ে একসাথে (concurrently) AI-তে যায়।
+    মূল ক্রম অনুযায়ী প্রশ্নের লিস্ট এবং পরিসংখ্যান ফেরত দেয়। on_progress(n) প্রতিটি নতুন প্রশ্নে ডাকা হয়।
+    """
+    segments = parse_mcq_locally(text)
+    stats = {"local": 0, "ai": 0, "ai_chunks": 0, "failed_chunks": 0, "partial_chunks": 0}
+
+    # ক্রম বজায় রাখতে: পার্সড প্রশ্ন (dict) অথবা AI চাংকের ইনডেক্স (int)
+    layout: list[dict | int] = []
+    chunks: list[str] = []
+    pending_raw: list[str] = []
+
+    def flush_raw():
+        for chunk in chunk_segments(pending_raw, AI_CHUNK_MAX_CHARS):
+            tokens = PROMPTS.estimate_tokens(chunk)
+            # অক্ষর সীমার মধ্যে থেকেও টোকেন বাজেট ছাড়ালে (যেমন ঘন বাংলা টেক্সট) চাংকটি আরও ছোট করা হয়
+            pieces = [chunk] if tokens <= AI_CHUNK_MAX_TOKENS else chunk_segments([chunk], len(chunk) * AI_CHUNK_MAX_TOKENS // tokens)
+            for piece in pieces:
+                layout.append(len(chunks))
+                chunks.append(piece)
+        pending_raw.clear()
+
+    for segment in segments:
+        if isinstance(segment, dict):
+            flush_raw()
+            layout.append(segment)
+            stats["local"] += 1
+        else:
+            pending_raw.append(segment)
+    flush_raw()
+    if on_progress is not None and stats["local"]:
+        on_progress(stats["local"])
+
+    input_tokens = sum(PROMPTS.estimate_tokens(chunk) for chunk in chunks)
+    if input_tokens > AI_MAX_INPUT_TOKENS:
+        raise AIInputTooLargeError(f"user_id {user_id}: AI ইনপুট প্রায় {input_tokens} টোকেন (সীমা {AI_MAX_INPUT_TOKENS})")
+
+    chunk_results: list = []
+    if chunks:
+        stats["ai_chunks"] = len(chunks)
+        chunk_results = await asyncio.gather(
+            *(_extract_chunk_with_retry(chunk, ai_model, ai_pool, user_id, ai_cache, on_progress, ai_batcher) for chunk in chunks),
+            return_exceptions=True,
+        )
+        for result in chunk_results:
+            if isinstance(result, AIRequestCancelled):
+                raise result
+        for result in chunk_results:
+            if isinstance(result, BaseException) and not isinstance(result, AIQueueFullError):
+                raise result
+        if stats["local"] == 0 and all(isinstance(r, AIQueueFullError) for r in chunk_results):
+            raise chunk_results[0]
+
+    questions = []
+    for item in layout:
+        if isinstance(item, dict):
+            questions.append(item)
+            continue
+        result = chunk_results[item]
+        if isinstance(result, BaseException) or result[0] is None:
+            stats["failed_chunks"] += 1
+            continue
+        chunk_questions, complete = result
+        questions.extend(chunk_questions)
+        stats["ai"] += len(chunk_questions)
+        if not complete:
+            stats["partial_chunks"] += 1
+
+    if stats["failed_chunks"]:
+        print(f"⚠️ user_id {user_id}: {stats['failed_chunks']}/{len(chunks)} টি চাংক AI দিয়ে প্রসেস করা যায়নি।")
+    if not questions and stats["failed_chunks"]:
+        return None, stats # কিছুই পাওয়া যায়নি
+    return questions, stats
+
+# --- নতুন: রেট-লিমিট সচেতন পোল ডিসপ্যাচার ---
+# টেলিগ্রামের সীমা: একই চ্যাটে ~১টি মেসেজ/সেকেন্ড (গ্রুপে ২০টি/মিনিট), সব মিলিয়ে ~৩০টি মেসেজ/সেকেন্ড।
+# প্রতিটি চ্যাটের জন্য আলাদা এবং সবার জন্য একটি গ্লোবাল টোকেন বাকেট ব্যবহার হয়।
+class TokenBucket:
+    """সাধারণ টোকেন বাকেট: প্রতি সেকেন্ডে rate টি টোকেন জমে, সর্বোচ্চ capacity টি।"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        # বিরতির (pause) সময়ে কোনো টোকেন জমে না
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """একটি টোকেন পাওয়া পর্যন্ত অপেক্ষা করে।"""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """টেলিগ্রাম RetryAfter দিলে বাকেটটি নির্দিষ্ট সময়ের জন্য বন্ধ রাখা হয়।"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+class PostingAborted(Exception):
+    """সূচনা বার্তা (বা অন্য জরুরি মেসেজ) পাঠানো না গেলে বাকি মেসেজগুলো এই কারণে বাতিল হয়।"""
+
+def retry_after_seconds(error: telegram.error.RetryAfter) -> float:
+    """RetryAfter.retry_after কখনো int, কখনো timedelta হতে পারে (লাইব্রেরির ভার্সন অনুযায়ী)।"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class PollDispatcher:
+    """
+    প্রতিটি টার্গেট চ্যাটের জন্য একটি আলাদা কিউ ও ওয়ার্কার রাখে।
+    একই চ্যাটে মেসেজগুলো কঠোরভাবে ক্রমানুসারে যায়, ভিন্ন চ্যাটে একসাথে (concurrently) যায়।
+    RetryAfter পেলে মেসেজটি বাদ না দিয়ে অপেক্ষা করে আবার পাঠানো হয়।
+    """
+
+    def __init__(self, chat_rate: float, chat_burst: float, global_rate: float, global_burst: float, max_retries: int):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets: dict[str, TokenBucket] = {}
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+
+    def _bucket_for(self, chat_key: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_key)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_key] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def send_batch(self, target_chat, sends: list, critical: int = 0) -> list:
+        """
+        sends: প্রতিটি একটি async ফাংশন (কোনো আর্গুমেন্ট নেয় না) যা একটি মেসেজ পাঠায়।
+        পুরো ব্যাচটি একসাথে কিউতে যায়, তাই অন্য কুইজের মেসেজ এর মাঝে ঢুকতে পারে না।
+        প্রথম critical টি send এর কোনোটি ব্যর্থ হলে বাকিগুলো না পাঠিয়ে PostingAborted দেওয়া হয়।
+        প্রতিটি send-এর জন্য None (সফল) অথবা Exception ফেরত দেয়।
+        """
+        chat_key = str(target_chat)
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_key)
+        if queue is None:
+            queue = self._queues[chat_key] = asyncio.Queue()
+        queue.put_nowait((sends, critical, future))
+        worker = self._workers.get(chat_key)
+        if worker is None or worker.done():
+            self._workers[chat_key] = asyncio.create_task(self._chat_worker(chat_key))
+        return await future
+
+    async def _chat_worker(self, chat_key: str):
+        queue = self._queues[chat_key]
+        while not queue.empty():
+            sends, critical, future = queue.get_nowait()
+            try:
+                results = await self._run_batch(chat_key, sends, critical)
+            except Exception as e: # অপ্রত্যাশিত সমস্যা হলেও ওয়ার্কার যেন থেমে না যায়
+                results = [e] * len(sends)
+            if not future.done():
+                future.set_result(results)
+        # কিউ খালি হলে ওয়ার্কার বন্ধ হয়; পরের ব্যাচে আবার তৈরি হবে
+        del self._workers[chat_key]
+        if queue.empty():
+            del self._queues[chat_key]
+
+    async def _run_batch(self, chat_key: str, sends: list, critical: int) -> list:
+        bucket = self._bucket_for(chat_key)
+        results = []
+        for index, send in enumerate(sends):
+            error = await self._send_with_retry(chat_key, bucket, send)
+            results.append(error)
+            if error is not None and index < critical:
+                aborted = PostingAborted(f"আগের মেসেজ ব্যর্থ হয়েছে: {error}")
+                results.extend([aborted] * (len(sends) - index - 1))
+                break
+        return results
+
+    async def _send_with_retry(self, chat_key: str, bucket: TokenBucket, send):
+        attempts = max(self.max_retries, 0) + 1 # প্রথম চেষ্টা + রিট্রাই (ঋণাত্মক মানেও অন্তত একবার পাঠানো হয়)
+        last_error = None
+        for attempt in range(attempts):
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                await send()
+                return None
+            except telegram.error.RetryAfter as e:
+                wait = retry_after_seconds(e)
+                next_step = "আবার চেষ্টা করা হবে" if attempt + 1 < attempts else "আর চেষ্টা করা হবে না"
+                print(f"⏳ চ্যানেল {chat_key}: টেলিগ্রাম RetryAfter ({wait} সেকেন্ড), চেষ্টা {attempt + 1}/{attempts}, {next_step}।")
+                bucket.pause(wait)
+                # টেলিগ্রামের সীমা পুরো বটের উপরেও হতে পারে, তাই অন্য চ্যাটগুলোও এই সময়টুকু থামে
+                self._global_bucket.pause(wait)
+                last_error = e
+            except Exception as e:
+                return e
+        return last_error
+
+# --- টুল ফাংশন: একটি প্রশ্ন থেকে send_poll এর আর্গুমেন্ট তৈরি ---
+def build_poll_kwargs(poll_data: dict) -> dict:
+    """প্রশ্নে প্রিফিক্স/সাফিক্স যোগ করে এবং অপশন চেক করে; সমস্যা থাকলে ValueError দেয়।"""
+    # ---!!! ডাইনামিক লিগ্যাসি যোগ করা !!!---
+    original_question = poll_data.get('question', 'Unknown Question') # .get() ব্যবহার
+    dynamic_suffix = poll_data.get('suffix') # AI থেকে পাওয়া সাফিক্স (null হতে পারে)
+
+    static_prefix = "[SOT]" # <-- আপনার স্বয়ংক্রিয় প্রিফিক্স
+
+    # \u200B হলো একটি জিরো-উইডথ স্পেস (সুন্দর দেখানোর জন্য)
+    formatted_question = f"{static_prefix} \u200B {original_question}"
+
+    # যদি সাফিক্স থাকে (null না হয়), তবেই সেটি যোগ করা
+    if dynamic_suffix:
+        formatted_question = f"{formatted_question} \u200B {dynamic_suffix}"
+    # -----------------------------------------------
+
+    # টেলিগ্রাম পোলের প্রশ্নের অক্ষর সীমা চেক করা (৩০০ অক্ষর)
+    if len(formatted_question) > 300:
+        # যদি খুব লম্বা হয়, লিগ্যাসি ছাড়া শুধু প্রশ্নটি পাঠানো
+        print(f"⚠️ প্রশ্নটি ৩০০ অক্ষরের বেশি ({len(formatted_question)}), লিগ্যাসি বাদ দেওয়া হচ্ছে: {original_question[:50]}...")
+        if len(original_question) > 300:
+            formatted_question = original_question[:300]
+        else:
+            formatted_question = original_question
+    # -----------------------------------------------
+
+    # ---!!! অপশন এবং ইনডেক্স চেক করা !!!---
+    options = poll_data.get('options')
+    correct_option_index = poll_data.get('correct_option_index')
+
+    if not options or not isinstance(options, list) or len(options) < 2 or len(options) > 10:
+        raise ValueError(f"অবৈধ অপশন সংখ্যা ({len(options) if options else 0})")
+    if correct_option_index is None or not isinstance(correct_option_index, int) or correct_option_index < 0 or correct_option_index >= len(options):
+        raise ValueError(f"অবৈধ সঠিক অপশন ইনডেক্স ({correct_option_index}), অপশন সংখ্যা: {len(options)}")
+    #------------------------------------------
+
+    return {
+        "question": formatted_question, # <-- এখানে পরিবর্তিত প্রশ্নটি ব্যবহার করা
+        "options": options,
+        "type": telegram.Poll.QUIZ,
+        "correct_option_id": correct_option_index,
+        "explanation": poll_data.get('explanation'),
+    }
+
+# --- নতুন: পোস্ট করার আগে প্রশ্নগুলোর ব্যাচ যাচাই ও মেরামত (pre-flight) ---
+# এক্সট্র্যাকশনের পরপরই চলে, যাতে টেলিগ্রাম যে পোল রিজেক্ট করবে সেটি সূচনা বার্তার আগেই ধরা পড়ে
+# এবং অবৈধ পোলের জন্য নেটওয়ার্ক কল বা রেট-লিমিট স্লট নষ্ট না হয়।
+POLL_OPTION_MAX_CHARS = 100 # টেলিগ্রামের সীমা: প্রতিটি অপশন ১-১০০ অক্ষর
+POLL_EXPLANATION_MAX_CHARS = 200 # ব্যাখ্যা ০-২০০ অক্ষর
+POLL_EXPLANATION_MAX_NEWLINES = 2 # ব্যাখ্যায় সর্বোচ্চ ২টি লাইন ব্রেক
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+def repair_question(poll_data) -> tuple[dict, list[str]]:
+    """
+    একটি প্রশ্নকে টেলিগ্রামের সীমার মধ্যে আনে: অপশন/ব্যাখ্যা ছোট করা, ফাঁকা ও ডুপ্লিকেট অপশন বাদ ইত্যাদি।
+    মেরামত করা কপি এবং কী কী ঠিক করা হয়েছে তার তালিকা ফেরত দেয়; মেরামত অসম্ভব হলে ValueError দেয়।
+    """
+    if not isinstance(poll_data, dict):
+        raise ValueError("প্রশ্নটি সঠিক ফরম্যাটে নেই")
+    repairs = []
+    question = str(poll_data.get('question') or "").strip()
+    if not question:
+        raise ValueError("প্রশ্নের টেক্সট নেই")
+
+    options = poll_data.get('options')
+    correct_option_index = poll_data.get('correct_option_index')
+    if not isinstance(options, list):
+        raise ValueError("অপশনের তালিকা নেই")
+    if not isinstance(correct_option_index, int) or isinstance(correct_option_index, bool) or not 0 <= correct_option_index < len(options):
+        raise ValueError(f"অবৈধ সঠিক অপশন ইনডেক্স ({correct_option_index})")
+
+    # ফাঁকা ও ডুপ্লিকেট অপশন বাদ দেওয়া, সঠিক উত্তরের ইনডেক্স ঠিক রেখে
+    cleaned = []
+    new_correct_index = None
+    for index, option in enumerate(options):
+        text = " ".join(str(option if option is not None else "").split())
+        if len(text) > POLL_OPTION_MAX_CHARS:
+            text = _truncate(text, POLL_OPTION_MAX_CHARS)
+            repairs.append("লম্বা অপশন ছোট করা হয়েছে")
+        if not text:
+            if index == correct_option_index:
+                raise ValueError("সঠিক অপশনটি ফাঁকা")
+            repairs.append("ফাঁকা অপশন বাদ দেওয়া হয়েছে")
+            continue
+        if text in cleaned:
+            if index == correct_option_index:
+                new_correct_index = cleaned.index(text)
+            repairs.append("ডুপ্লিকেট অপশন বাদ দেওয়া হয়েছে")
+            continue
+        if index == correct_option_index:
+            new_correct_index = len(cleaned)
+        cleaned.append(text)
+    if len(cleaned) < 2:
+        raise ValueError(f"বৈধ অপশন মাত্র {len(cleaned)} টি")
+    if len(cleaned) > 10:
+        if new_correct_index >= 10:
+            raise ValueError(f"অপশন {len(cleaned)} টি, সঠিক উত্তর ১০ নম্বরের পরে")
+        cleaned = cleaned[:10]
+        repairs.append("১০টির বেশি অপশন বাদ দেওয়া হয়েছে")
+
+    explanation = poll_data.get('explanation')
+    if explanation is not None:
+        explanation = str(explanation).strip()
+        lines = explanation.splitlines()
+        if len(lines) > POLL_EXPLANATION_MAX_NEWLINES + 1:
+            explanation = "\n".join(lines[:POLL_EXPLANATION_MAX_NEWLINES] + [" ".join(lines[POLL_EXPLANATION_MAX_NEWLINES:])])
+            repairs.append("ব্যাখ্যার বাড়তি লাইন ব্রেক সরানো হয়েছে")
+        if len(explanation) > POLL_EXPLANATION_MAX_CHARS:
+            explanation = _truncate(explanation, POLL_EXPLANATION_MAX_CHARS)
+            repairs.append("লম্বা ব্যাখ্যা ছোট করা হয়েছে")
+        explanation = explanation or None
+
+    repaired = dict(poll_data)
+    repaired.update({
+        'question': question,
+        'options': cleaned,
+        'correct_option_index': new_correct_index,
+        'explanation': explanation,
+    })
+    build_poll_kwargs(repaired) # প্রিফিক্স/সাফিক্স সহ ৩০০ অক্ষরের নিয়ম; ব্যর্থ হলে ValueError
+    return repaired, list(dict.fromkeys(repairs))
+
+def preflight_questions(questions_data: list) -> tuple[list[dict], int, list[tuple[int, str]]]:
+    """
+    সব প্রশ্ন একসাথে যাচাই ও মেরামত করে।
+    ফেরত দেয়: (পোস্ট করার যোগ্য প্রশ্ন, মেরামত করা প্রশ্নের সংখ্যা, [(প্রশ্ন নম্বর, বাদ পড়ার কারণ)])
+    """
+    valid = []
+    repaired_count = 0
+    rejected = []
+    for number, poll_data in enumerate(questions_data, start=1):
+        try:
+            repaired, repairs = repair_question(poll_data)
+        except ValueError as e:
+            rejected.append((number, str(e)))
+            PREFLIGHT_RESULTS.inc(result="rejected")
+            continue
+        if repairs:
+            repaired_count += 1
+            PREFLIGHT_RESULTS.inc(result="repaired")
+        else:
+            PREFLIGHT_RESULTS.inc(result="ok")
+        valid.append(repaired)
+    return valid, repaired_count, rejected
+
+# --- কুইজ পোস্ট করার ফাংশন (ডিসপ্যাচারের মাধ্যমে, ইউজারের হ্যান্ডলার আটকে না রেখে) ---
+async def _mark_job_item(job: dict, item: dict, status: str, error: str | None = None):
+    """আইটেমের স্ট্যাটাস মেমোরিতে এবং (জব সেভ হয়ে থাকলে) ডাটাবেসে আপডেট করে।"""
+    item["status"] = status
+    item["error"] = error
+    if job["job_id"] is not None:
+        await asyncio.to_thread(update_posting_job_item_in_db, job["job_id"], item["position"], status, error)
+
+async def run_posting_job(bot: telegram.Bot, dispatcher: PollDispatcher, job: dict, notify: bool = True) -> dict | None:
+    """
+    জবের যে আইটেমগুলো এখনো পাঠানো হয়নি সেগুলো টার্গেট চ্যানেলে ক্রমানুসারে পোস্ট করে।
+    মাল্টি-ওয়ার্কার মোডে জবটি অন্য ওয়ার্কার চালাতে থাকলে কিছু না করে None ফেরত দেয়।
+    """
+    lease_key = f"job:{job['job_id']}" if job["job_id"] is not None else None
+    if lease_key is None:
+        return await _run_posting_job(bot, dispatcher, job, notify)
+    async with worker_lease(lease_key) as acquired:
+        if not acquired:
+            print(f"ℹ️ পোস্টিং জব #{job['job_id']} অন্য ওয়ার্কার চালাচ্ছে, এখানে বাদ দেওয়া হলো।")
+            return None
+        return await _run_posting_job(bot, dispatcher, job, notify)
+
+async def _run_posting_job(bot: telegram.Bot, dispatcher: PollDispatcher, job: dict, notify: bool) -> dict:
+    """
+    notify=True হলে ইউজারকে ফলাফল জানায়; সবসময় ফলাফলের সারাংশ (summary) ফেরত দেয়।
+    প্রতিটি মেসেজ পাঠানোর পরপরই ডাটাবেসে 'sent' চিহ্নিত হয়, তাই রিস্টার্টের পরে শেষ নিশ্চিত পোলের পর থেকে শুরু হয়।
+    (পাঠানো এবং চিহ্নিত করার মাঝখানে প্রসেস বন্ধ হলে শুধু সেই একটি পোল আবার যেতে পারে।)
+    """
+    job_id = job["job_id"]
+    chat_id = job["chat_id"]
+    target_channel = job["target_channel"]
+    if job_id is not None:
+        await asyncio.to_thread(update_posting_job_status_in_db, job_id, JOB_RUNNING)
+    job["status"] = JOB_RUNNING
+
+    intro_item = job["items"][0]
+    sends = []
+    send_items = [] # প্রতিটি send এর সাথে মিলিয়ে জব আইটেম
+    for item in job["items"]:
+        if item["status"] != ITEM_PENDING:
+            continue # আগেই পাঠানো বা ব্যর্থ
+        if item["kind"] == "intro":
+            send_message = lambda item=item: bot.send_message(chat_id=target_channel, text=item["payload"]["text"])
+        else:
+            try:
+                poll_kwargs = build_poll_kwargs(item["payload"])
+            except Exception as e:
+                print(f"❌ পোল পাঠাতে সমস্যা (চ্যানেল {target_channel}): {e}")
+                POLLS_FAILED.inc(error=type(e).__name__)
+                await _mark_job_item(job, item, ITEM_FAILED, str(e))
+                continue
+            send_message = lambda kwargs=poll_kwargs: bot.send_poll(chat_id=target_channel, **kwargs)
+
+        async def send(item=item, send_message=send_message):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                await send_message()
+                outcome = "ok"
+            finally:
+                TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, kind=item["kind"], outcome=outcome)
+            if item["kind"] == "poll":
+                POLLS_SENT.inc()
+            await _mark_job_item(job, item, ITEM_SENT)
+        sends.append(send)
+        send_items.append(item)
+
+    # সূচনা বার্তা এখনো না গিয়ে থাকলে সেটি ব্যর্থ হলে পোলগুলো পাঠানো হবে না
+    critical = 1 if intro_item["status"] == ITEM_PENDING else 0
+    results = await dispatcher.send_batch(target_channel, sends, critical=critical) if sends else []
+
+    fatal_error = None
+    if critical and results[0] is not None:
+        # যদি চ্যানেল আইডি ভুল হয় বা বট অ্যাডমিন না থাকে
+        fatal_error = results[0]
+        print(f"❌ চ্যানেল {target_channel}-এ মেসেজ পাঠানো যায়নি: {fatal_error}")
+        for item in send_items:
+            if item["kind"] == "poll":
+                POLLS_FAILED.inc(error=type(fatal_error).__name__)
+            await _mark_job_item(job, item, ITEM_FAILED, str(fatal_error))
+        job["status"] = JOB_FAILED
+    else:
+        for item, error in zip(send_items, results):
+            if error is not None:
+                print(f"❌ পোল পাঠাতে সমস্যা (চ্যানেল {target_channel}): {error}")
+                if item["kind"] == "poll":
+                    POLLS_FAILED.inc(error=type(error).__name__)
+                await _mark_job_item(job, item, ITEM_FAILED, str(error))
+        job["status"] = JOB_DONE
+    if job_id is not None:
+        await asyncio.to_thread(update_posting_job_status_in_db, job_id, job["status"])
+
+    poll_items = [item for item in job["items"] if item["kind"] == "poll"]
+    summary = {
+        "job_id": job_id,
+        "target_channel": target_channel,
+        "fatal_error": fatal_error,
+        "sent": sum(1 for item in poll_items if item["status"] == ITEM_SENT),
+        "failed": [item for item in poll_items if item["status"] == ITEM_FAILED],
+    }
+    if notify:
+        await bot.send_message(chat_id=chat_id, text=format_posting_report([summary]))
+    return summary
 
-# --- নতুন ফাংশন: ডাটাবেসে চ্যানেল আইডি সেভ করা ---
-def save_target_channel_to_db(user_id: int, target_channel: str):
-    conn = get_db_connection()
-    if conn is None: return
+def format_posting_report(summaries: list[dict]) -> str:
+    """এক বা একাধিক চ্যানেলের পোস্টিং ফলাফল থেকে ইউজারের জন্য একটি সম্মিলিত ফিডব্যাক মেসেজ তৈরি করে।"""
+    # ---!!! নতুন: বিস্তারিত ফিডব্যাক মেসেজ !!!---
+    if len(summaries) > 1:
+        succeeded = sum(1 for summary in summaries if summary["fatal_error"] is None)
+        feedback_message = f"📊 {len(summaries)} টি চ্যানেলের মধ্যে {succeeded} টিতে পোস্টিং সম্পন্ন হয়েছে।\n"
+    else:
+        feedback_message = ""
+    for summary in summaries:
+        target_channel = summary["target_channel"]
+        if feedback_message:
+            feedback_message += "\n"
+        if summary["fatal_error"] is not None:
+            feedback_message += f"❌ চ্যানেল '{target_channel}'-এ পোস্ট করতে মারাত্মক সমস্যা হয়েছে। আইডি/বট পারমিশন চেক করুন: {summary['fatal_error']}"
+            continue
+        feedback_message += f"✅ সফলভাবে চ্যানেল '{target_channel}'-এ {summary['sent']} টি পোল পোস্ট করা হয়েছে।"
+        failed_polls_info = summary["failed"]
+        errors = len(failed_polls_info)
+        if errors > 0:
+            feedback_message += f"\n\n⚠️ কিন্তু {errors} টি পোল পোস্ট করতে সমস্যা হয়েছে:"
+            for i, failed in enumerate(failed_polls_info):
+                 # টেলিগ্রাম মেসেজের অক্ষর সীমা ৪০০০ এর কাছাকাছি, তাই খুব বেশি এরর দেখানো যাবে না
+                 if len(feedback_message) < 3800:
+                      original_question = str(failed['payload'].get('question', 'Unknown Question'))
+                      question_preview = original_question[:100] + ('...' if len(original_question) > 100 else '') # প্রশ্ন সংক্ষিপ্ত করা
+                      feedback_message += f"\n {i+1}. প্রশ্ন: \"{question_preview}\"\n    কারণ: {(failed['error'] or '')[:100]}" # এরর সংক্ষিপ্ত করা
+                 else:
+                      feedback_message += "\n... (আরও এরর আছে)"
+                      break # মেসেজ খুব বড় হয়ে গেলে লুপ থামিয়ে দাও
+    # -------------------------------------------
+    return feedback_message[:4096]
 
-    try:
-        with conn.cursor() as cur:
-            # ON CONFLICT... (UPSERT): যদি ইউজার আইডি আগে থেকেই থাকে, তবে আপডেট করো
-            cur.execute("""
-                INSERT INTO user_settings (user_id, target_channel)
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) DO UPDATE SET target_channel = EXCLUDED.target_channel;
-            """, (user_id, target_channel))
-            conn.commit()
-    except Exception as e:
-        print(f"❌ চ্যানেল আইডি সেভ করতে সমস্যা: {e}")
-    finally:
-        if conn:
-            conn.close()
+async def run_posting_jobs(bot: telegram.Bot, dispatcher: PollDispatcher, jobs: list[dict], chat_id: int):
+    """একই কুইজের একাধিক চ্যানেলের জব একসাথে চালায় এবং শেষে একটি সম্মিলিত রিপোর্ট পাঠায়।"""
+    summaries = await asyncio.gather(*(run_posting_job(bot, dispatcher, job, notify=False) for job in jobs))
+    summaries = [summary for summary in summaries if summary is not None] # অন্য ওয়ার্কারের জব বাদ
+    if summaries:
+        await bot.send_message(chat_id=chat_id, text=format_posting_report(summaries))
 
-# --- AI দিয়ে প্রশ্ন জেনারেট করার ফাংশন (ডাইনামিক সাফিক্স সহ) ---
-def get_questions_from_ai(text, ai_model):
-    # প্রম্পট আপডেট করা হয়েছে "suffix" নামে নতুন একটি ফিল্ড যোগ করার জন্য
-    prompt = f"""
-    তুমি একজন দক্ষ টেলিগ্রাম বট। তোমার কাজ হলো নিচের টেক্সট থেকে শুধুমাত্র মাল্টিপল চয়েস প্রশ্ন (MCQ) বের করা।
-    তোমার উত্তর অবশ্যই একটি JSON লিস্ট ফরম্যাটে হতে হবে। প্রতিটি অবজেক্টে ৫টি কী থাকবে:
-    1. "question": (স্ট্রিং) মূল প্রশ্নটি। (প্রশ্ন থেকে [SOT] বা [MAT 23-24] এর মতো ট্যাগ বাদ দিয়ে শুধু প্রশ্নটি বের করবে)।
-    2. "options": (লিস্ট) অপশনগুলোর লিস্ট (সর্বোচ্চ ১০টি)।
-    3. "correct_option_index": (সংখ্যা) সঠিক অপশনের ইনডেক্স (0 থেকে শুরু)।
-    4. "explanation": (স্ট্রিং) সঠিক উত্তরের একটি সংক্ষিপ্ত ব্যাখ্যা। যদি ব্যাখ্যা খুঁজে না পাও, তবে এর মান `null` দাও।
-    5. "suffix": (স্ট্রিং) প্রশ্নের লাইনের শেষে যদি [ব্র্যাকেটের মধ্যে] কোনো ট্যাগ (যেমন [MAT 23-24] বা [PHY-22]) থাকে, তবে সেটি এখানে হুবহু যুক্ত করো। যদি এমন কোনো ট্যাগ না থাকে, তবে এর মান `null` দাও।
+async def start_posting_jobs(application: Application, jobs: list[dict], update: object = None) -> list[int | None]:
+    """জবগুলো ডাটাবেসে সেভ করে আলাদা টাস্কে সব চ্যানেলে একসাথে পোস্টিং শুরু করে।"""
+    for job in jobs:
+        if job["job_id"] is None:
+            job["job_id"] = await asyncio.to_thread(save_posting_job_to_db, job)
+            if job["job_id"] is None:
+                print("⚠️ পোস্টিং জব ডাটাবেসে সেভ হয়নি; রিস্টার্ট হলে এই কুইজ আবার শুরু হবে না।")
+    dispatcher: PollDispatcher = application.bot_data['poll_dispatcher']
+    application.create_task(run_posting_jobs(application.bot, dispatcher, jobs, jobs[0]["chat_id"]), update=update)
+    return [job["job_id"] for job in jobs]
 
-    টেক্সট:
-    ---
-    {text}
-    ---
+async def resume_posting_jobs(application: Application):
+    """বট চালু হওয়ার সময় অসমাপ্ত জবগুলো শেষ নিশ্চিত পোলের পর থেকে আবার শুরু করে।"""
+    job_ids = await asyncio.to_thread(get_unfinished_posting_job_ids_from_db)
+    for job_id in job_ids:
+        job = await asyncio.to_thread(load_posting_job_from_db, job_id)
+        if job is None or owner_worker(job["user_id"]) != WORKER_INDEX:
+            continue # মাল্টি-ওয়ার্কার মোডে প্রতিটি ওয়ার্কার শুধু নিজের ইউজারদের জব আবার শুরু করে
+        remaining = sum(1 for item in job["items"] if item["status"] == ITEM_PENDING)
+        print(f"🔄 পোস্টিং জব #{job_id} আবার শুরু হচ্ছে ({remaining} টি মেসেজ বাকি)।")
+        try:
+            await application.bot.send_message(
+                chat_id=job["chat_id"],
+                text=f"🔄 বট রিস্টার্ট হয়েছে। আপনার কুইজ (#{job_id}) '{job['target_channel']}'-এ আবার পোস্ট করা শুরু হচ্ছে ({remaining} টি বাকি)।"
+            )
+        except Exception as e:
+            print(f"⚠️ জব #{job_id} এর ইউজারকে জানাতে সমস্যা: {e}")
+        await start_posting_jobs(application, [job])
+
+async def resume_posting_jobs_job(context: ContextTypes.DEFAULT_TYPE):
+    """দ্রুত স্টার্টআপে on_startup-এর বদলে JobQueue থেকে চলে (অ্যাপ্লিকেশন চালু হওয়ার পরে)।"""
+    await resume_posting_jobs(context.application)
 
-    JSON আউটপুট উদাহরণ:
-    [
-      {{
-        "question": "বাংলাদেশের রাজধানীর নাম কি?",
-        "options": ["ঢাকা", "চট্টগ্রাম", "খুলনা", "রাজাহী"],
-        "correct_option_index": 0,
-        "explanation": "ঢাকা বাংলাদেশের রাজধানী ও বৃহত্তম শহর।",
-        "suffix": "[MAT 23-24]"
-      }},
-      {{
-        "question": "সূর্য কোন দিকে ওঠে?",
-        "options": ["উত্তর", "দক্ষিণ", "পূর্ব", "পশ্চিম"],
-        "correct_option_index": 2,
-        "explanation": null,
-        "suffix": null
-      }}
-    ]
-    """
-    try:
-        response = ai_model.generate_content(prompt)
-        if not response.parts:
-            print(f"⚠️ AI রেসপন্স ব্লকড। কারণ: {response.prompt_feedback}")
-            return None
-        json_data = json.loads(response.text)
-        return json_data
-    except Exception as e:
-        print(f"❌ AI বা JSON পার্সিং-এ অজানা সমস্যা: {e}")
-        # --- বিস্তারিত এরর দেখানোর জন্য ---
-        traceback.print_exc()
-        # -------------------------------
-        return None
 
 # --- টুল ফাংশন: স্টেট রিসেট করার জন্য ---
-def clear_user_state(user_data: dict):
-    """ব্যবহারকারীর বর্তমান অবস্থা রিসেট করে, পেন্ডিং কুইজ এবং টাইমার মুছে ফেলে।"""
-    user_data['CONV_STATE'] = STATE_IDLE
-    if 'pending_quiz_data' in user_data: del user_data['pending_quiz_data']
-    job_to_remove: Job | None = user_data.get('buffer_job')
+# বাফারের টাইমার (JobQueue জব) user_data-তে রাখা যায় না, কারণ পারসিস্টেন্স user_data কপি করে সেভ করে
+_buffer_jobs: dict[int, Job] = {}
+
+def cancel_buffer_job(user_id: int):
+    job_to_remove = _buffer_jobs.pop(user_id, None)
     if job_to_remove:
         try:
             job_to_remove.remove() # টাইমারটি বন্ধ করা
         except Exception as e:
             print(f"⚠️ টাইমার রিমুভ করতে সমস্যা: {e}") # যদি জব আগে থেকেই রিমুভ হয়ে গিয়ে থাকে
-        if 'buffer_job' in user_data: # ডাবল চেক
-             del user_data['buffer_job']
+
+def clear_user_state(user_data: dict, user_id: int):
+    """ব্যবহারকারীর বর্তমান অবস্থা রিসেট করে, পেন্ডিং কুইজ এবং টাইমার মুছে ফেলে।"""
+    user_data['CONV_STATE'] = STATE_IDLE
+    if 'pending_quiz_data' in user_data: del user_data['pending_quiz_data']
+    cancel_buffer_job(user_id)
     if 'text_buffer' in user_data: del user_data['text_buffer']
+    if 'buffer_started' in user_data: del user_data['buffer_started']
+    if 'document_upload' in user_data: del user_data['document_upload'] # চলমান ফাইল প্রসেসিং পরের ব্লকে থেমে যায়
 
 
 # --- /start কমান্ড হ্যান্ডলার (HTML ফরম্যাটে ফিক্স করা) ---
@@ -188,7 +3148,7 @@ async def start_command(update: telegram.Update, context: ContextTypes.DEFAULT_T
     """
     নতুন ব্যবহারকারীকে /start কমান্ডে বিস্তারিত নির্দেশনা দেখায়।
     """
-    clear_user_state(context.user_data) # স্টেট রিসেট করা
+    clear_user_state(context.user_data, update.effective_user.id) # স্টেট রিসেট করা
 
     # --- HTML ফরম্যাটে পরিবর্তন করা হয়েছে ---
     instructions = """
@@ -203,6 +3163,7 @@ async def start_command(update: telegram.Update, context: ContextTypes.DEFAULT_T
 • কমান্ড দিন: <code>/setchannel &lt;channel_id_or_@username&gt;</code>
 • উদাহরণ (প্রাইভেট চ্যানেল): <code>/setchannel -100123456789</code>
 • উদাহরণ (পাবলিক চ্যানেল): <code>/setchannel @MyQuizChannel</code>
+• একাধিক চ্যানেলে পোস্ট করতে: <code>/addchannel @AnotherChannel</code> (তালিকা দেখতে <code>/channels</code>)
 <i>(বটকে অবশ্যই সেই চ্যানেলের অ্যাডমিন হতে হবে এবং পোল পোস্ট করার অনুমতি থাকতে হবে)</i>
 
 <b>ধাপ ২: প্রশ্ন পাঠানো</b>
@@ -233,6 +3194,7 @@ async def start_command(update: telegram.Update, context: ContextTypes.DEFAULT_T
 
 <b>অন্যান্য কমান্ড:</b>
 • <code>/cancel</code> - যেকোনো সময় কোনো কাজ (যেমন সূচনা বার্তার জন্য অপেক্ষা) বাতিল করতে এই কমান্ড দিন।
+• <code>/status</code> - পোস্টিং চলাকালীন কতগুলো পোল পাঠানো হয়েছে তা দেখতে এই কমান্ড দিন।
 • <code>/help</code> - কমান্ডগুলোর একটি সংক্ষিপ্ত তালিকা দেখতে এই কমান্ড দিন।
 """
 
@@ -243,22 +3205,154 @@ async def start_command(update: telegram.Update, context: ContextTypes.DEFAULT_T
 
 # --- /setchannel কমান্ড হ্যান্ডলার ---
 async def set_channel(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """আগের সব চ্যানেল মুছে নতুন এক বা একাধিক টার্গেট চ্যানেল সেট করে।"""
     user_id = update.effective_user.id
-    clear_user_state(context.user_data)
+    clear_user_state(context.user_data, user_id)
     if not context.args:
-        await update.message.reply_text("⚠️ ব্যবহার: /setchannel <channel_id_or_@username>")
+        await update.message.reply_text("⚠️ ব্যবহার: /setchannel <channel_id_or_@username> [আরও চ্যানেল...]")
+        return
+    channels = list(dict.fromkeys(context.args)) # ক্রম বজায় রেখে ডুপ্লিকেট বাদ
+    if len(channels) > MAX_TARGET_CHANNELS:
+        await update.message.reply_text(f"⚠️ সর্বোচ্চ {MAX_TARGET_CHANNELS} টি চ্যানেল সেট করা যায়।")
+        return
+    if not await save_target_channels(user_id, channels): # ডাটাবেসে সেভ (ক্যাশ আপডেট সহ)
+        await update.message.reply_text("❌ চ্যানেল সেভ করতে সমস্যা হয়েছে। কিছুক্ষণ পর আবার চেষ্টা করুন।")
         return
-    target_channel = context.args[0]
-    save_target_channel_to_db(user_id, target_channel) # ডাটাবেসে সেভ
     await update.message.reply_text(
-        f"✅ টার্গেট চ্যানেল সফলভাবে সেট করা হয়েছে: {target_channel}\n"
+        f"✅ টার্গেট চ্যানেল সফলভাবে সেট করা হয়েছে: {', '.join(channels)}\n"
         "(এই সেটিংটি এখন স্থায়ীভাবে সেভ থাকবে)"
     )
 
+# --- /addchannel কমান্ড হ্যান্ডলার ---
+async def add_channel(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """আগের চ্যানেলগুলো রেখে আরও একটি টার্গেট চ্যানেল যোগ করে।"""
+    user_id = update.effective_user.id
+    if not context.args:
+        await update.message.reply_text("⚠️ ব্যবহার: /addchannel <channel_id_or_@username>")
+        return
+    channel = context.args[0]
+    channels = await get_target_channels(user_id)
+    if channel in channels:
+        await update.message.reply_text(f"ℹ️ '{channel}' আগে থেকেই আপনার চ্যানেল তালিকায় আছে।")
+        return
+    if len(channels) >= MAX_TARGET_CHANNELS:
+        await update.message.reply_text(f"⚠️ সর্বোচ্চ {MAX_TARGET_CHANNELS} টি চ্যানেল রাখা যায়। আগে /removechannel দিয়ে কোনোটি মুছুন।")
+        return
+    if not await add_target_channel(user_id, channel):
+        await update.message.reply_text("❌ চ্যানেল যোগ করতে সমস্যা হয়েছে। কিছুক্ষণ পর আবার চেষ্টা করুন।")
+        return
+    await update.message.reply_text(f"✅ চ্যানেল যোগ করা হয়েছে: {channel}\nএখন মোট {len(channels) + 1} টি চ্যানেলে পোস্ট হবে।")
+
+# --- /removechannel কমান্ড হ্যান্ডলার ---
+async def remove_channel(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not context.args:
+        await update.message.reply_text("⚠️ ব্যবহার: /removechannel <channel_id_or_@username>")
+        return
+    channel = context.args[0]
+    removed = await remove_target_channel(user_id, channel)
+    if removed is None:
+        await update.message.reply_text("❌ চ্যানেল মুছতে সমস্যা হয়েছে। কিছুক্ষণ পর আবার চেষ্টা করুন।")
+    elif not removed:
+        await update.message.reply_text(f"⚠️ '{channel}' আপনার চ্যানেল তালিকায় নেই। তালিকা দেখতে /channels দিন।")
+    else:
+        await update.message.reply_text(f"✅ চ্যানেল মুছে ফেলা হয়েছে: {channel}")
+
+# --- /channels কমান্ড হ্যান্ডলার ---
+async def list_channels(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    channels = await get_target_channels(update.effective_user.id)
+    if not channels:
+        await update.message.reply_text("⚠️ টার্গেট চ্যানেল সেট করা নেই। /setchannel ব্যবহার করুন।")
+        return
+    lines = [f"📢 আপনার টার্গেট চ্যানেল ({len(channels)} টি):"]
+    lines.extend(f" {i+1}. {channel}" for i, channel in enumerate(channels))
+    await update.message.reply_text("\n".join(lines))
+
+# --- নতুন: কুইজ লাইব্রেরির কমান্ড (/library, /search, /repost) ---
+def format_library_quizzes(quizzes: list[dict]) -> str:
+    lines = []
+    for quiz in quizzes:
+        title = " ".join(quiz["intro_text"].split())
+        if len(title) > 50:
+            title = title[:49] + "…"
+        lines.append(
+            f"\n#{quiz['quiz_id']} — {title}\n"
+            f"   {quiz['questions']} টি প্রশ্ন, {quiz['post_count']} বার পোস্ট, সর্বশেষ {quiz['last_posted_at']:%d-%m-%Y}"
+        )
+    return "".join(lines)
+
+async def post_quiz_to_channels(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE,
+                                target_channels: list[str], intro_text: str, questions_data: list[dict]) -> list[int]:
+    """
+    প্রতিটি চ্যানেলের জন্য আলাদা জব ডাটাবেসে সেভ হয় এবং সবগুলো একসাথে আলাদা টাস্কে চলে,
+    তাই হ্যান্ডলার (এবং অন্য ইউজারদের আপডেট) আটকে থাকে না। শুরু হওয়া জবগুলোর ID ফেরত দেয়।
+    """
+    user_id, chat_id = update.effective_user.id, update.effective_chat.id
+    jobs = [new_posting_job(user_id, chat_id, channel, intro_text, questions_data) for channel in target_channels]
+    job_ids = [job_id for job_id in await start_posting_jobs(context.application, jobs, update=update) if job_id is not None]
+    if job_ids:
+        await context.bot.send_message(chat_id=chat_id, text=f"ℹ️ পোস্টিং জব {', '.join(f'#{job_id}' for job_id in job_ids)} শুরু হয়েছে। অগ্রগতি দেখতে /status দিন।")
+    return job_ids
+
+async def library_command(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """ইউজারের লাইব্রেরিতে থাকা সাম্প্রতিক কুইজগুলো দেখায়।"""
+    quizzes = await asyncio.to_thread(get_library_quizzes_from_db, update.effective_user.id)
+    if not quizzes:
+        await update.message.reply_text("📚 আপনার লাইব্রেরিতে এখনো কোনো কুইজ নেই। কোনো কুইজ পোস্ট করলে সেটি এখানে সেভ হবে।")
+        return
+    await update.message.reply_text(
+        "📚 আপনার সাম্প্রতিক কুইজ:" + format_library_quizzes(quizzes) + "\n\nআবার পোস্ট করতে: /repost <ID>"
+    )
+
+async def search_command(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """সূচনা বার্তা বা প্রশ্নের টেক্সট দিয়ে লাইব্রেরিতে কুইজ খোঁজে।"""
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text("⚠️ কী খুঁজবেন লিখুন। যেমন: /search রসায়ন")
+        return
+    quizzes = await asyncio.to_thread(get_library_quizzes_from_db, update.effective_user.id, query)
+    if not quizzes:
+        await update.message.reply_text(f"🔍 '{query}' দিয়ে কোনো কুইজ পাওয়া যায়নি।")
+        return
+    await update.message.reply_text(f"🔍 '{query}' এর ফলাফল:" + format_library_quizzes(quizzes) + "\n\nআবার পোস্ট করতে: /repost <ID>")
+
+async def repost_command(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    লাইব্রেরির একটি কুইজ AI কল ছাড়াই সরাসরি পোস্টিং জবে পাঠায়।
+    /repost <ID> [নতুন সূচনা বার্তা] — সূচনা না দিলে আগের সূচনা বার্তাটিই যায়।
+    """
+    user = update.effective_user
+    parts = (update.message.text or "").split(maxsplit=2)
+    quiz_ref = parts[1].lstrip("#") if len(parts) > 1 else ""
+    if not quiz_ref.isdigit():
+        await update.message.reply_text("⚠️ কুইজের ID দিন। যেমন: /repost 12 (ID দেখতে /library)")
+        return
+    quiz_id = int(quiz_ref)
+    target_channels = await get_target_channels(user.id)
+    if not target_channels:
+        await update.message.reply_text("⚠️ টার্গেট চ্যানেল সেট করা নেই। /setchannel ব্যবহার করুন।")
+        return
+    stored = await asyncio.to_thread(load_library_quiz_from_db, user.id, quiz_id)
+    if not stored or not stored[1]:
+        await update.message.reply_text(f"⚠️ আপনার লাইব্রেরিতে #{quiz_id} নম্বর কুইজ পাওয়া যায়নি।")
+        return
+    intro_text, questions_data = stored
+    if len(parts) > 2:
+        intro_text = parts[2]
+
+    channel_list = ", ".join(f"'{channel}'" for channel in target_channels)
+    await update.message.reply_text(f"♻️ লাইব্রেরির কুইজ #{quiz_id} ({len(questions_data)} টি প্রশ্ন) {channel_list}-এ আবার পোস্ট করা হচ্ছে...")
+    await post_quiz_to_channels(update, context, target_channels, intro_text, questions_data)
+    await asyncio.to_thread(mark_library_quiz_posted_in_db, quiz_id)
+
+
 # --- /cancel কমান্ড হ্যান্ডলার ---
 async def cancel_quiz(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
-    """পেন্ডিং থাকা কুইজ পোস্ট বা টেক্সট বাফার বাতিল করে।"""
-    clear_user_state(context.user_data)
+    """পেন্ডিং থাকা কুইজ পোস্ট, টেক্সট বাফার বা চলমান AI প্রসেসিং বাতিল করে।"""
+    clear_user_state(context.user_data, update.effective_user.id)
+    ai_pool: AIWorkerPool | None = context.bot_data.get('ai_pool')
+    if ai_pool:
+        ai_pool.cancel_user(update.effective_user.id) # চলমান AI রিকোয়েস্ট বাতিল
     await update.message.reply_text("✅ বর্তমান কাজটি বাতিল করা হয়েছে। আপনি নতুন প্রশ্ন পাঠাতে পারেন।")
 
 
@@ -274,7 +3368,16 @@ async def help_command(update: telegram.Update, context: ContextTypes.DEFAULT_TY
 
 • <code>/start</code> - বট সম্পর্কে বিস্তারিত নির্দেশনা ও সম্পূর্ণ গাইডলাইন দেখায়।
 • <code>/setchannel &lt;ID&gt;</code> - কোন চ্যানেলে পোল পোস্ট করতে চান তা সেট করে। (যেমন: <code>/setchannel -100123...</code>)
+• <code>/addchannel &lt;ID&gt;</code> - আরও একটি চ্যানেল যোগ করে (একই কুইজ সব চ্যানেলে পোস্ট হবে)।
+• <code>/removechannel &lt;ID&gt;</code> - তালিকা থেকে একটি চ্যানেল মুছে ফেলে।
+• <code>/channels</code> - আপনার সব টার্গেট চ্যানেলের তালিকা দেখায়।
 • <code>/cancel</code> - কোনো চলমান কাজ (যেমন: সূচনা বার্তার জন্য অপেক্ষা) বাতিল করে।
+• <code>/status</code> - আপনার কুইজ পোস্টিং-এর অগ্রগতি দেখায়।
+• <code>/stats</code> - বটের ক্যাশ ও প্রসেসিং পরিসংখ্যান দেখায়।
+• <code>/library</code> - আগে পোস্ট করা কুইজগুলোর তালিকা (ID সহ) দেখায়।
+• <code>/search &lt;শব্দ&gt;</code> - সূচনা বা প্রশ্নের টেক্সট দিয়ে লাইব্রেরিতে কুইজ খোঁজে।
+• <code>/repost &lt;ID&gt; [সূচনা]</code> - লাইব্রেরির কুইজ AI ছাড়াই সাথে সাথে আবার পোস্ট করে।
+• <b>ফাইল</b> - .txt, .csv বা .json ফাইল পাঠালে পুরো প্রশ্ন ব্যাংক একবারে ইমপোর্ট হয় (CSV/JSON-এ question, options, answer কলাম থাকলে AI ছাড়াই)।
 • <code>/help</code> - এই হেল্প মেসেজটি দেখায়।
 """
     await update.message.reply_text(
@@ -284,11 +3387,72 @@ async def help_command(update: telegram.Update, context: ContextTypes.DEFAULT_TY
 # ------------------------------------
 
 
+# --- /status কমান্ড হ্যান্ডলার ---
+async def status_command(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """ইউজারের সাম্প্রতিক পোস্টিং জবগুলোর অগ্রগতি দেখায়।"""
+    jobs = await asyncio.to_thread(get_user_posting_jobs_from_db, update.effective_user.id)
+    if not jobs:
+        await update.message.reply_text("ℹ️ আপনার কোনো পোস্টিং জব পাওয়া যায়নি।")
+        return
+    status_labels = {JOB_PENDING: "⏳ অপেক্ষমাণ", JOB_RUNNING: "🚀 চলছে", JOB_DONE: "✅ সম্পন্ন", JOB_FAILED: "❌ ব্যর্থ"}
+    lines = ["📋 আপনার সাম্প্রতিক পোস্টিং জব:"]
+    for job in jobs:
+        lines.append(
+            f"\n#{job['job_id']} → {job['target_channel']} — {status_labels.get(job['status'], job['status'])}\n"
+            f"   পাঠানো হয়েছে {job['sent']}/{job['total']} টি মেসেজ"
+            + (f", ব্যর্থ {job['failed']} টি" if job['failed'] else "")
+        )
+    await update.message.reply_text("\n".join(lines))
+
+
+# --- /stats কমান্ড হ্যান্ডলার ---
+async def stats_command(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """AI ক্যাশের হিট/মিস এবং AI কিউয়ের বর্তমান অবস্থা দেখায়।"""
+    lines = ["📊 <b>বটের পরিসংখ্যান</b>", ""]
+    ai_cache: AIResultCache | None = context.bot_data.get('ai_cache')
+    if ai_cache:
+        cache_stats = ai_cache.stats()
+        lines.append(
+            f"• AI ক্যাশ: মেমোরি হিট {cache_stats['memory_hits']}, ডাটাবেস হিট {cache_stats['db_hits']}, "
+            f"মিস {cache_stats['misses']} (হিট রেট {cache_stats['hit_rate']:.0%}, এন্ট্রি {cache_stats['entries']})"
+        )
+    ai_pool: AIWorkerPool | None = context.bot_data.get('ai_pool')
+    if ai_pool:
+        lines.append(f"• AI কিউ: {ai_pool.waiting} টি অপেক্ষমাণ (সর্বোচ্চ সমান্তরাল {ai_pool.max_concurrency})")
+    ai_model = context.bot_data.get('ai_model')
+    if isinstance(ai_model, ModelRouter):
+        for name, health in ai_model.stats().items():
+            p95 = f"{health['p95_s']:.1f}s" if health['p95_s'] is not None else "—"
+            state = "🔌 সার্কিট খোলা" if health['circuit_open'] else "✅"
+            lines.append(
+                f"• মডেল <code>{name}</code>: {state}, সাম্প্রতিক {health['requests']} টি রিকোয়েস্টে এরর {health['error_rate']:.0%}, p95 {p95}"
+            )
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
 # --- টাইমার শেষ হলে এই ফাংশনটি রান হবে (বাফারিং এর জন্য) ---
 async def process_buffered_text(context: ContextTypes.DEFAULT_TYPE):
     """
     বাফারে জমা হওয়া সম্পূর্ণ টেক্সটকে AI দিয়ে প্রসেস করে।
+    মাল্টি-ওয়ার্কার মোডে ইউজারের লিজ অন্য ওয়ার্কারের হাতে থাকলে কিছুক্ষণ পরে আবার চেষ্টা করে।
     """
+    user_id = context.job.data['user_id']
+    async with worker_lease(f"user:{user_id}") as acquired:
+        if acquired:
+            await _process_buffered_text(context)
+            return
+    print(f"ℹ️ user_id {user_id} এর আগের সাবমিশন অন্য ওয়ার্কারে প্রসেস হচ্ছে, {TEXT_BUFFER_DELAY} সেকেন্ড পরে আবার চেষ্টা।")
+    if _buffer_jobs.get(user_id, context.job) is context.job: # এর মধ্যে নতুন টাইমার সেট না হয়ে থাকলে
+        _buffer_jobs[user_id] = context.job_queue.run_once(
+            process_buffered_text,
+            TEXT_BUFFER_DELAY,
+            data=context.job.data,
+            chat_id=context.job.chat_id,
+            user_id=user_id,
+            name=context.job.name,
+        )
+
+async def _process_buffered_text(context: ContextTypes.DEFAULT_TYPE):
     job_data = context.job.data
     chat_id = job_data['chat_id']
     user_id = job_data['user_id']
@@ -300,51 +3464,141 @@ async def process_buffered_text(context: ContextTypes.DEFAULT_TYPE):
          return # ফাংশন থেকে বের হয়ে যাও
 
     user_data = context.application.user_data[user_id]
-    ai_model = context.application.bot_data.get('ai_model') # <-- .get() ব্যবহার করা হলো
+    # এক্সট্র্যাকশন চলাকালীন এই ইউজারের নতুন টেক্সট নতুন বাফার বা দ্বিতীয় এক্সট্র্যাকশন শুরু করে না (handle_text দেখুন),
+    # তাই একই ইউজারের দুটি ফলাফল একে অপরের pending_quiz_data মুছে বা বদলে দিতে পারে না
+    user_data['extracting'] = True
+    try:
+        await _extract_buffered_text(context, chat_id, user_id, user_data)
+    finally:
+        user_data.pop('extracting', None)
+
+async def _extract_buffered_text(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, user_data: dict):
+    ai_model = await get_ai_model(context.application.bot_data) # ওয়ার্ম-আপ চললে শেষ হওয়া পর্যন্ত অপেক্ষা
+    ai_pool: AIWorkerPool | None = context.application.bot_data.get('ai_pool')
 
     # ---!!! সেফটি চেক: যদি ai_model লোড না হয়ে থাকে !!!---
-    if not ai_model:
+    if not ai_model or not ai_pool:
         print("❌ process_buffered_text: AI মডেল লোড হয়নি। বট রিস্টার্ট করুন।")
         await context.bot.send_message(chat_id=chat_id, text="❌ একটি অভ্যন্তরীণ ত্রুটি হয়েছে (AI মডেল লোড হয়নি)। অনুগ্রহ করে বট এডমিনকে জানান।")
-        clear_user_state(user_data)
+        clear_user_state(user_data, user_id)
         return
 
-    target_channel = get_target_channel_from_db(user_id) # ডাটাবেস থেকে চ্যানেল আইডি পড়া
-    if not target_channel:
+    target_channels = await get_target_channels(user_id) # ক্যাশ/ডাটাবেস থেকে চ্যানেল আইডি পড়া
+    if not target_channels:
         await context.bot.send_message(chat_id=chat_id, text="⚠️ টার্গেট চ্যানেল সেট করা নেই। /setchannel ব্যবহার করুন।")
-        clear_user_state(user_data)
+        clear_user_state(user_data, user_id)
         return
 
     full_text = "\n".join(user_data.get('text_buffer', []))
+    buffer_started = user_data.pop('buffer_started', None)
+    if buffer_started is not None:
+        BUFFER_WAIT_SECONDS.observe(time.monotonic() - buffer_started)
 
     # বাফার এবং জব ক্লিয়ার করা
-    if 'buffer_job' in user_data: del user_data['buffer_job']
+    if _buffer_jobs.get(user_id) is context.job: del _buffer_jobs[user_id]
     if 'text_buffer' in user_data: del user_data['text_buffer']
 
     if not full_text:
         await context.bot.send_message(chat_id=chat_id, text="⚠️ টেক্সট খুঁজে পাওয়া যায়নি।")
-        clear_user_state(user_data)
+        clear_user_state(user_data, user_id)
         return
 
-    await context.bot.send_message(chat_id=chat_id, text=f"✅ সম্পূর্ণ টেক্সট পেয়েছি ({len(full_text)} অক্ষর)। জেমিনি এআই দিয়ে প্রসেস করছি... 🤖")
+    status_message = await context.bot.send_message(chat_id=chat_id, text=f"✅ সম্পূর্ণ টেক্সট পেয়েছি ({len(full_text)} অক্ষর)। প্রসেস করছি... 🤖")
+    progress = ExtractionProgress(status_message, AI_PROGRESS_INTERVAL)
 
-    questions_data = get_questions_from_ai(full_text, ai_model) # ai_model পাস করা
+    try:
+        # সঠিক ফরম্যাটের প্রশ্ন লোকালি পার্স হয়; বাকিগুলোর AI কল আলাদা থ্রেড পুলে চলে
+        questions_data, extraction_stats = await extract_questions(
+            full_text, ai_model, ai_pool, user_id, context.application.bot_data.get('ai_cache'), progress.add,
+            context.application.bot_data.get('ai_batcher'),
+        )
+    except AIQueueFullError as e:
+        print(f"⚠️ {e}")
+        await context.bot.send_message(chat_id=chat_id, text="⏳ এই মুহূর্তে অনেক অনুরোধ প্রসেস হচ্ছে। অনুগ্রহ করে কিছুক্ষণ পর আবার পাঠান।")
+        clear_user_state(user_data, user_id)
+        return
+    except AIInputTooLargeError as e:
+        print(f"⚠️ {e}")
+        await context.bot.send_message(chat_id=chat_id, text="📏 টেক্সটটি একবারে প্রসেস করার জন্য অনেক বড়। অনুগ্রহ করে কয়েকটি ছোট ভাগে আলাদাভাবে পাঠান।")
+        clear_user_state(user_data, user_id)
+        return
+    except AIRequestCancelled:
+        print(f"ℹ️ user_id {user_id} এর AI প্রসেসিং /cancel দিয়ে বাতিল করা হয়েছে।")
+        return # /cancel ইতিমধ্যে স্টেট রিসেট করেছে
 
     if not questions_data or not isinstance(questions_data, list) or len(questions_data) == 0:
         await context.bot.send_message(chat_id=chat_id, text="❌ দুঃখিত, AI প্রশ্ন তৈরি করতে ব্যর্থ হয়েছে বা কোনো প্রশ্ন খুঁজে পায়নি। ইনপুট টেক্সট চেক করুন।")
-        clear_user_state(user_data)
+        clear_user_state(user_data, user_id)
+        return
+
+    QUESTIONS_EXTRACTED.inc(extraction_stats['local'], source="local")
+    QUESTIONS_EXTRACTED.inc(extraction_stats['ai'], source="ai")
+
+    print(f"ℹ️ user_id {user_id}: লোকাল পার্সার {extraction_stats['local']} টি, AI {extraction_stats['ai']} টি প্রশ্ন।")
+    details = f"(লোকাল পার্সার: {extraction_stats['local']} টি, AI: {extraction_stats['ai']} টি)\n"
+    if extraction_stats['failed_chunks']:
+        details += f"⚠️ টেক্সটের {extraction_stats['failed_chunks']} টি অংশ প্রসেস করা যায়নি, সেগুলোর প্রশ্ন বাদ পড়েছে।\n"
+    if extraction_stats['partial_chunks']:
+        details += f"⚠️ {extraction_stats['partial_chunks']} টি অংশের AI রেসপন্স মাঝপথে ভেঙে গেছে; যতটুকু পাওয়া গেছে রাখা হয়েছে।\n"
+    await offer_questions(context, chat_id, user_id, user_data, questions_data, details)
+
+async def offer_questions(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, user_data: dict,
+                          questions_data: list, details: str = ""):
+    """
+    প্রশ্নগুলো টেলিগ্রামের নিয়ম অনুযায়ী যাচাই করে পেন্ডিং কুইজ হিসেবে রাখে এবং ইউজারের কাছে সূচনা বার্তা চায়।
+    details (উৎস, বাদ পড়া অংশ ইত্যাদি) সারাংশে যোগ হয়।
+    """
+    # টেলিগ্রামের সীমা অনুযায়ী সব প্রশ্ন একসাথে যাচাই/মেরামত, যাতে পোস্টিং-এর সময় কোনো পোল রিজেক্ট না হয়
+    questions_data, repaired_count, rejected = preflight_questions(questions_data)
+    rejected_report = ""
+    if rejected:
+        rejected_report = f"⚠️ {len(rejected)} টি প্রশ্ন টেলিগ্রামের নিয়ম অনুযায়ী পোস্ট করা যাবে না, বাদ দেওয়া হয়েছে:\n"
+        for number, reason in rejected[:10]:
+            rejected_report += f"  - প্রশ্ন {number}: {reason}\n"
+        if len(rejected) > 10:
+            rejected_report += f"  - ...এবং আরও {len(rejected) - 10} টি\n"
+    if not questions_data:
+        await context.bot.send_message(chat_id=chat_id, text="❌ পোস্ট করার মতো কোনো বৈধ প্রশ্ন পাওয়া যায়নি।\n" + details + rejected_report)
+        clear_user_state(user_data, user_id)
         return
 
     # প্রশ্ন সফল হলে, সেভ করা এবং সূচনার জন্য বলা
-    user_data['pending_quiz_data'] = questions_data
+    user_data['pending_quiz_data'] = [QuizQuestion.from_dict(question) for question in questions_data]
     user_data['CONV_STATE'] = STATE_AWAITING_INTRO
+    summary = f"✅ {len(questions_data)} টি প্রশ্ন সফলভাবে প্রসেস করা হয়েছে।\n" + details
+    if repaired_count:
+        summary += f"🛠️ {repaired_count} টি প্রশ্ন টেলিগ্রামের সীমার মধ্যে আনতে স্বয়ংক্রিয়ভাবে ঠিক করা হয়েছে (লম্বা অপশন/ব্যাখ্যা ছোট করা, ডুপ্লিকেট অপশন বাদ ইত্যাদি)।\n"
+    summary += rejected_report
     await context.bot.send_message(
         chat_id=chat_id,
-        text=f"✅ {len(questions_data)} টি প্রশ্ন সফলভাবে প্রসেস করা হয়েছে।\n\n"
+        text=summary + "\n"
              "➡️ **এখন এই কুইজের জন্য একটি সূচনা বার্তা (intro text) পাঠান।**\n\n"
              "(অথবা /cancel লিখে বাতিল করুন)"
     )
 
+# --- নতুন: অ্যাডাপটিভ বাফারিং (সম্পূর্ণ সাবমিশন হলে অল্প অপেক্ষাতেই প্রসেস) ---
+def ends_with_complete_block(text: str) -> bool:
+    """টেক্সটের শেষ লাইনটি 'সঠিক উত্তর' বা 'ব্যাখ্যা' লাইন হলে True (অর্থাৎ একটি প্রশ্ন ব্লক পুরোপুরি শেষ)।"""
+    lines = [line.strip() for line in text.rstrip().splitlines() if line.strip()]
+    if not lines:
+        return False
+    return bool(_ANSWER_RE.match(lines[-1]) or _EXPLANATION_RE.match(lines[-1]))
+
+def buffer_flush_delay(message: str) -> float:
+    """
+    বাফারের এই অংশটির পরে কত সেকেন্ড অপেক্ষা করতে হবে তা ঠিক করে।
+    টেলিগ্রাম ক্লায়েন্ট ৪০৯৬ অক্ষরের কাছাকাছি অংশে টেক্সট ভাগ করে, কিন্তু ইউজার নিজেও একটি কুইজ কয়েকটি ছোট
+    মেসেজে পেস্ট করতে পারেন; তাই ছোট মেসেজের পরেও অন্তত TEXT_BUFFER_MIN_DELAY অপেক্ষা করা হয়।
+    """
+    if TEXT_BUFFER_MODE == "fixed":
+        return TEXT_BUFFER_DELAY
+    if len(message) < TEXT_SPLIT_MIN_CHARS:
+        # সম্পূর্ণ ব্লকে শেষ হলে সম্ভবত সাবমিশনের শেষ অংশ; না হলে পরের মেসেজের জন্য পুরো সময় অপেক্ষা
+        return TEXT_BUFFER_MIN_DELAY if ends_with_complete_block(message) else TEXT_BUFFER_DELAY
+    if ends_with_complete_block(message):
+        # লম্বা অংশ, কিন্তু একটি ব্লকের শেষে থেমেছে; ক্লায়েন্টের পরের অংশ সাধারণত সাথে সাথেই আসে
+        return TEXT_BUFFER_COMPLETE_DELAY
+    return TEXT_BUFFER_DELAY # মাঝপথে কাটা অংশ, পরের অংশের জন্য পুরো সময় অপেক্ষা
 
 # ---!!! মূল টেক্সট মেসেজ হ্যান্ডলার (স্টেট ম্যানেজমেন্ট + এরর রিপোর্টিং) !!!---
 async def handle_text(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
@@ -359,143 +3613,611 @@ async def handle_text(update: telegram.Update, context: ContextTypes.DEFAULT_TYP
     if current_state == STATE_AWAITING_INTRO:
 
         intro_text = user_message # এই মেসেজটিই হলো সূচনা বার্তা
-        target_channel = get_target_channel_from_db(user.id) # ডাটাবেস থেকে চ্যানেল আইডি পড়া
+        target_channels = await get_target_channels(user.id) # ক্যাশ/ডাটাবেস থেকে চ্যানেল আইডি পড়া
         questions_data = context.user_data.get('pending_quiz_data')
 
-        if not target_channel or not questions_data:
+        if not target_channels or not questions_data:
             await context.bot.send_message(chat_id=chat_id, text="⚠️ একটি ত্রুটি হয়েছে (চ্যানেল বা প্রশ্ন ডেটা পাওয়া যায়নি)। অনুগ্রহ করে /cancel করে আবার শুরু করুন।")
-            clear_user_state(context.user_data)
-            return
-
-        await context.bot.send_message(chat_id=chat_id, text=f"✅ সূচনা বার্তা পেয়েছি। '{target_channel}'-এ পোস্ট করা হচ্ছে...")
-        count = 0
-        errors = 0
-        failed_polls_info = [] # <--!!! নতুন: ব্যর্থ পোলগুলোর তথ্য রাখার জন্য লিস্ট !!!---
-
-        try:
-            # --- প্রথমে কাস্টম সূচনা বার্তাটি পোস্ট করা ---
-            await context.bot.send_message(chat_id=target_channel, text=intro_text)
-
-            # --- তারপর পোলগুলো পোস্ট করা ---
-            for poll_data in questions_data:
-                formatted_question = "Error: Question not formatted" # ডিফল্ট মান
-                try:
-                    # ---!!! ডাইনামিক লিগ্যাসি যোগ করা !!!---
-                    original_question = poll_data.get('question', 'Unknown Question') # .get() ব্যবহার
-                    dynamic_suffix = poll_data.get('suffix') # AI থেকে পাওয়া সাফিক্স (null হতে পারে)
-
-                    static_prefix = "[SOT]" # <-- আপনার স্বয়ংক্রিয় প্রিফিক্স
-
-                    # \u200B হলো একটি জিরো-উইডথ স্পেস (সুন্দর দেখানোর জন্য)
-                    formatted_question = f"{static_prefix} \u200B {original_question}"
-
-                    # যদি সাফিক্স থাকে (null না হয়), তবেই সেটি যোগ করা
-                    if dynamic_suffix:
-                        formatted_question = f"{formatted_question} \u200B {dynamic_suffix}"
-                    # -----------------------------------------------
-
-                    # টেলিগ্রাম পোলের প্রশ্নের অক্ষর সীমা চেক করা (৩০০ অক্ষর)
-                    if len(formatted_question) > 300:
-                        # যদি খুব লম্বা হয়, লিগ্যাসি ছাড়া শুধু প্রশ্নটি পাঠানো
-                        print(f"⚠️ প্রশ্নটি ৩০০ অক্ষরের বেশি ({len(formatted_question)}), লিগ্যাসি বাদ দেওয়া হচ্ছে: {original_question[:50]}...")
-                        if len(original_question) > 300:
-                            formatted_question = original_question[:300]
-                        else:
-                            formatted_question = original_question
-                    # -----------------------------------------------
-
-                    # ---!!! অপশন এবং ইনডেক্স চেক করা !!!---
-                    options = poll_data.get('options')
-                    correct_option_index = poll_data.get('correct_option_index')
-
-                    if not options or not isinstance(options, list) or len(options) < 2 or len(options) > 10:
-                        raise ValueError(f"অবৈধ অপশন সংখ্যা ({len(options) if options else 0})")
-                    if correct_option_index is None or not isinstance(correct_option_index, int) or correct_option_index < 0 or correct_option_index >= len(options):
-                        raise ValueError(f"অবৈধ সঠিক অপশন ইনডেক্স ({correct_option_index}), অপশন সংখ্যা: {len(options)}")
-                    #------------------------------------------
-
-
-                    await context.bot.send_poll(
-                        chat_id=target_channel,
-                        question=formatted_question, # <-- এখানে পরিবর্তিত প্রশ্নটি ব্যবহার করা
-                        options=options,
-                        type=telegram.Poll.QUIZ,
-                        correct_option_id=correct_option_index,
-                        explanation=poll_data.get('explanation')
-                    )
-                    count += 1
-                    await asyncio.sleep(1) # টেলিগ্রামের রেট লিমিট এড়ানোর জন্য
-
-                except Exception as e:
-                    print(f"❌ পোল পাঠাতে সমস্যা (চ্যানেল {target_channel}): {e}")
-                    errors += 1
-                    # ---!!! নতুন: ব্যর্থ পোলের তথ্য যোগ করা !!!---
-                    failed_polls_info.append({
-                        "question": original_question[:100] + ('...' if len(original_question) > 100 else ''), # প্রশ্ন সংক্ষিপ্ত করা
-                        "error": str(e) # এররের কারণ
-                    })
-                    # -----------------------------------------
-
-        except Exception as e:
-            # যদি চ্যানেল আইডি ভুল হয় বা বট অ্যাডমিন না থাকে
-            print(f"❌ চ্যানেল {target_channel}-এ মেসেজ পাঠানো যায়নি: {e}")
-            await context.bot.send_message(chat_id=chat_id, text=f"❌ চ্যানেল '{target_channel}'-এ পোস্ট করতে মারাত্মক সমস্যা হয়েছে। আইডি/বট পারমিশন চেক করুন: {e}")
-            clear_user_state(context.user_data)
+            clear_user_state(context.user_data, user.id)
             return
 
-        # সফলভাবে পোস্ট করার পর স্টেট রিসেট করা
-        clear_user_state(context.user_data)
+        # স্টেট রিসেট করা, যাতে পোস্টিং চলাকালীন ইউজার নতুন প্রশ্ন পাঠাতে পারে
+        clear_user_state(context.user_data, user.id)
+        questions_data = [question.to_dict() for question in questions_data] # পোস্টিং জব ডাটাবেসে JSON হিসেবে যায়
+        channel_list = ", ".join(f"'{channel}'" for channel in target_channels)
+        await context.bot.send_message(chat_id=chat_id, text=f"✅ সূচনা বার্তা পেয়েছি। {channel_list}-এ পোস্ট করা হচ্ছে...")
 
-        # ---!!! নতুন: বিস্তারিত ফিডব্যাক মেসেজ !!!---
-        feedback_message = f"✅ সফলভাবে চ্যানেল '{target_channel}'-এ {count} টি পোল পোস্ট করা হয়েছে।"
-        if errors > 0:
-            feedback_message += f"\n\n⚠️ কিন্তু {errors} টি পোল পোস্ট করতে সমস্যা হয়েছে:"
-            for i, failed in enumerate(failed_polls_info):
-                 # টেলিগ্রাম মেসেজের অক্ষর সীমা ৪০০০ এর কাছাকাছি, তাই খুব বেশি এরর দেখানো যাবে না
-                 if len(feedback_message) < 3800:
-                      feedback_message += f"\n {i+1}. প্রশ্ন: \"{failed['question']}\"\n    কারণ: {failed['error'][:100]}" # এরর সংক্ষিপ্ত করা
-                 else:
-                      feedback_message += "\n... (আরও এরর আছে)"
-                      break # মেসেজ খুব বড় হয়ে গেলে লুপ থামিয়ে দাও
-        # -------------------------------------------
-        await context.bot.send_message(chat_id=chat_id, text=feedback_message)
+        # কুইজটি লাইব্রেরিতে সেভ হওয়া আর পোস্টিং জব শুরু হওয়া একসাথে চলে, যাতে পোস্টিং দেরি না হয়
+        quiz_id, _ = await asyncio.gather(
+            asyncio.to_thread(save_quiz_to_library_db, user.id, intro_text, questions_data),
+            post_quiz_to_channels(update, context, target_channels, intro_text, questions_data),
+        )
+        if quiz_id is not None:
+            await context.bot.send_message(chat_id=chat_id, text=f"📚 কুইজটি লাইব্রেরিতে #{quiz_id} নম্বরে সেভ হয়েছে। পরে আবার পোস্ট করতে: /repost {quiz_id}")
 
 
     # --- ধাপ ২: যদি বট নতুন প্রশ্নের জন্য অপেক্ষা করে (IDLE) (বাফারিং লজিক) ---
     elif current_state == STATE_IDLE:
 
-        target_channel = get_target_channel_from_db(user.id) # ডাটাবেস থেকে চ্যানেল আইডি পড়া
-        if not target_channel:
+        target_channels = await get_target_channels(user.id) # ক্যাশ/ডাটাবেস থেকে চ্যানেল আইডি পড়া
+        if not target_channels:
             await context.bot.send_message(chat_id=chat_id, text="⚠️ টার্গেট চ্যানেল সেট করা নেই। /setchannel ব্যবহার করুন।")
             return
+        if 'document_upload' in context.user_data:
+            await context.bot.send_message(chat_id=chat_id, text="⏳ আপনার পাঠানো ফাইলটি এখনও প্রসেস হচ্ছে। শেষ হলে টেক্সট পাঠান, অথবা /cancel দিন।")
+            return
+        if 'extracting' in context.user_data:
+            await context.bot.send_message(chat_id=chat_id, text="⏳ আপনার আগের টেক্সট এখনও প্রসেস হচ্ছে। শেষ হলে সূচনা বার্তা বা নতুন টেক্সট পাঠান, অথবা /cancel দিন।")
+            return
 
         # --- বাফারিং লজিক শুরু ---
 
         # যদি কোনো টাইমার আগে থেকেই চালু থাকে (অর্থাৎ এটি একটি স্প্লিট মেসেজ)
-        if 'buffer_job' in context.user_data:
-            context.user_data['buffer_job'].remove() # পুরানো টাইমার বাতিল
+        cancel_buffer_job(user.id) # পুরানো টাইমার বাতিল
 
         # টেক্সট বাফারে এই মেসেজটি যোগ করা
-        if 'text_buffer' not in context.user_data:
-            context.user_data['text_buffer'] = []
-            # এটিই প্রথম মেসেজ, তাই ইউজারকে জানানো
-            await context.bot.send_message(chat_id=chat_id, text="⏳ টেক্সট পেয়েছি... (আরও টেক্সট এলে সেগুলোর জন্য ৩ সেকেন্ড অপেক্ষা করছি)")
-
-        context.user_data['text_buffer'].append(user_message)
+        # (await-এর আগেই যোগ করা হয়, যাতে একসাথে আসা আপডেটে অংশগুলোর ক্রম না বদলায়)
+        is_first_message = 'text_buffer' not in context.user_data
+        context.user_data.setdefault('text_buffer', []).append(user_message)
+        delay = buffer_flush_delay(user_message)
+        if is_first_message:
+            context.user_data['buffer_started'] = time.monotonic()
+            if delay >= TEXT_BUFFER_DELAY:
+                # এটিই প্রথম মেসেজ এবং আরও অংশ আসতে পারে, তাই ইউজারকে জানানো
+                await context.bot.send_message(chat_id=chat_id, text="⏳ টেক্সট পেয়েছি... (আরও টেক্সট এলে সেগুলোর জন্য ৩ সেকেন্ড অপেক্ষা করছি)")
 
-        # একটি নতুন টাইমার সেট করা
+        # একটি নতুন টাইমার সেট করা (সম্পূর্ণ সাবমিশনের জন্য ছোট delay)
         new_job = context.job_queue.run_once(
             process_buffered_text,
-            TEXT_BUFFER_DELAY,
+            delay,
             data={'chat_id': chat_id, 'user_id': user.id},
+            chat_id=chat_id,
+            user_id=user.id, # যাতে জব শেষে এই ইউজারের স্টেট পারসিস্টেন্সে সেভ হয়
             name=f"buffer-{user.id}"
         )
-        context.user_data['buffer_job'] = new_job
+        _buffer_jobs[user.id] = new_job
         # --- বাফারিং লজিক শেষ ---
 
 
+# --- নতুন: ফাইল আপলোড (.txt/.csv/.json) থেকে প্রশ্ন ইমপোর্ট ---
+# বড় প্রশ্ন ব্যাংক অনেকগুলো ৪০৯৬ অক্ষরের মেসেজে ভাগ না করে একটি ফাইল হিসেবে পাঠানো যায়।
+# ফাইলটি ডিস্কে নামিয়ে টুকরো টুকরো পড়া হয়, তাই হাজারো প্রশ্নের ফাইলেও পুরো টেক্সট একসাথে মেমোরিতে আসে না।
+# CSV/JSON-এ প্রশ্ন, অপশন ও উত্তরের কলাম থাকলে AI ছাড়াই সরাসরি প্রশ্ন তৈরি হয়; সাধারণ টেক্সট ফাইল
+# ব্লকে ব্লকে লোকাল পার্সার ও AI এক্সট্র্যাকশনে যায়।
+DOCUMENT_EXTENSIONS = (".txt", ".csv", ".json")
+DOCUMENT_READ_BATCH = 500 # থ্রেড থেকে একবারে কতগুলো রেকর্ড/ব্লক আনা হবে
+
+_DOCUMENT_QUESTION_KEYS = ("question", "প্রশ্ন", "q")
+_DOCUMENT_ANSWER_KEYS = ("answer", "correct", "correct_answer", "উত্তর", "সঠিক উত্তর")
+_DOCUMENT_EXPLANATION_KEYS = ("explanation", "ব্যাখ্যা")
+_DOCUMENT_SUFFIX_KEYS = ("suffix", "tag", "ট্যাগ")
+_DOCUMENT_OPTION_COLUMN_RE = re.compile(r"^(?:option|opt|অপশন)\s*[_ ]?([0-9]+)$")
+_LATIN_OPTION_LETTERS = "abcdefghij"
+_BENGALI_DIGITS = str.maketrans("০১২৩৪৫৬৭৮৯", "0123456789")
+
+def _first_value(record: dict, keys: tuple):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+def _document_options(record: dict) -> list[str]:
+    options = record.get("options") or record.get("অপশন")
+    if isinstance(options, list):
+        return [str(option).strip() for option in options if str(option).strip()]
+    if isinstance(options, str):
+        return [option.strip() for option in options.split("|") if option.strip()]
+    # option1, option2... অথবা a, b, c... অথবা ক, খ, গ... কলাম
+    numbered = []
+    for key, value in record.items():
+        match = _DOCUMENT_OPTION_COLUMN_RE.match(key)
+        if match:
+            position = int(match.group(1))
+        elif len(key) == 1 and key in _LATIN_OPTION_LETTERS:
+            position = _LATIN_OPTION_LETTERS.index(key)
+        elif len(key) == 1 and key in OPTION_LETTERS:
+            position = OPTION_LETTERS.index(key)
+        else:
+            continue
+        if value not in (None, "") and str(value).strip():
+            numbered.append((position, str(value).strip()))
+    return [option for _, option in sorted(numbered)]
+
+def _document_answer_index(record: dict, options: list[str]) -> int | None:
+    """correct_option_index (0 থেকে) অথবা answer কলাম (অপশনের টেক্সট, অক্ষর a/ক, বা 1 থেকে শুরু নম্বর) থেকে ইনডেক্স।"""
+    if record.get("correct_option_index") not in (None, ""):
+        value, zero_based = record["correct_option_index"], True
+    else:
+        value, zero_based = _first_value(record, _DOCUMENT_ANSWER_KEYS), False
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        index = value if zero_based else value - 1
+    else:
+        text = str(value).strip()
+        folded = [option.casefold() for option in options]
+        if not zero_based and text.casefold() in folded:
+            index = folded.index(text.casefold())
+        else:
+            text = text.strip("()").strip()
+            digits = text.translate(_BENGALI_DIGITS)
+            if digits.isdigit():
+                index = int(digits) if zero_based else int(digits) - 1
+            elif len(text) == 1 and text.lower() in _LATIN_OPTION_LETTERS:
+                index = _LATIN_OPTION_LETTERS.index(text.lower())
+            elif len(text) == 1 and text in OPTION_LETTERS:
+                index = OPTION_LETTERS.index(text)
+            else:
+                return None
+    return index if 0 <= index < len(options) else None
+
+def document_record_to_question(record) -> dict:
+    """CSV-এর একটি সারি বা JSON-এর একটি অবজেক্টকে AI আউটপুটের মতো প্রশ্ন dict-এ রূপান্তর করে; না পারলে ValueError।"""
+    if not isinstance(record, dict):
+        raise ValueError("অবজেক্ট নয়")
+    record = {unicodedata.normalize("NFC", str(key).strip().lower()): value for key, value in record.items() if key is not None}
+    question = _first_value(record, _DOCUMENT_QUESTION_KEYS)
+    if question is None:
+        raise ValueError("প্রশ্নের কলাম নেই")
+    options = _document_options(record)
+    if len(options) < 2:
+        raise ValueError("কমপক্ষে ২টি অপশন নেই")
+    answer = _document_answer_index(record, options)
+    if answer is None:
+        raise ValueError("সঠিক উত্তর চেনা যায়নি")
+    explanation = _first_value(record, _DOCUMENT_EXPLANATION_KEYS)
+    suffix = _first_value(record, _DOCUMENT_SUFFIX_KEYS)
+    return {
+        "question": str(question).strip(),
+        "options": options,
+        "correct_option_index": answer,
+        "explanation": str(explanation).strip() if explanation is not None else None,
+        "suffix": str(suffix).strip() if suffix is not None else None,
+    }
+
+def iter_csv_records(path: str):
+    """(লাইন নম্বর, সারি) একটি একটি করে দেয়।"""
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+
+def iter_json_records(path: str, read_chars: int = 64 * 1024):
+    """JSON অ্যারের প্রতিটি অবজেক্ট (ক্রমিক নম্বরসহ) ফাইল পুরোটা না পড়েই দেয়।"""
+    parser = IncrementalJSONArrayParser()
+    number = 0
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        while piece := f.read(read_chars):
+            for record in parser.feed(piece):
+                number += 1
+                yield number, record
+    if parser.invalid_objects:
+        yield None, parser.invalid_objects # অবৈধ JSON অবজেক্টের সংখ্যা (রিপোর্টের জন্য)
+
+def iter_text_blocks(path: str, block_chars: int):
+    """টেক্সট ফাইলকে ~block_chars আকারের ব্লকে দেয়, সম্ভব হলে ফাঁকা লাইনে (প্রশ্নের সীমানায়) ভাগ করে।"""
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        lines: list[str] = []
+        size = 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= block_chars and (not line.strip() or size >= 2 * block_chars):
+                yield "".join(lines)
+                lines, size = [], 0
+        if lines:
+            yield "".join(lines)
+
+async def _read_batches(iterator):
+    """সিনক্রোনাস ফাইল রিডার থ্রেডে চালিয়ে DOCUMENT_READ_BATCH আকারের ব্যাচে দেয় (ইভেন্ট লুপ ব্লক না করে)।"""
+    while batch := await asyncio.to_thread(lambda: list(itertools.islice(iterator, DOCUMENT_READ_BATCH))):
+        yield batch
+
+async def handle_document(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    chat_id = update.message.chat_id
+    user = update.effective_user
+
+    file_name = document.file_name or ""
+    if not file_name.lower().endswith(DOCUMENT_EXTENSIONS):
+        await update.message.reply_text("⚠️ শুধু .txt, .csv বা .json ফাইল থেকে প্রশ্ন ইমপোর্ট করা যায়।")
+        return
+    if document.file_size and document.file_size > DOCUMENT_MAX_BYTES:
+        await update.message.reply_text(f"⚠️ ফাইলটি অনেক বড়। সর্বোচ্চ {DOCUMENT_MAX_BYTES // (1024 * 1024)} MB পর্যন্ত ফাইল পাঠানো যায়।")
+        return
+    if context.user_data.get('CONV_STATE', STATE_IDLE) == STATE_AWAITING_INTRO:
+        await update.message.reply_text("⚠️ আগের কুইজের সূচনা বার্তা পাঠান, অথবা /cancel দিয়ে বাতিল করে ফাইলটি আবার পাঠান।")
+        return
+    if 'document_upload' in context.user_data or 'extracting' in context.user_data:
+        await update.message.reply_text("⏳ আগের ফাইল বা টেক্সট এখনও প্রসেস হচ্ছে। শেষ হলে পাঠান, অথবা /cancel দিন।")
+        return
+    if not await get_target_channels(user.id):
+        await update.message.reply_text("⚠️ টার্গেট চ্যানেল সেট করা নেই। /setchannel ব্যবহার করুন।")
+        return
+
+    # টেক্সট বাফারের সাথে মিশে না যাওয়ার জন্য আগের বাফার বাতিল; প্রসেসিং জবে চলে, তাই অন্য আপডেট আটকে থাকে না
+    cancel_buffer_job(user.id)
+    context.user_data.pop('text_buffer', None)
+    context.user_data.pop('buffer_started', None)
+    upload_token = f"{document.file_unique_id}-{update.message.message_id}" # একই ফাইল আবার পাঠালেও আলাদা
+    context.user_data['document_upload'] = upload_token
+    context.job_queue.run_once(
+        process_document,
+        0,
+        data={'chat_id': chat_id, 'user_id': user.id, 'file_id': document.file_id,
+              'upload_token': upload_token, 'file_name': file_name, 'file_size': document.file_size},
+        chat_id=chat_id,
+        user_id=user.id,
+        name=f"document-{user.id}",
+    )
+
+async def process_document(context: ContextTypes.DEFAULT_TYPE):
+    """আপলোড করা ফাইল প্রসেস করে; মাল্টি-ওয়ার্কার মোডে ইউজারের লিজ অন্য ওয়ার্কারের হাতে থাকলে পরে আবার চেষ্টা করে।"""
+    user_id = context.job.data['user_id']
+    async with worker_lease(f"user:{user_id}") as acquired:
+        if acquired:
+            await _process_document(context)
+            return
+    print(f"ℹ️ user_id {user_id} এর আগের সাবমিশন অন্য ওয়ার্কারে প্রসেস হচ্ছে, {TEXT_BUFFER_DELAY} সেকেন্ড পরে ফাইলটি আবার চেষ্টা।")
+    context.job_queue.run_once(
+        process_document, TEXT_BUFFER_DELAY, data=context.job.data,
+        chat_id=context.job.chat_id, user_id=user_id, name=context.job.name,
+    )
+
+async def _process_document(context: ContextTypes.DEFAULT_TYPE):
+    job_data = context.job.data
+    chat_id = job_data['chat_id']
+    user_id = job_data['user_id']
+    file_name = job_data['file_name']
+    user_data = context.application.user_data.get(user_id)
+    if user_data is None or user_data.get('document_upload') != job_data['upload_token']:
+        return # এর মধ্যে /cancel দেওয়া হয়েছে
+
+    def cancelled() -> bool:
+        return user_data.get('document_upload') != job_data['upload_token']
+
+    size_kb = max(1, (job_data.get('file_size') or 0) // 1024)
+    status_message = await context.bot.send_message(chat_id=chat_id, text=f"📄 ফাইল '{file_name}' পেয়েছি ({size_kb} KB)। প্রসেস করছি... 🤖")
+    progress = ExtractionProgress(status_message, AI_PROGRESS_INTERVAL)
+    fd, path = tempfile.mkstemp(prefix="pollbot-", suffix=os.path.splitext(file_name)[1])
+    os.close(fd)
+    try:
+        try:
+            telegram_file = await context.bot.get_file(job_data['file_id'])
+            await telegram_file.download_to_drive(path)
+        except telegram.error.TelegramError as e:
+            print(f"❌ user_id {user_id}: ফাইল '{file_name}' ডাউনলোড করা যায়নি: {e}")
+            await context.bot.send_message(chat_id=chat_id, text="❌ ফাইলটি ডাউনলোড করা যায়নি। অনুগ্রহ করে আবার পাঠান।")
+            clear_user_state(user_data, user_id)
+            return
+
+        if file_name.lower().endswith(".txt"):
+            result = await _extract_document_text(context, path, user_id, progress, cancelled)
+        else:
+            records = iter_json_records(path) if file_name.lower().endswith(".json") else iter_csv_records(path)
+            result = await _import_document_records(records, progress, cancelled)
+        if result is None or cancelled():
+            print(f"ℹ️ user_id {user_id} এর ফাইল প্রসেসিং /cancel দিয়ে বাতিল করা হয়েছে।")
+            return
+        questions_data, details = result
+    except AIQueueFullError as e:
+        print(f"⚠️ {e}")
+        await context.bot.send_message(chat_id=chat_id, text="⏳ এই মুহূর্তে অনেক অনুরোধ প্রসেস হচ্ছে। অনুগ্রহ করে কিছুক্ষণ পর ফাইলটি আবার পাঠান।")
+        clear_user_state(user_data, user_id)
+        return
+    finally:
+        with contextlib.suppress(OSError):
+            os.unlink(path)
+        if not cancelled(): # অপ্রত্যাশিত এররেও ইউজার যেন আটকে না থাকেন
+            del user_data['document_upload']
+
+    print(f"ℹ️ user_id {user_id}: ফাইল '{file_name}' থেকে {len(questions_data)} টি প্রশ্ন।")
+    if not questions_data:
+        await context.bot.send_message(chat_id=chat_id, text="❌ ফাইল থেকে কোনো প্রশ্ন পাওয়া যায়নি।\n" + details)
+        clear_user_state(user_data, user_id)
+        return
+    await offer_questions(context, chat_id, user_id, user_data, questions_data, details)
+
+async def _import_document_records(records, progress: ExtractionProgress, cancelled) -> tuple[list, str] | None:
+    """CSV/JSON রেকর্ড থেকে সরাসরি প্রশ্ন (AI ছাড়া); বাতিল হলে None।"""
+    questions: list = []
+    invalid: list[tuple] = []
+    broken_objects = 0
+    async for batch in _read_batches(records):
+        if cancelled():
+            return None
+        for number, record in batch:
+            if number is None:
+                broken_objects = record
+                continue
+            try:
+                questions.append(document_record_to_question(record))
+            except ValueError as e:
+                invalid.append((number, str(e)))
+        progress.add(len(batch))
+    QUESTIONS_EXTRACTED.inc(len(questions), source="document")
+    details = f"(ফাইল থেকে সরাসরি: {len(questions)} টি, AI: 0 টি)\n"
+    if broken_objects:
+        details += f"⚠️ {broken_objects} টি JSON অবজেক্ট পড়া যায়নি।\n"
+    if invalid:
+        details += f"⚠️ {len(invalid)} টি সারি বাদ দেওয়া হয়েছে:\n"
+        for number, reason in invalid[:10]:
+            details += f"  - সারি {number}: {reason}\n"
+        if len(invalid) > 10:
+            details += f"  - ...এবং আরও {len(invalid) - 10} টি\n"
+    return questions, details
+
+async def _extract_document_text(context: ContextTypes.DEFAULT_TYPE, path: str, user_id: int,
+                                 progress: ExtractionProgress, cancelled) -> tuple[list, str] | None:
+    """টেক্সট ফাইল ব্লকে ব্লকে লোকাল পার্সার ও AI দিয়ে প্রসেস করে; বাতিল হলে None।"""
+    bot_data = context.application.bot_data
+    ai_model = await get_ai_model(bot_data)
+    ai_pool: AIWorkerPool | None = bot_data.get('ai_pool')
+    questions: list = []
+    totals = {"local": 0, "ai": 0, "failed_chunks": 0, "partial_chunks": 0, "too_large": 0}
+    async for blocks in _read_batches(iter_text_blocks(path, DOCUMENT_BLOCK_CHARS)):
+        for block in blocks:
+            if cancelled():
+                return None
+            try:
+                block_questions, stats = await extract_questions(
+                    block, ai_model, ai_pool, user_id, bot_data.get('ai_cache'), progress.add, bot_data.get('ai_batcher')
+                )
+            except AIRequestCancelled:
+                return None
+            except AIInputTooLargeError as e:
+                print(f"⚠️ {e}")
+                totals["too_large"] += 1
+                continue
+            for key in ("local", "ai", "failed_chunks", "partial_chunks"):
+                totals[key] += stats[key]
+            questions.extend(block_questions or [])
+    QUESTIONS_EXTRACTED.inc(totals["local"], source="local")
+    QUESTIONS_EXTRACTED.inc(totals["ai"], source="ai")
+    details = f"(লোকাল পার্সার: {totals['local']} টি, AI: {totals['ai']} টি)\n"
+    if totals["failed_chunks"] or totals["too_large"]:
+        details += f"⚠️ ফাইলের {totals['failed_chunks'] + totals['too_large']} টি অংশ প্রসেস করা যায়নি, সেগুলোর প্রশ্ন বাদ পড়েছে।\n"
+    if totals["partial_chunks"]:
+        details += f"⚠️ {totals['partial_chunks']} টি অংশের AI রেসপন্স মাঝপথে ভেঙে গেছে; যতটুকু পাওয়া গেছে রাখা হয়েছে।\n"
+    return questions, details
+
+
+# --- নতুন: asyncio-ভিত্তিক ছোট HTTP সার্ভার (হেলথ চেক + ওয়েবহুক, আলাদা থ্রেড ছাড়া) ---
+# UptimeRobot-এর হেলথ চেক এবং টেলিগ্রামের ওয়েবহুক আপডেট একই ইভেন্ট লুপে সার্ভ হয়।
+class HTTPRequest:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: str, headers: dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers # কী-গুলো ছোট হাতের অক্ষরে
+        self.body = body
+
+class BotHTTPServer:
+    """
+    শুধু এই বটের দরকারি অংশটুকু: HTTP/1.1, Content-Length বডি, keep-alive।
+    প্রতিটি রুট একটি async হ্যান্ডলার যা (status, content_type, body) ফেরত দেয়।
+    """
+
+    MAX_HEADER_BYTES = 16 * 1024
+    REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+    def __init__(self, max_body_bytes: int = 1024 * 1024):
+        self.max_body_bytes = max_body_bytes
+        self._routes: dict[tuple[str, str], object] = {}
+        self._server: asyncio.base_events.Server | None = None
+
+    def add_route(self, method: str, path: str, handler):
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"✅ HTTP সার্ভার চালু হয়েছে ({host}:{port})।")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return # ক্লায়েন্ট কানেকশন বন্ধ করেছে
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 413, "text/plain", b"headers too large", keep_alive=False)
+                    return
+                if len(head) > self.MAX_HEADER_BYTES:
+                    await self._respond(writer, 413, "text/plain", b"headers too large", keep_alive=False)
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, "text/plain", b"bad request line", keep_alive=False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                if headers.get("transfer-encoding"):
+                    await self._respond(writer, 411, "text/plain", b"chunked bodies are not supported", keep_alive=False)
+                    return
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > self.max_body_bytes:
+                    await self._respond(writer, 413, "text/plain", b"body too large", keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                path, _, query = target.partition("?")
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                status, content_type, payload = await self._dispatch(HTTPRequest(method.upper(), path, query, headers, body))
+                await self._respond(writer, status, content_type, payload, keep_alive, head_only=method.upper() == "HEAD")
+                if not keep_alive:
+                    return
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            print(f"⚠️ HTTP কানেকশনে সমস্যা: {e}")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: HTTPRequest) -> tuple[int, str, bytes]:
+        method = "GET" if request.method == "HEAD" else request.method
+        handler = self._routes.get((method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return 405, "text/plain", b"method not allowed"
+            return 404, "text/plain", b"not found"
+        try:
+            return await handler(request)
+        except Exception as e:
+            print(f"❌ HTTP হ্যান্ডলারে সমস্যা ({request.method} {request.path}): {e}")
+            traceback.print_exc()
+            return 500, "text/plain", b"internal error"
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes,
+                       keep_alive: bool, head_only: bool = False):
+        head = (
+            f"HTTP/1.1 {status} {self.REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + (b"" if head_only else body))
+        await writer.drain()
+
+def build_http_server(application: Application) -> BotHTTPServer:
+    """হেলথ চেক এবং (ওয়েবহুক মোডে) টেলিগ্রাম আপডেটের রুটসহ HTTP সার্ভার তৈরি করে।"""
+    server = BotHTTPServer()
+
+    async def home(request: HTTPRequest):
+        """এটি UptimeRobot-কে দেখাবে যে বটটি সচল আছে।"""
+        if BOT_MODE == "webhook":
+            return 200, "text/plain; charset=utf-8", b"I am alive (webhook mode)!"
+        return 200, "text/plain; charset=utf-8", b"I am alive and polling!"
+
+    server.add_route("GET", "/", home)
+
+    async def metrics(request: HTTPRequest):
+        return 200, "text/plain; version=0.0.4; charset=utf-8", METRICS.render().encode("utf-8")
+
+    server.add_route("GET", "/metrics", metrics)
+
+    if MULTI_WORKER:
+        async def internal_update(request: HTTPRequest):
+            # অন্য ওয়ার্কার থেকে ফরোয়ার্ড করা আপডেট; ওয়েবহুকের মতোই কিউতে যায়, যাতে আপডেট প্রসেসরের
+            # কনকারেন্সি সীমা মানা হয় (এই ওয়ার্কারই মালিক, তাই আবার ফরোয়ার্ড হয় না)
+            received = request.headers.get("x-worker-secret", "")
+            if not WORKER_SECRET or not hmac.compare_digest(received, WORKER_SECRET):
+                return 403, "text/plain", b"forbidden"
+            try:
+                update = telegram.Update.de_json(json.loads(request.body), application.bot)
+            except Exception as e:
+                print(f"⚠️ অবৈধ ফরোয়ার্ড করা আপডেট: {e}")
+                return 400, "text/plain", b"bad update"
+            await application.update_queue.put(update)
+            return 200, "text/plain", b"ok"
+
+        server.add_route("POST", INTERNAL_UPDATE_PATH, internal_update)
+    # সক্রিয় বাফার ও অপেক্ষমাণ কুইজের সংখ্যা প্রতিটি স্ক্র্যাপের সময় user_data থেকে গোনা হয়
+    ACTIVE_BUFFERS.set_function(lambda: sum(1 for data in application.user_data.values() if data.get('text_buffer')))
+    PENDING_QUIZZES.set_function(lambda: sum(
+        1 for data in application.user_data.values() if data.get('CONV_STATE') == STATE_AWAITING_INTRO
+    ))
+
+    if BOT_MODE == "webhook":
+        async def telegram_webhook(request: HTTPRequest):
+            # টেলিগ্রাম setWebhook-এ দেওয়া secret_token প্রতিটি রিকোয়েস্টের হেডারে পাঠায়
+            if WEBHOOK_SECRET:
+                received = request.headers.get("x-telegram-bot-api-secret-token", "")
+                if not hmac.compare_digest(received, WEBHOOK_SECRET):
+                    return 403, "text/plain", b"forbidden"
+            try:
+                data = json.loads(request.body)
+                update = telegram.Update.de_json(data, application.bot)
+            except Exception as e:
+                print(f"⚠️ অবৈধ ওয়েবহুক আপডেট: {e}")
+                return 400, "text/plain", b"bad update"
+            await application.update_queue.put(update)
+            return 200, "text/plain", b"ok"
+
+        server.add_route("POST", WEBHOOK_PATH, telegram_webhook)
+    return server
+
+# --- বট চালু হওয়ার পরে (পোলিং শুরুর আগে) এই ফাংশনটি রান হয় ---
+async def on_startup(application: Application):
+    """HTTP সার্ভার চালু করে এবং রিস্টার্টের আগে অসমাপ্ত থাকা পোস্টিং জবগুলো আবার শুরু করে।"""
+    if "run_polling" in STARTUP.marks: # run_polling() থেকে এখানে আসা পর্যন্ত: Application.initialize() (getMe সহ)
+        STARTUP.record("telegram_init", STARTUP.marks["run_polling"], time.perf_counter())
+    # Render স্বয়ংক্রিয়ভাবে PORT এনভায়রনমেন্ট ভেরিয়েবল সেট করে।
+    port = int(os.environ.get('PORT', 5000))
+    http_server = build_http_server(application)
+    with STARTUP.phase("http_server"):
+        await http_server.start('0.0.0.0', port)
+    application.bot_data['http_server'] = http_server
+    if FAST_STARTUP:
+        # ডাটাবেস তখনও ইনিশিয়ালাইজ হতে পারে; জবগুলো অ্যাপ্লিকেশন চালু হওয়ার পরে আলাদাভাবে আবার শুরু হয়,
+        # পোলিং এর জন্য অপেক্ষা করে না
+        application.job_queue.run_once(resume_posting_jobs_job, 0, name="resume-posting-jobs")
+    else:
+        await resume_posting_jobs(application)
+    application.job_queue.run_repeating(sweep_idle_sessions, SESSION_SWEEP_INTERVAL, first=SESSION_SWEEP_INTERVAL, name="session-sweeper")
+    print(f"✅ বট আপডেট নেওয়ার জন্য প্রস্তুত (প্রসেস শুরুর {STARTUP.mark('ready'):.2f}s পরে)।")
+
+# --- বট বন্ধ হওয়ার সময় এই ফাংশনটি রান হয় ---
+async def on_shutdown(application: Application):
+    http_server: BotHTTPServer | None = application.bot_data.get('http_server')
+    if http_server:
+        await http_server.stop()
+
+# --- ওয়েবহুক মোড: পোলিং ছাড়া, একই HTTP সার্ভারে টেলিগ্রামের আপডেট গ্রহণ ---
+# (মাল্টি-ওয়ার্কার পোলিং মোডে ০ ছাড়া বাকি ওয়ার্কাররাও এভাবে চলে এবং শুধু ফরোয়ার্ড করা আপডেট পায়)
+async def run_webhook(application: Application):
+    """অ্যাপ্লিকেশন চালু করে, (ওয়েবহুক মোডে) টেলিগ্রামে ওয়েবহুক সেট করে এবং SIGINT/SIGTERM পর্যন্ত চলতে থাকে।"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError: # উইন্ডোজে সিগন্যাল হ্যান্ডলার নেই
+            pass
+
+    with STARTUP.phase("telegram_init"):
+        await application.initialize()
+    try:
+        await on_startup(application)
+        await application.start()
+        if BOT_MODE == "webhook" and WORKER_INDEX == 0: # একাধিক ওয়ার্কার থাকলে একবারই সেট করা হয়
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=telegram.Update.ALL_TYPES,
+            )
+            print(f"✅ ওয়েবহুক সেট করা হয়েছে: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        await stop_event.wait()
+    finally:
+        if application.running:
+            await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
+
+
 # ---!!! বট চালু করার মেইন ফাংশন (Race Condition ফিক্সড) !!!---
 def main():
+    STARTUP.record("imports", STARTUP_T0, time.perf_counter())
     print("⏳ বট চালু হচ্ছে...")
 
     # --- ভেরিয়েবলগুলো এখন main() এর ভেতরে লোড হচ্ছে ---
@@ -505,53 +4227,101 @@ def main():
 
     # --- ভেরিয়েবল চেক ---
     if not TELEGRAM_BOT_TOKEN or not GEMINI_API_KEY or not DATABASE_URL:
-        print("---❌ ERROR: টোকেন বা এপিআই কী সেট করা হয়নি !!!---")
+        print("---❌ ERROR: টোকেন বা এপিআই কী সেট করা হয়নি !!!---")
         print("Render-এর 'Environment' ট্যাবে ভেরিয়েবলগুলো সঠিকভাবে সেট করা আছে কিনা চেক করুন।")
         return # বট বন্ধ করে দাও
 
     print("✅ টোকেন এবং কী সফলভাবে লোড হয়েছে।")
 
-    # --- জেমিনি এআই এখন এখানে কনফিগার হচ্ছে ---
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        generation_config = genai.GenerationConfig(response_mime_type="application/json")
-        ai_model = genai.GenerativeModel('gemini-flash-latest', generation_config=generation_config)
-        print("✅ Gemini AI সফলভাবে কনফিগার করা হয়েছে (JSON মোডে)।")
-    except Exception as e:
-        print(f"❌ Gemini AI কনফিগারেশনে সমস্যা: {e}")
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        print("---❌ ERROR: BOT_MODE=webhook কিন্তু WEBHOOK_URL সেট করা হয়নি !!!---")
         return
+    if MULTI_WORKER and (not WORKER_SECRET or not 0 <= WORKER_INDEX < WORKER_COUNT):
+        print("---❌ ERROR: মাল্টি-ওয়ার্কার মোডে WORKER_SECRET এবং সঠিক WORKER_INDEX সেট করতে হবে !!!---")
+        return
+
+    app_build_started = time.perf_counter()
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    if MULTI_WORKER:
+        print(f"ℹ️ মাল্টি-ওয়ার্কার মোড: ওয়ার্কার {WORKER_INDEX}/{WORKER_COUNT}")
+        builder = builder.concurrent_updates(
+            ShardedUpdateProcessor(max(1, UPDATE_CONCURRENCY), UpdateRouter(WORKER_URLS, WORKER_SECRET))
+        )
+    else:
+        builder = builder.concurrent_updates(UPDATE_CONCURRENCY if UPDATE_CONCURRENCY > 1 else False)
+    # টেলিগ্রাম থেকে getUpdates শুধু একটি প্রসেস করতে পারে, তাই পোলিং মোডে শুধু ওয়ার্কার ০ পোল করে
+    use_polling = BOT_MODE != "webhook" and WORKER_INDEX == 0
+    if use_polling:
+        builder = builder.post_init(on_startup).post_shutdown(on_shutdown)
+    else:
+        builder = builder.updater(None) # আপডেট আসে আমাদের HTTP সার্ভারে, getUpdates লাগে না
+    # ইউজারের স্টেট (অপেক্ষমাণ কুইজ সহ) ডাটাবেসে থাকে, তাই রিডিপ্লয়ের পরেও হারায় না
+    builder = builder.persistence(PostgresPersistence(PERSISTENCE_UPDATE_INTERVAL))
+    application = builder.build()
+    STARTUP.record("app_build", app_build_started, time.perf_counter())
+
+    # --- ai_model (বা চলমান ওয়ার্ম-আপ) কে অ্যাপ্লিকেশন কনটেক্সটে সেভ করা ---
+    # যাতে process_buffered_text ফাংশনটি get_ai_model() দিয়ে এটি ব্যবহার করতে পারে
+    if FAST_STARTUP:
+        # --- ডাটাবেস স্কিমা চেক ও জেমিনি ওয়ার্ম-আপ আলাদা থ্রেডে একসাথে চলে, এর মধ্যেই পোলিং শুরু হয় ---
+        # স্কিমা শেষ না হওয়া পর্যন্ত ডাটাবেস কোয়েরি এবং ওয়ার্ম-আপ শেষ না হওয়া পর্যন্ত AI কল অপেক্ষা করে
+        _db_schema_ready.clear()
+        startup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup")
+        startup_executor.submit(init_db)
+        application.bot_data['ai_warmup'] = startup_executor.submit(warm_up_ai, application.bot_data, GEMINI_API_KEY)
+        startup_executor.shutdown(wait=False)
+        print("⏳ ডাটাবেস ও Gemini AI ব্যাকগ্রাউন্ডে প্রস্তুত হচ্ছে...")
+    else:
+        # --- জেমিনি এআই এখন এখানে কনফিগার হচ্ছে ---
+        try:
+            with STARTUP.phase("ai_warmup"):
+                application.bot_data['ai_model'] = build_ai_model(GEMINI_API_KEY)
+        except Exception as e:
+            print(f"❌ Gemini AI কনফিগারেশনে সমস্যা: {e}")
+            return
 
-    # --- ডাটাবেস চালু করা ---
-    init_db()
+        # --- ডাটাবেস চালু করা ---
+        init_db()
 
-    application = (
-        Application.builder()
-        .token(TELEGRAM_BOT_TOKEN)
-        .build()
+    ai_pool = AIWorkerPool(AI_MAX_CONCURRENCY, AI_MAX_QUEUE, AI_REQUEST_TIMEOUT)
+    application.bot_data['ai_pool'] = ai_pool
+    application.bot_data['ai_cache'] = AIResultCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+    if AI_BATCH_WINDOW > 0:
+        application.bot_data['ai_batcher'] = AIBatcher(AI_BATCH_WINDOW, AI_BATCH_MAX_CHARS, AI_BATCH_MAX_ITEMS)
+    application.bot_data['poll_dispatcher'] = PollDispatcher(
+        DISPATCH_CHAT_RATE, DISPATCH_CHAT_BURST, DISPATCH_GLOBAL_RATE, DISPATCH_GLOBAL_BURST, DISPATCH_MAX_RETRIES
     )
 
-    # --- ai_model কে অ্যাপ্লিকেশন কনটেক্সটে সেভ করা ---
-    # যাতে process_buffered_text ফাংশনটি এটি ব্যবহার করতে পারে
-    application.bot_data['ai_model'] = ai_model
-
     # --- হ্যান্ডলার সেকশন ---
+    application.add_handler(TypeHandler(telegram.Update, track_user_activity), group=-1)
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("setchannel", set_channel))
+    application.add_handler(CommandHandler("addchannel", add_channel))
+    application.add_handler(CommandHandler("removechannel", remove_channel))
+    application.add_handler(CommandHandler("channels", list_channels))
     application.add_handler(CommandHandler("cancel", cancel_quiz))
     application.add_handler(CommandHandler("help", help_command)) # <-- /help কমান্ড
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("library", library_command))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("repost", repost_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     # ------------------------------------
 
-    print("⏳ টেলিগ্রাম বট পোলিং শুরু করছে...")
-
-    # Flask সার্ভার চালু করা (বটকে জাগিয়ে রাখার জন্য)
-    web_thread = threading.Thread(target=run_web_server)
-    web_thread.daemon = True
-    web_thread.start()
-    print("✅ ওয়েব সার্ভার চালু হয়েছে (বটকে জাগিয়ে রাখার জন্য)।")
-
-    application.run_polling()
-    print("ℹ️ বট পোলিং বন্ধ হয়েছে।") # যদি কোনো কারণে run_polling() শেষ হয়ে যায়
+    if not use_polling:
+        print("⏳ টেলিগ্রাম বট ওয়েবহুক মোডে চালু হচ্ছে...")
+        asyncio.run(run_webhook(application))
+        print("ℹ️ বট ওয়েবহুক সার্ভার বন্ধ হয়েছে।")
+    else:
+        # HTTP সার্ভার (বটকে জাগিয়ে রাখার জন্য) on_startup-এ একই ইভেন্ট লুপে চালু হয়
+        print("⏳ টেলিগ্রাম বট পোলিং শুরু করছে...")
+        STARTUP.mark("run_polling")
+        application.run_polling()
+        print("ℹ️ বট পোলিং বন্ধ হয়েছে।") # যদি কোনো কারণে run_polling() শেষ হয়ে যায়
+    ai_pool.shutdown()
+    close_db_pool() # পুলের কানেকশনগুলো বন্ধ করা
 
 if __name__ == "__main__":
     main()
\ No newline at end of file